@@ -1,41 +1,86 @@
 # carbon_app/admin.py
-from django.contrib import admin
+from django.contrib import admin, messages
 from .models import ActivityCategory, EmissionFactor, UserActivity
-from .models import Recommendation, UserRecommendation
+from .models import Recommendation, UserRecommendation, CommunitySnapshot, UserProfile, ReportJob
+from .admin_scaling import AutocompleteFilter, ScalableAdminMixin
+from .recalculation import factor_keys, start_background_recalculation
 
 
 @admin.register(ActivityCategory)
-class ActivityCategoryAdmin(admin.ModelAdmin):
+class ActivityCategoryAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ['name', 'description', 'icon']
     search_fields = ['name', 'description']
     list_filter = ['name']
 
 @admin.register(EmissionFactor)
-class EmissionFactorAdmin(admin.ModelAdmin):
+class EmissionFactorAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ['activity_type', 'category', 'co2_per_unit', 'unit', 'region']
+    list_select_related = ['category']
     list_filter = ['category', 'region']
     search_fields = ['activity_type', 'category__name']
     ordering = ['category', 'activity_type']
+    actions = ['recalculate_activities']
+
+    @admin.action(description='Пересчитать CO₂ активностей по выбранным коэффициентам')
+    def recalculate_activities(self, request, queryset):
+        keys = factor_keys(queryset)
+        if start_background_recalculation(keys):
+            self.message_user(
+                request,
+                f'Пересчет запущен в фоне ({len(keys)} типов активности). '
+                f'Прогресс: python manage.py recalculate_co2 --status',
+                messages.SUCCESS,
+            )
+        else:
+            self.message_user(request, 'Пересчет уже выполняется, попробуйте позже', messages.WARNING)
+
+@admin.register(UserProfile)
+class UserProfileAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ['user', 'region']
+    list_select_related = ['user']
+    autocomplete_fields = ['user']
+    list_filter = ['region']
+    search_fields = ['user__username', 'region']
 
 @admin.register(UserActivity)
-class UserActivityAdmin(admin.ModelAdmin):
+class UserActivityAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ['user', 'category', 'activity_type', 'quantity', 'unit', 'date', 'calculated_co2']
-    list_filter = ['category', 'date', 'user']
+    list_select_related = ['user', 'category']
+    list_filter = ['category', 'date', ('user', AutocompleteFilter)]
+    autocomplete_fields = ['user']
     search_fields = ['user__username', 'activity_type', 'notes']
     date_hierarchy = 'date'
     ordering = ['-date']
 
 @admin.register(Recommendation)
-class RecommendationAdmin(admin.ModelAdmin):
+class RecommendationAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ['title', 'category', 'co2_saving', 'difficulty', 'is_active']
     list_filter = ['category', 'difficulty', 'is_active']
     search_fields = ['title', 'description']
     ordering = ['-co2_saving']
 
 @admin.register(UserRecommendation)
-class UserRecommendationAdmin(admin.ModelAdmin):
+class UserRecommendationAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ['user', 'recommendation', 'is_viewed', 'is_applied', 'created_at']
-    list_filter = ['is_viewed', 'is_applied', 'created_at', 'user']
+    list_select_related = ['user', 'recommendation']
+    list_filter = ['is_viewed', 'is_applied', 'created_at', ('user', AutocompleteFilter)]
+    autocomplete_fields = ['user', 'recommendation']
     search_fields = ['user__username', 'recommendation__title']
     date_hierarchy = 'created_at'
     ordering = ['-created_at']
+
+@admin.register(CommunitySnapshot)
+class CommunitySnapshotAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ['created_at', 'users_count']
+    readonly_fields = ['created_at', 'users_count', 'data']
+    ordering = ['-created_at']
+
+@admin.register(ReportJob)
+class ReportJobAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ['id', 'user', 'kind', 'status', 'progress', 'rows', 'worker', 'attempts', 'created_at', 'finished_at']
+    list_select_related = ['user']
+    list_filter = ['status', 'kind', ('user', AutocompleteFilter)]
+    readonly_fields = ['progress', 'rows', 'file_name', 'worker', 'attempts', 'started_at', 'heartbeat_at', 'finished_at', 'error']
+    autocomplete_fields = ['user']
+    date_hierarchy = 'created_at'
+    ordering = ['-created_at']
@@ -0,0 +1,137 @@
+from datetime import date, timedelta
+
+from django import forms
+from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.db.models import DateTimeField, Max, Min
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from .pagination import EstimatedCountPaginator
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """Фильтр по внешнему ключу с полем автодополнения вместо списка.
+
+    RelatedFieldListFilter выводит в боковую панель все объекты связанной
+    модели (для пользователя — все учетные записи). Здесь выбранное значение
+    ищется через стандартный autocomplete-эндпоинт админки, поэтому у
+    связанной модели в админке должны быть search_fields. Параметр в URL тот
+    же, что у RelatedFieldListFilter (user__id__exact).
+    """
+
+    template = 'admin/carbon_app/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        self.lookup_val = params.get(self.lookup_kwarg)
+        self.admin_site = model_admin.admin_site
+        super().__init__(field, request, params, model, model_admin, field_path)
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def widget(self, changelist):
+        form_field = forms.ModelChoiceField(
+            queryset=self.field.remote_field.model._default_manager.all(),
+            widget=AutocompleteSelect(self.field, self.admin_site, attrs={
+                'style': 'width: 100%',
+                'data-lookup': self.lookup_kwarg,
+                'data-query': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            }),
+            required=False,
+        )
+        # Для выбранного значения читается одна строка связанной модели
+        return form_field.widget.render(self.lookup_kwarg, self.lookup_val)
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'display': _('All'),
+            'widget': self.widget(changelist),
+        }
+
+
+def date_range(first, last, kind):
+    """Все годы, месяцы или дни между first и last включительно"""
+    if kind == 'year':
+        return [date(year, 1, 1) for year in range(first.year, last.year + 1)]
+    if kind == 'month':
+        return [
+            date(index // 12, index % 12 + 1, 1)
+            for index in range(first.year * 12 + first.month - 1, last.year * 12 + last.month)
+        ]
+    return [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+
+
+class DateRangeQuerySet:
+    """Обертка над queryset changelist для тега date_hierarchy.
+
+    Стандартный тег получает список годов/месяцев/дней через
+    QuerySet.dates(), то есть SELECT DISTINCT по всем подходящим строкам.
+    Здесь читаются только MIN и MAX (по индексу это два поиска), а
+    периоды между ними перечисляются без запроса. Поэтому в списке могут
+    оказаться периоды без строк — переход по ним покажет пустую страницу.
+    """
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+        self.aggregates = {}
+
+    def aggregate(self, **kwargs):
+        # Тег сам запрашивает MIN/MAX для выбора начального уровня — второй раз не читаем
+        key = tuple(sorted(kwargs.items()))
+        if key not in self.aggregates:
+            self.aggregates[key] = self.queryset.aggregate(**kwargs)
+        return self.aggregates[key]
+
+    def dates(self, field_name, kind, order='ASC'):
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+        first, last = bounds['first'], bounds['last']
+        if isinstance(self.queryset.model._meta.get_field(field_name), DateTimeField):
+            first, last = (
+                (timezone.localtime(value) if timezone.is_aware(value) else value).date()
+                for value in (first, last)
+            )
+        values = date_range(first, last, kind)
+        return values if order == 'ASC' else values[::-1]
+
+    def datetimes(self, field_name, kind, order='ASC', **kwargs):
+        return self.dates(field_name, kind, order)
+
+
+class DateRangeChangeList:
+    """ChangeList, у которого queryset подменен на DateRangeQuerySet"""
+
+    def __init__(self, changelist):
+        self.changelist = changelist
+        self.queryset = DateRangeQuerySet(changelist.queryset)
+
+    def __getattr__(self, name):
+        return getattr(self.changelist, name)
+
+
+class ScalableAdminMixin:
+    """Настройки changelist для таблиц на миллионы строк.
+
+    - число строк оценивается EstimatedCountPaginator, полный COUNT(*) не
+      выполняется (show_full_result_count = False);
+    - date_hierarchy строится по MIN/MAX (DateRangeQuerySet);
+    - для фильтров по пользователю — AutocompleteFilter.
+
+    list_select_related и autocomplete_fields задаются в самих ModelAdmin.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = 'admin/carbon_app/scalable_change_list.html'
+
+    @property
+    def media(self):
+        media = super().media
+        if any(isinstance(item, tuple) and issubclass(item[1], AutocompleteFilter) for item in self.list_filter):
+            media += AutocompleteSelect(None, self.admin_site).media
+        return media
@@ -0,0 +1,225 @@
+import asyncio
+from datetime import timedelta
+
+import pandas as pd
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import ActivityCategory, DailyEmission, MonthlyEmission, UserActivity, WeeklyEmission
+from .rollups import month_start, week_start
+
+
+def chart_color(percentage):
+    """Цвет сегмента диаграммы в зависимости от доли категории"""
+    if percentage < 30:
+        return '#28a745'
+    if percentage < 60:
+        return '#ffc107'
+    return '#dc3545'
+
+
+async def alist(queryset):
+    return [item async for item in queryset]
+
+
+class FootprintAnalytics:
+    """Аналитика углеродного следа пользователя.
+
+    Итоги и статистика по категориям читаются из месячной сводной таблицы,
+    ряд за последние дни — из дневной (см. rollups.py). Оба запроса
+    затрагивают десятки предагрегированных строк, поэтому их стоимость
+    не зависит ни от количества категорий, ни от длины истории.
+    """
+
+    def __init__(self, user, today=None, days=7, recent_limit=10, load=True):
+        self.user = user
+        self.today = today or timezone.localdate()
+        self.days = days
+        self.recent_limit = recent_limit
+        self.period = [self.today - timedelta(days=i) for i in range(days - 1, -1, -1)]
+        if load:
+            self._load()
+
+    def grouped_queryset(self):
+        """Итоги по категориям: строка на категорию"""
+        return (
+            MonthlyEmission.objects.filter(user=self.user)
+            .values('category_id', 'category__name', 'category__icon')
+            .annotate(total=Sum('co2_total'), count=Sum('activity_count'))
+            .filter(count__gt=0)
+            .order_by('category__name')
+        )
+
+    def daily_queryset(self):
+        """Суммы по дням за последние self.days дней"""
+        return (
+            DailyEmission.objects.filter(user=self.user, period_start__gte=self.period[0], period_start__lte=self.today)
+            .values('period_start')
+            .annotate(total=Sum('co2_total'))
+            .order_by()
+        )
+
+    def recent_queryset(self):
+        return (
+            UserActivity.objects.filter(user=self.user)
+            .only('id', 'date', 'activity_type', 'quantity', 'unit', 'calculated_co2')
+            .order_by('-date', '-id')[:self.recent_limit]
+        )
+
+    def _load(self):
+        self._apply(self.grouped_queryset(), self.daily_queryset())
+
+    async def aload(self):
+        """Асинхронная загрузка (для FootprintAnalytics(..., load=False)).
+
+        Три независимых запроса запускаются через asyncio.gather. В Django 4.2
+        асинхронный ORM выполняет их в потоке запроса по очереди, но цикл
+        событий при этом свободен и обслуживает других клиентов.
+        """
+        grouped, daily, recent = await asyncio.gather(
+            alist(self.grouped_queryset()),
+            alist(self.daily_queryset()),
+            alist(self.recent_queryset()),
+        )
+        self._apply(grouped, daily)
+        self.__dict__['recent_activities'] = recent
+        return self
+
+    def _apply(self, grouped_rows, daily_rows):
+        self.total_co2 = 0
+        self.activity_count = 0
+        self.categories = []
+
+        for row in grouped_rows:
+            self.total_co2 += row['total'] or 0
+            self.activity_count += row['count']
+            self.categories.append({
+                'category': ActivityCategory(
+                    id=row['category_id'],
+                    name=row['category__name'],
+                    icon=row['category__icon'],
+                ),
+                'total_co2': row['total'] or 0,
+                'count': row['count'],
+            })
+
+        by_day = {row['period_start']: row['total'] or 0 for row in daily_rows}
+        self.daily_totals = [by_day.get(day, 0) for day in self.period]
+
+    @property
+    def avg_co2(self):
+        """Средний выброс на одну активность"""
+        if not self.activity_count:
+            return 0
+        return self.total_co2 / self.activity_count
+
+    @property
+    def category_stats(self):
+        stats = []
+        for item in self.categories:
+            percentage = (item['total_co2'] / self.total_co2 * 100) if self.total_co2 > 0 else 0
+            stats.append({
+                'category': item['category'],
+                'total_co2': round(item['total_co2'], 2),
+                'count': item['count'],
+                'percentage': round(percentage, 1),
+            })
+        return stats
+
+    @property
+    def chart_data(self):
+        return [
+            {
+                'category': item['category'].name,
+                'value': item['total_co2'],
+                'color': chart_color(item['percentage']),
+            }
+            for item in self.category_stats
+        ]
+
+    @property
+    def weekly_data(self):
+        return [
+            {
+                'day': day.strftime('%a'),
+                'date': day.strftime('%d.%m'),
+                'co2': round(total, 2),
+            }
+            for day, total in zip(self.period, self.daily_totals)
+        ]
+
+    @cached_property
+    def recent_activities(self):
+        """Последние активности — отдельный запрос только по нужным колонкам"""
+        return list(self.recent_queryset())
+
+
+# Период → частота pandas, глубина по умолчанию (в периодах) и сводная таблица
+PERIODS = {
+    'week': ('W', 12),
+    'month': ('M', 12),
+    'year': ('Y', 5),
+}
+
+
+def rollup_source(period):
+    """Сводная таблица и выравнивание начала диапазона для периода"""
+    if period == 'week':
+        return WeeklyEmission, week_start
+    if period == 'year':
+        # Годы собираются из месяцев: нужны все месяцы года, в который попал start
+        return MonthlyEmission, lambda day: day.replace(month=1, day=1)
+    return MonthlyEmission, month_start
+
+
+def default_start(period, end):
+    """Начало диапазона по умолчанию: последние N недель/месяцев/лет"""
+    freq, count = PERIODS[period]
+    first = pd.Period(end, freq=freq) - (count - 1)
+    return first.start_time.date()
+
+
+def period_series(user, period='month', start=None, end=None):
+    """Выбросы пользователя по периодам и категориям.
+
+    Данные читаются одним запросом values_list из недельной или месячной
+    сводной таблицы (годы собираются из месяцев), а группировка по
+    периодам выполняется в pandas. Период учитывается целиком, если
+    пересекается с диапазоном. Возвращает компактную структуру: подписи
+    периодов, ряд по каждой категории и итоговый ряд; пустые периоды
+    заполняются нулями.
+    """
+    if period not in PERIODS:
+        raise ValueError(f'Неизвестный период: {period}')
+    freq, _ = PERIODS[period]
+    end = end or timezone.localdate()
+    start = start or default_start(period, end)
+    if start > end:
+        raise ValueError('Начало периода позже конца')
+
+    model, align = rollup_source(period)
+    rows = model.objects.filter(
+        user=user, period_start__gte=align(start), period_start__lte=end, activity_count__gt=0
+    ).values_list('period_start', 'category__name', 'co2_total')
+    frame = pd.DataFrame.from_records(list(rows), columns=['date', 'category', 'co2'])
+    index = pd.period_range(start=start, end=end, freq=freq)
+
+    if frame.empty:
+        table = pd.DataFrame(index=index)
+    else:
+        frame['period'] = pd.to_datetime(frame['date']).dt.to_period(freq)
+        table = (
+            frame.pivot_table(index='period', columns='category', values='co2', aggfunc='sum')
+            .reindex(index)
+            .fillna(0)
+        )
+
+    return {
+        'period': period,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'labels': [p.start_time.date().isoformat() for p in index],
+        'series': {str(category): table[category].round(2).tolist() for category in table.columns},
+        'totals': table.sum(axis=1).round(2).tolist() if len(table.columns) else [0.0] * len(index),
+    }
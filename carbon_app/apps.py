@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CarbonAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'carbon_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .factors import factor_index
+
+        factor_index.load_units()
@@ -0,0 +1,32 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+
+
+def _load_user(request):
+    # request.user — ленивый объект; первое обращение читает сессию из БД
+    request.user.is_authenticated
+    return request.user
+
+
+async def aget_user(request):
+    """Пользователь запроса, загруженный без блокировки цикла событий"""
+    return await sync_to_async(_load_user)(request)
+
+
+def async_login_required(view):
+    """login_required для async-представлений.
+
+    Встроенный декоратор в Django 4.2 оборачивает представление синхронной
+    функцией и обращается к request.user напрямую, поэтому для корутин не
+    подходит.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), settings.LOGIN_URL)
+        return await view(request, *args, **kwargs)
+    return wrapper
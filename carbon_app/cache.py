@@ -0,0 +1,107 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+DASHBOARD_CACHE_TIMEOUT = 60 * 60 * 24
+# Бэкенды, записи которых видит только записавший их процесс
+PROCESS_LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+# Предельный срок записи в таком кэше: сброс версии из команды или соседнего
+# воркера до процесса не дойдет, и данные обновятся только по истечении срока
+LOCAL_CACHE_TIMEOUT = 60
+
+
+def is_shared_cache():
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def cache_timeout(timeout):
+    """timeout для общего кэша; в кэше процесса — не дольше LOCAL_CACHE_TIMEOUT"""
+    if is_shared_cache():
+        return timeout
+    return LOCAL_CACHE_TIMEOUT if timeout is None else min(timeout, LOCAL_CACHE_TIMEOUT)
+
+
+def _version_key(user_id):
+    return f'carbon:dashboard-version:{user_id}'
+
+
+async def adashboard_version(user_id):
+    """Текущая версия данных пользователя.
+
+    Версия — случайный токен, а не счетчик: если ключ версии вытеснен из
+    кэша, новый токен не совпадет ни с одной старой записью, и устаревший
+    контекст не будет показан.
+    """
+    return await cache.aget_or_set(_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def bump_dashboard_version(user_id):
+    """Инвалидирует все закэшированные данные дашборда пользователя"""
+    cache.set(_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def _dashboard_key(user_id, version):
+    return f'carbon:dashboard:{user_id}:{version}:{timezone.localdate().isoformat()}'
+
+
+async def aget_dashboard_context(user_id, abuild):
+    """Контекст дашборда из кэша или abuild() при промахе; abuild — корутинная функция.
+
+    Ключ включает текущую дату, так как недельный ряд зависит от «сегодня».
+    """
+    key = _dashboard_key(user_id, await adashboard_version(user_id))
+    context = await cache.aget(key)
+    if context is None:
+        context = await abuild()
+        await cache.aset(key, context, cache_timeout(DASHBOARD_CACHE_TIMEOUT))
+    return context
+
+
+CATALOG_VERSION_KEY = 'carbon:recommendation-catalog-version'
+# Записи старых версий каталога не удаляются, а истекают сами
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def catalog_version():
+    """Версия каталога рекомендаций; меняется при сохранении или удалении Recommendation"""
+    return cache.get_or_set(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def bump_catalog_version():
+    cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def build_recommendation_catalog():
+    """Активные рекомендации, сгруппированные по категориям в порядке CATEGORY_CHOICES"""
+    from .models import Recommendation
+
+    names = dict(Recommendation.CATEGORY_CHOICES)
+    order = {code: index for index, code in enumerate(names)}
+    groups = {}
+    for rec in Recommendation.objects.filter(is_active=True):
+        groups.setdefault(rec.category, []).append({
+            'id': rec.id,
+            'title': rec.title,
+            'description': rec.description,
+            'co2_saving': rec.co2_saving,
+            'difficulty': rec.get_difficulty_display(),
+            'priority_color': rec.get_priority_color(),
+            # В данных встречаются и «bi-plug», и «plug»
+            'icon': rec.icon if rec.icon.startswith('bi-') else f'bi-{rec.icon}',
+        })
+    return [
+        {'category': code, 'name': names.get(code, code), 'recommendations': groups[code]}
+        for code in sorted(groups, key=lambda code: (order.get(code, len(order)), code))
+    ]
+
+
+def recommendation_catalog():
+    """Сгруппированный каталог из кэша; БД читается только после изменения каталога"""
+    key = f'carbon:recommendation-catalog:{catalog_version()}'
+    catalog = cache.get(key)
+    if catalog is None:
+        catalog = build_recommendation_catalog()
+        cache.set(key, catalog, cache_timeout(CATALOG_CACHE_TIMEOUT))
+    return catalog
@@ -0,0 +1,90 @@
+import math
+
+import numpy as np
+
+from .units import conversion_factor, normalize_unit
+
+MAX_BATCH_LINES = 5000
+
+
+class BatchError(ValueError):
+    """Запрос к пакетному калькулятору целиком некорректен"""
+
+
+def calculate_batch(registry, items):
+    """Рассчитывает CO₂ для списка строк {category, activity_type, quantity, unit}.
+
+    Коэффициенты берутся из реестра (словарные обращения), а сам расчет —
+    одна векторная операция NumPy над всеми корректными строками.
+    Строки с ошибками не прерывают расчет, а возвращаются в errors.
+    """
+    if not isinstance(items, list):
+        raise BatchError('Ожидается массив строк')
+    if len(items) > MAX_BATCH_LINES:
+        raise BatchError(f'Не более {MAX_BATCH_LINES} строк в одном запросе')
+
+    lines = []
+    quantities = []
+    factors = []
+    errors = []
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'error': 'Строка должна быть объектом'})
+            continue
+
+        category = str(item.get('category') or '').strip()
+        activity_type = str(item.get('activity_type') or '').strip()
+        if not activity_type:
+            errors.append({'index': index, 'error': 'Не указан тип активности'})
+            continue
+
+        try:
+            quantity = float(item.get('quantity'))
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'error': 'Некорректное количество'})
+            continue
+        # float() принимает 'nan' и 'inf', а NaN в ответе — некорректный JSON
+        if not math.isfinite(quantity):
+            errors.append({'index': index, 'error': 'Некорректное количество'})
+            continue
+        if quantity < 0:
+            errors.append({'index': index, 'error': 'Количество не может быть отрицательным'})
+            continue
+
+        unit, co2_per_unit = registry.calculator_factor(category, activity_type)
+        requested_unit = normalize_unit(str(item.get('unit') or ''))
+        if requested_unit and requested_unit != unit:
+            # Другая единица той же величины пересчитывается (мили → км)
+            ratio = conversion_factor(requested_unit, unit)
+            if ratio is None:
+                errors.append({'index': index, 'error': f'Для «{activity_type}» используется единица {unit}'})
+                continue
+            unit, co2_per_unit = requested_unit, co2_per_unit * ratio
+        if not math.isfinite(quantity * co2_per_unit):
+            errors.append({'index': index, 'error': 'Слишком большое количество'})
+            continue
+
+        lines.append({
+            'index': index,
+            'category': category,
+            'activity_type': activity_type,
+            'quantity': quantity,
+            'unit': unit,
+            'co2_per_unit': co2_per_unit,
+        })
+        quantities.append(quantity)
+        factors.append(co2_per_unit)
+
+    co2 = np.asarray(quantities, dtype=float) * np.asarray(factors, dtype=float)
+    for line, value in zip(lines, np.round(co2, 3).tolist()):
+        line['co2'] = value
+    total_co2 = float(co2.sum())
+    if not math.isfinite(total_co2):
+        raise BatchError('Слишком большой итог')
+
+    return {
+        'lines': lines,
+        'errors': errors,
+        'total_co2': round(total_co2, 3),
+    }
@@ -0,0 +1,217 @@
+from bisect import bisect_right
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import ActivityCategory, CommunitySnapshot, DailyEmission, MonthlyEmission
+from .rollups import month_start
+
+# Окно для среднесуточных выбросов, дней
+WINDOW_DAYS = 30
+# Границы корзин гистограммы, кг CO₂: ноль и логарифмическая шкала 0.01 кг … 10 т,
+# 12 корзин на порядок — погрешность процентиля не больше доли одной корзины
+HISTOGRAM_EDGES = [0.0] + np.round(np.geomspace(0.01, 10000, 73), 4).tolist()
+QUANTILES = (10, 25, 50, 75, 90)
+KEEP_SNAPSHOTS = 30
+SNAPSHOT_CACHE_KEY = 'carbon:community-snapshot'
+# Другие процессы увидят новый снимок не позже чем через этот срок
+SNAPSHOT_CACHE_TIMEOUT = 60 * 10
+
+
+def build_sketch(values, edges=HISTOGRAM_EDGES):
+    """Среднее, квантили и гистограмма по фиксированным корзинам"""
+    values = np.asarray(values, dtype=float)
+    counts, _ = np.histogram(np.clip(values, 0, edges[-1]), bins=edges)
+    return {
+        'count': int(values.size),
+        'mean': round(float(values.mean()), 3),
+        'quantiles': {
+            f'p{q}': round(float(value), 3)
+            for q, value in zip(QUANTILES, np.percentile(values, QUANTILES))
+        },
+        'histogram': counts.tolist(),
+    }
+
+
+def build_sketches(frame):
+    """Гистограммы по всем категориям ('all') и по каждой категории.
+
+    frame — DataFrame со столбцами user_id, category_id, co2, строка на
+    пару (пользователь, категория). Пользователи без активностей в
+    категории в ее распределение не попадают.
+    """
+    if frame.empty:
+        return {}
+    sketches = {'all': build_sketch(frame.groupby('user_id')['co2'].sum().to_numpy())}
+    for category_id, group in frame.groupby('category_id'):
+        sketches[str(category_id)] = build_sketch(group['co2'].to_numpy())
+    return sketches
+
+
+def per_user_totals(queryset):
+    rows = queryset.values('user_id', 'category_id').annotate(co2=Sum('co2_total')).order_by()
+    frame = pd.DataFrame.from_records(
+        rows.values_list('user_id', 'category_id', 'co2'),
+        columns=['user_id', 'category_id', 'co2'],
+    )
+    return frame[frame['co2'] > 0]
+
+
+def compute_snapshot(today=None):
+    """Считает данные снимка по сводным таблицам.
+
+    daily — среднесуточные выбросы пользователя за последние WINDOW_DAYS
+    дней, monthly — выбросы за последний завершенный месяц. Читаются только
+    агрегаты по (пользователь, категория), а не сырые активности.
+    """
+    today = today or timezone.localdate()
+    window_start = today - timedelta(days=WINDOW_DAYS - 1)
+    month = month_start(month_start(today) - timedelta(days=1))
+
+    daily = per_user_totals(DailyEmission.objects.filter(period_start__gte=window_start, period_start__lte=today))
+    daily = daily.assign(co2=daily['co2'] / WINDOW_DAYS)
+    monthly = per_user_totals(MonthlyEmission.objects.filter(period_start=month))
+
+    return {
+        'computed_on': today.isoformat(),
+        'window_days': WINDOW_DAYS,
+        'month': month.isoformat(),
+        'edges': HISTOGRAM_EDGES,
+        'users_count': int(daily['user_id'].nunique()),
+        'categories': {str(pk): name for pk, name in ActivityCategory.objects.values_list('id', 'name')},
+        'daily': build_sketches(daily),
+        'monthly': build_sketches(monthly),
+    }
+
+
+def refresh_snapshot(today=None):
+    """Сохраняет новый снимок, удаляет старые сверх KEEP_SNAPSHOTS и обновляет кэш"""
+    data = compute_snapshot(today)
+    snapshot = CommunitySnapshot.objects.create(users_count=data['users_count'], data=data)
+    stale = CommunitySnapshot.objects.values_list('id', flat=True)[KEEP_SNAPSHOTS:]
+    CommunitySnapshot.objects.filter(id__in=list(stale)).delete()
+    cache.set(SNAPSHOT_CACHE_KEY, data, SNAPSHOT_CACHE_TIMEOUT)
+    return snapshot
+
+
+def latest_snapshot():
+    """Данные последнего снимка ({} если снимков нет) — из кэша, без запроса к БД"""
+    data = cache.get(SNAPSHOT_CACHE_KEY)
+    if data is None:
+        data = CommunitySnapshot.objects.values_list('data', flat=True).first() or {}
+        cache.set(SNAPSHOT_CACHE_KEY, data, SNAPSHOT_CACHE_TIMEOUT)
+    return data
+
+
+async def alatest_snapshot():
+    data = await cache.aget(SNAPSHOT_CACHE_KEY)
+    if data is None:
+        data = await CommunitySnapshot.objects.values_list('data', flat=True).afirst() or {}
+        await cache.aset(SNAPSHOT_CACHE_KEY, data, SNAPSHOT_CACHE_TIMEOUT)
+    return data
+
+
+def percentile_rank(sketch, value, edges):
+    """Доля пользователей (0–100) с выбросами ниже value.
+
+    Внутри корзины распределение считается равномерным, поэтому ответ —
+    приближение с точностью до ширины корзины. Стоимость не зависит от
+    числа пользователей.
+    """
+    counts = sketch['histogram']
+    if not sketch['count']:
+        return None
+    value = min(max(value, 0.0), edges[-1])
+    index = min(bisect_right(edges, value) - 1, len(counts) - 1)
+    low, high = edges[index], edges[index + 1]
+    fraction = (value - low) / (high - low) if high > low else 1.0
+    return round((sum(counts[:index]) + fraction * counts[index]) / sketch['count'] * 100, 1)
+
+
+def user_daily_queryset(user, today=None):
+    today = today or timezone.localdate()
+    return (
+        DailyEmission.objects.filter(
+            user=user,
+            period_start__gte=today - timedelta(days=WINDOW_DAYS - 1),
+            period_start__lte=today,
+        )
+        .values('category_id')
+        .annotate(co2=Sum('co2_total'))
+        .order_by()
+    )
+
+
+def daily_values(rows):
+    values = {str(row['category_id']): (row['co2'] or 0) / WINDOW_DAYS for row in rows}
+    values['all'] = sum(values.values())
+    return values
+
+
+async def auser_daily_values(user, today=None):
+    """Среднесуточные выбросы пользователя за окно снимка: {'all': x, '<category_id>': x}"""
+    return daily_values([row async for row in user_daily_queryset(user, today)])
+
+
+def compare_with_community(snapshot, values):
+    """Сравнение пользователя со снимком для шаблона дашборда или None"""
+    sketches = snapshot.get('daily', {})
+    if 'all' not in sketches or not values.get('all'):
+        return None
+    edges = snapshot['edges']
+    overall = sketches['all']
+    percentile = percentile_rank(overall, values['all'], edges)
+    categories = []
+    for key, value in values.items():
+        if key == 'all' or key not in sketches or not value:
+            continue
+        category_percentile = percentile_rank(sketches[key], value, edges)
+        categories.append({
+            'name': snapshot['categories'].get(key, key),
+            'user_daily': round(value, 2),
+            'community_mean': sketches[key]['mean'],
+            'percentile': category_percentile,
+            'lower_than_percent': round(100 - category_percentile, 1),
+        })
+    return {
+        'computed_on': snapshot['computed_on'],
+        'window_days': snapshot['window_days'],
+        'users_count': snapshot['users_count'],
+        'user_daily': round(values['all'], 2),
+        'community_mean': overall['mean'],
+        'community_median': overall['quantiles']['p50'],
+        'comparison': 'ниже' if values['all'] < overall['mean'] else 'выше',
+        'comparison_percent': round(abs(values['all'] - overall['mean']) / overall['mean'] * 100, 1) if overall['mean'] else 0,
+        'percentile': percentile,
+        # Процент пользователей, у которых выбросы выше, чем у текущего
+        'lower_than_percent': round(100 - percentile, 1),
+        'categories': sorted(categories, key=lambda item: item['name']),
+    }
+
+
+def community_summary(snapshot):
+    """Общая статистика для главной страницы или None"""
+    daily = snapshot.get('daily', {})
+    if 'all' not in daily:
+        return None
+    monthly = snapshot.get('monthly', {})
+    return {
+        'computed_on': snapshot['computed_on'],
+        'window_days': snapshot['window_days'],
+        'users_count': snapshot['users_count'],
+        'daily_mean': daily['all']['mean'],
+        'daily_median': daily['all']['quantiles']['p50'],
+        'monthly_mean': monthly['all']['mean'] if 'all' in monthly else None,
+        'monthly_median': monthly['all']['quantiles']['p50'] if 'all' in monthly else None,
+        'categories': sorted(
+            (
+                {'name': snapshot['categories'].get(key, key), 'daily_mean': sketch['mean'], 'users': sketch['count']}
+                for key, sketch in daily.items() if key != 'all'
+            ),
+            key=lambda item: item['name'],
+        ),
+    }
@@ -0,0 +1,133 @@
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollups
+from .cache import bump_dashboard_version
+from .factors import category_slug, factor_index
+from .models import ActivityCategory, EmissionFactor, Recommendation, UserActivity
+
+BATCH_SIZE = 5000
+
+CATEGORY_NAMES = {
+    'transport': 'Транспорт',
+    'food': 'Питание',
+    'energy': 'Энергия',
+}
+
+# Типичное количество за одну запись по единице измерения (медиана логнормального)
+TYPICAL_QUANTITY = {
+    'км': 15.0,
+    'кг': 0.5,
+    'л': 1.0,
+    'кВт·ч': 10.0,
+    'м³': 3.0,
+}
+
+# Доля записей по разделам: транспорт и еда встречаются чаще энергии
+CATEGORY_WEIGHTS = {
+    'transport': 0.45,
+    'food': 0.4,
+    'energy': 0.15,
+}
+
+
+def ensure_reference_data():
+    """Создает категории, коэффициенты из units.json и каталог рекомендаций, если их нет"""
+    from .views import create_initial_recommendations
+
+    categories = {}
+    for category in ActivityCategory.objects.all():
+        slug = category_slug(category.name)
+        if slug and slug not in categories:
+            categories[slug] = category
+    for slug, name in CATEGORY_NAMES.items():
+        if slug not in categories:
+            categories[slug] = ActivityCategory.objects.create(name=name, description=f'Категория {name}')
+
+    units = factor_index.load_units()
+    existing = set(EmissionFactor.objects.values_list('activity_type', 'category_id', 'unit', 'region'))
+    EmissionFactor.objects.bulk_create([
+        EmissionFactor(
+            activity_type=activity_type,
+            category=categories[slug],
+            co2_per_unit=entry['co2_per_unit'],
+            unit=entry['unit'],
+            source='units.json',
+        )
+        for slug, activities in units.items()
+        for activity_type, entry in activities.items()
+        if (activity_type, categories[slug].id, entry['unit'], 'global') not in existing
+    ])
+    factor_index.invalidate()
+
+    if not Recommendation.objects.exists():
+        create_initial_recommendations()
+
+    return categories
+
+
+def create_users(count, prefix='demo'):
+    """Создает пользователей prefix0..prefixN-1 (существующие пропускаются)"""
+    usernames = [f'{prefix}{i}' for i in range(count)]
+    User.objects.bulk_create([User(username=name) for name in usernames], ignore_conflicts=True)
+    return list(User.objects.filter(username__in=usernames).order_by('id'))
+
+
+def generate_activities(users, per_user, years=1, seed=None):
+    """Генерирует per_user активностей на пользователя за последние years лет.
+
+    Типы активности, количества и даты выбираются векторно через NumPy,
+    строки пишутся bulk_create пачками по BATCH_SIZE. Возвращает число строк.
+    """
+    rng = np.random.default_rng(seed)
+    categories = ensure_reference_data()
+    registry = factor_index.registry
+
+    catalog = [
+        (slug, activity_type, entry['unit'], entry['co2_per_unit'])
+        for slug, activities in registry.catalog.items()
+        if slug in categories
+        for activity_type, entry in activities.items()
+    ]
+    weights = np.array([CATEGORY_WEIGHTS.get(slug, 0.1) for slug, *_ in catalog])
+    weights /= weights.sum()
+    typical = np.array([TYPICAL_QUANTITY.get(unit, 1.0) for _, _, unit, _ in catalog])
+    factors = np.array([co2_per_unit for *_, co2_per_unit in catalog])
+
+    today = timezone.localdate()
+    span_days = max(1, int(365 * years))
+    created = 0
+
+    for user in users:
+        remaining = per_user
+        while remaining > 0:
+            size = min(remaining, BATCH_SIZE)
+            choice = rng.choice(len(catalog), size=size, p=weights)
+            quantities = np.round(typical[choice] * rng.lognormal(0, 0.6, size=size), 1) + 0.1
+            co2 = quantities * factors[choice]
+            offsets = rng.integers(0, span_days, size=size)
+
+            activities = []
+            for index, quantity, value, offset in zip(choice.tolist(), quantities.tolist(), co2.tolist(), offsets.tolist()):
+                slug, activity_type, unit, _ = catalog[index]
+                activities.append(UserActivity(
+                    user=user,
+                    category=categories[slug],
+                    activity_type=activity_type,
+                    quantity=quantity,
+                    unit=unit,
+                    date=today - timedelta(days=offset),
+                    calculated_co2=value,
+                ))
+            with transaction.atomic():
+                UserActivity.objects.bulk_create(activities, batch_size=BATCH_SIZE)
+                rollups.add_activities(activities)
+            created += size
+            remaining -= size
+        bump_dashboard_version(user.id)
+
+    return created
@@ -0,0 +1,108 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date
+
+DEFAULT_CHUNK_SIZE = 2000
+# Размер текстового буфера перед отправкой клиенту, символов
+BUFFER_SIZE = 64 * 1024
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson; charset=utf-8', 'ndjson'),
+}
+# Те же поля, что читает ActivityImporter: выгрузку можно загрузить обратно
+EXPORT_FIELDS = ('date', 'category', 'activity_type', 'quantity', 'unit', 'calculated_co2', 'notes')
+QUERY_FIELDS = ('date', 'category__name', 'activity_type', 'quantity', 'unit', 'calculated_co2', 'notes')
+
+
+def filter_activities(activities, filters):
+    """Фильтры списка активностей: category, date_from, date_to (строки, пустые пропускаются).
+
+    ValueError при некорректных значениях.
+    """
+    if filters.get('category'):
+        activities = activities.filter(category_id=int(filters['category']))
+    if filters.get('date_from'):
+        activities = activities.filter(date__gte=date.fromisoformat(filters['date_from']))
+    if filters.get('date_to'):
+        activities = activities.filter(date__lte=date.fromisoformat(filters['date_to']))
+    return activities
+
+
+def export_rows(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Кортежи EXPORT_FIELDS по возрастанию (date, id).
+
+    iterator() читает курсор порциями по chunk_size и не наполняет кэш
+    QuerySet, values_list не создает модели — память не зависит от числа
+    строк.
+    """
+    rows = queryset.order_by('date', 'id').values_list(*QUERY_FIELDS)
+    return rows.iterator(chunk_size=chunk_size)
+
+
+def _buffered(lines):
+    """Склеивает строки в куски около BUFFER_SIZE, чтобы не отправлять по строке"""
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _csv_lines(rows):
+    line = io.StringIO()
+    writer = csv.writer(line)
+
+    def render(values):
+        line.seek(0)
+        line.truncate()
+        writer.writerow(values)
+        return line.getvalue()
+
+    yield render(EXPORT_FIELDS)
+    for activity_date, *values in rows:
+        yield render((activity_date.isoformat(), *values))
+
+
+def _ndjson_lines(rows):
+    for activity_date, *values in rows:
+        record = dict(zip(EXPORT_FIELDS, (activity_date.isoformat(), *values)))
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def iter_export(rows, fmt):
+    """Текст выгрузки в формате csv или ndjson кусками по BUFFER_SIZE"""
+    lines = _ndjson_lines(rows) if fmt == 'ndjson' else _csv_lines(rows)
+    return _buffered(lines)
+
+
+def iter_encoded(chunks, compress=False):
+    """Кодирует куски в UTF-8 и при compress сжимает их потоково в формат gzip"""
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode()
+        return
+    # wbits=16+MAX_WBITS — заголовок и контрольная сумма gzip вместо zlib
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_filename(fmt, filters, compress=False):
+    parts = ['activities']
+    if filters.get('date_from'):
+        parts.append(filters['date_from'])
+    if filters.get('date_to'):
+        parts.append(filters['date_to'])
+    name = '_'.join(parts) + '.' + EXPORT_FORMATS[fmt][1]
+    return name + '.gz' if compress else name
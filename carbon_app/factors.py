@@ -0,0 +1,380 @@
+import json
+import threading
+from dataclasses import dataclass
+from functools import cached_property
+from pathlib import Path
+from types import MappingProxyType
+
+from django.core.cache import cache
+
+from .cache import cache_timeout
+from .models import ActivityCategory, EmissionFactor, UserProfile
+from .suggestions import build_suggestion_index
+from .units import conversion_factor, normalize_unit
+
+UNITS_PATH = Path(__file__).resolve().parent / 'units.json'
+
+GLOBAL_REGION = 'global'
+
+# Исходы поиска коэффициента (FactorRegistry.resolve_outcome)
+LOOKUP_EXACT = 'exact'
+LOOKUP_CONVERTED = 'converted'
+LOOKUP_FALLBACK = 'fallback'
+
+# Коэффициент, если не известна ни активность, ни категория
+DEFAULT_CO2_PER_UNIT = 2.5
+
+# Средние значения по категориям для неизвестных типов активности
+CATEGORY_DEFAULTS = {
+    'transport': ('км', 0.1),
+    'food': ('кг', 5.0),
+    'energy': ('кВт·ч', 0.5),
+}
+
+# Название ActivityCategory → раздел units.json
+CATEGORY_ALIASES = {
+    'transport': 'transport',
+    'транспорт': 'transport',
+    'food': 'food',
+    'питание': 'food',
+    'energy': 'energy',
+    'энергия': 'energy',
+}
+
+
+def normalize_region(code):
+    """Код региона ISO 3166: страна (RU) или субъект (RU-MOW); пустой → global"""
+    code = (code or '').strip()
+    if not code or code.lower() == GLOBAL_REGION:
+        return GLOBAL_REGION
+    return code.upper()
+
+
+def parent_region(code):
+    """RU-MOW → RU → global"""
+    if code == GLOBAL_REGION:
+        return None
+    return code.rsplit('-', 1)[0] if '-' in code else GLOBAL_REGION
+
+
+def load_units(path=UNITS_PATH):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def category_slug(name):
+    return CATEGORY_ALIASES.get(name.strip().lower())
+
+
+@dataclass(frozen=True)
+class FactorRegistry:
+    """Неизменяемый снимок всех коэффициентов выбросов.
+
+    factors — (activity_type, category_id, unit) → кг CO₂ на единицу (global);
+    regional — (activity_type, category_id, unit, region) → коэффициент с уже
+    примененной цепочкой регион → родительский регион, только для регионов
+    из regions (в которых есть свои строки EmissionFactor);
+    catalog — раздел units.json → {activity_type: {'unit', 'co2_per_unit'}};
+    category_slugs — category_id → раздел units.json;
+    activity_units — (activity_type, category_id) → единицы, для которых
+    есть коэффициенты (для пересчета из другой единицы той же величины).
+    Строки EmissionFactor имеют приоритет над units.json. Все единицы
+    в ключах приведены к каноническому виду (см. units.py).
+    """
+    factors: MappingProxyType
+    catalog: MappingProxyType
+    category_slugs: MappingProxyType
+    regional: MappingProxyType
+    regions: frozenset
+    activity_units: MappingProxyType
+
+    def effective_region(self, region):
+        """Ближайший регион цепочки, для которого есть свои коэффициенты"""
+        while region is not None and region != GLOBAL_REGION:
+            if region in self.regions:
+                return region
+            region = parent_region(region)
+        return GLOBAL_REGION
+
+    def lookup(self, activity_type, category_id, unit, region=GLOBAL_REGION):
+        """Коэффициент: регион → родительский регион → global (или None).
+
+        Цепочка регионов разрешена заранее при сборке снимка, поэтому
+        поиск — одно обращение к regional и, при промахе, одно к factors,
+        сколько бы региональных коэффициентов ни было.
+        """
+        if region != GLOBAL_REGION:
+            co2_per_unit = self.regional.get((activity_type, category_id, unit, self.effective_region(region)))
+            if co2_per_unit is not None:
+                return co2_per_unit
+        return self.factors.get((activity_type, category_id, unit))
+
+    def default_for(self, category_id):
+        """(единица, коэффициент) по умолчанию для категории"""
+        slug = self.category_slugs.get(category_id)
+        if slug in CATEGORY_DEFAULTS:
+            return CATEGORY_DEFAULTS[slug]
+        return None, DEFAULT_CO2_PER_UNIT
+
+    def resolve_outcome(self, activity_type, category_id, unit, region=GLOBAL_REGION):
+        """(кг CO₂ на единицу unit, исход поиска).
+
+        Исход: LOOKUP_EXACT — коэффициент для этой единицы есть;
+        LOOKUP_CONVERTED — есть для другой единицы той же величины (мили → км);
+        LOOKUP_FALLBACK — взято значение по умолчанию для категории.
+        """
+        unit = normalize_unit(unit)
+        co2_per_unit = self.lookup(activity_type, category_id, unit, region)
+        if co2_per_unit is not None:
+            return co2_per_unit, LOOKUP_EXACT
+
+        for factor_unit in self.activity_units.get((activity_type, category_id), ()):
+            ratio = conversion_factor(unit, factor_unit)
+            if ratio is None:
+                continue
+            co2_per_unit = self.lookup(activity_type, category_id, factor_unit, region)
+            if co2_per_unit is not None:
+                return co2_per_unit * ratio, LOOKUP_CONVERTED
+
+        default_unit, co2_per_unit = self.default_for(category_id)
+        ratio = conversion_factor(unit, default_unit) if default_unit else None
+        return co2_per_unit * (ratio or 1.0), LOOKUP_FALLBACK
+
+    def resolve(self, activity_type, category_id, unit, region=GLOBAL_REGION):
+        return self.resolve_outcome(activity_type, category_id, unit, region)[0]
+
+    def calculator_factor(self, slug, activity_type):
+        """Единица и коэффициент для калькулятора по разделу и типу активности"""
+        entry = self.catalog.get(slug, {}).get(activity_type)
+        if entry is not None:
+            return entry['unit'], entry['co2_per_unit']
+        return CATEGORY_DEFAULTS.get(slug, ('ед.', DEFAULT_CO2_PER_UNIT))
+
+    @cached_property
+    def suggestions(self):
+        """Индекс подсказок типов активности (строится при первом обращении)"""
+        return build_suggestion_index(self.catalog)
+
+    def as_units_data(self):
+        """Каталог в виде обычных dict для json_script в шаблонах"""
+        return {
+            slug: {activity_type: dict(entry) for activity_type, entry in activities.items()}
+            for slug, activities in self.catalog.items()
+        }
+
+
+def spread_to_section(rows, category_slugs, section_categories):
+    """Строки БД, распространенные на все категории своего раздела.
+
+    Точные строки категории важнее распространенных с соседних категорий.
+    """
+    spread = {}
+    for (activity_type, category_id, unit), co2_per_unit in rows.items():
+        for sibling in section_categories.get(category_slugs.get(category_id), ()):
+            spread.setdefault((activity_type, sibling, unit), co2_per_unit)
+    spread.update(rows)
+    return spread
+
+
+def build_registry(units, categories, factor_rows):
+    """Собирает снимок из units.json, категорий (id, name) и строк EmissionFactor"""
+    category_slugs = {}
+    section_categories = {}
+    for category_id, name in categories:
+        slug = category_slug(name)
+        if slug:
+            category_slugs[category_id] = slug
+            section_categories.setdefault(slug, []).append(category_id)
+
+    # Регион → строки БД; при дублях берется самая ранняя
+    db_factors = {}
+    for activity_type, category_id, unit, region, co2_per_unit in factor_rows:
+        rows = db_factors.setdefault(normalize_region(region), {})
+        rows.setdefault((activity_type, category_id, normalize_unit(unit)), co2_per_unit)
+    global_factors = db_factors.pop(GLOBAL_REGION, {})
+
+    # Каталог раздела: units.json, дополненный глобальными коэффициентами из БД
+    catalog = {
+        slug: {
+            activity_type: {**entry, 'unit': normalize_unit(entry['unit'])}
+            for activity_type, entry in activities.items()
+        }
+        for slug, activities in units.items()
+    }
+    for (activity_type, category_id, unit), co2_per_unit in global_factors.items():
+        slug = category_slugs.get(category_id)
+        if slug:
+            catalog.setdefault(slug, {})[activity_type] = {'unit': unit, 'co2_per_unit': co2_per_unit}
+
+    # Каталог действует для всех категорий раздела, точные строки БД — поверх него
+    factors = {}
+    for category_id, slug in category_slugs.items():
+        for activity_type, entry in catalog.get(slug, {}).items():
+            factors[(activity_type, category_id, entry['unit'])] = entry['co2_per_unit']
+    factors.update(global_factors)
+
+    # Региональный слой: для каждого региона со своими строками — коэффициенты
+    # всей цепочки предков (кроме global), ближний регион поверх дальнего
+    spread = {
+        region: spread_to_section(rows, category_slugs, section_categories)
+        for region, rows in db_factors.items()
+    }
+    regional = {}
+    for region in spread:
+        chain = []
+        ancestor = region
+        while ancestor != GLOBAL_REGION:
+            if ancestor in spread:
+                chain.append(ancestor)
+            ancestor = parent_region(ancestor)
+        merged = {}
+        for ancestor in reversed(chain):
+            merged.update(spread[ancestor])
+        for key, co2_per_unit in merged.items():
+            regional[(*key, region)] = co2_per_unit
+
+    activity_units = {}
+    for activity_type, category_id, unit, *_ in (*factors, *regional):
+        units_for = activity_units.setdefault((activity_type, category_id), [])
+        if unit not in units_for:
+            units_for.append(unit)
+
+    return FactorRegistry(
+        factors=MappingProxyType(factors),
+        catalog=MappingProxyType({
+            slug: MappingProxyType({
+                activity_type: MappingProxyType(entry) for activity_type, entry in activities.items()
+            })
+            for slug, activities in catalog.items()
+        }),
+        category_slugs=MappingProxyType(category_slugs),
+        regional=MappingProxyType(regional),
+        regions=frozenset(spread),
+        activity_units=MappingProxyType({key: tuple(units) for key, units in activity_units.items()}),
+    )
+
+
+class FactorIndex:
+    """Процессный реестр коэффициентов выбросов.
+
+    units.json читается один раз при старте приложения (CarbonAppConfig.ready),
+    строки EmissionFactor и категории — при первом обращении. Готовый
+    FactorRegistry не изменяется: при изменении справочников сигналы
+    (см. signals.py) сбрасывают его, и следующий запрос собирает новый снимок.
+    """
+
+    def __init__(self):
+        self._units = None
+        self._registry = None
+        self._lock = threading.Lock()
+        # Счетчики обновляются из пула потоков async-представлений и из
+        # фонового пересчета — «+=» без блокировки теряет приращения
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.conversions = 0
+        self.misses = 0
+        self.loads = 0
+
+    def load_units(self):
+        if self._units is None:
+            self._units = load_units()
+        return self._units
+
+    def _load(self):
+        registry = build_registry(
+            self.load_units(),
+            ActivityCategory.objects.values_list('id', 'name'),
+            EmissionFactor.objects.order_by('id').values_list(
+                'activity_type', 'category_id', 'unit', 'region', 'co2_per_unit'
+            ),
+        )
+        self.loads += 1
+        return registry
+
+    @property
+    def registry(self):
+        registry = self._registry
+        if registry is None:
+            with self._lock:
+                if self._registry is None:
+                    self._registry = self._load()
+                registry = self._registry
+        return registry
+
+    def record(self, outcomes):
+        """Учитывает исходы поиска в статистике попаданий"""
+        hits = conversions = misses = 0
+        for outcome in outcomes:
+            if outcome == LOOKUP_EXACT:
+                hits += 1
+            elif outcome == LOOKUP_CONVERTED:
+                conversions += 1
+            else:
+                misses += 1
+        with self._stats_lock:
+            self.hits += hits
+            self.conversions += conversions
+            self.misses += misses
+
+    def resolve(self, activity_type, category_id, unit, region=GLOBAL_REGION):
+        """Коэффициент на единицу unit: регион → родительский → global, пересчет
+        единиц той же величины, затем значение по умолчанию для категории"""
+        co2_per_unit, outcome = self.registry.resolve_outcome(activity_type, category_id, unit, region)
+        self.record((outcome,))
+        return co2_per_unit
+
+    def resolve_many(self, keys, registry=None):
+        """resolve для списка ключей (activity_type, category_id, unit, region).
+
+        registry позволяет пакетным операциям работать с одним снимком.
+        """
+        registry = registry or self.registry
+        results = [registry.resolve_outcome(*key) for key in keys]
+        self.record(outcome for _, outcome in results)
+        return [co2_per_unit for co2_per_unit, _ in results]
+
+    def invalidate(self):
+        with self._lock:
+            self._registry = None
+
+    def stats(self):
+        with self._stats_lock:
+            hits, conversions, misses = self.hits, self.conversions, self.misses
+        lookups = hits + conversions + misses
+        return {
+            'size': len(self._registry.factors) if self._registry is not None else 0,
+            'regional_size': len(self._registry.regional) if self._registry is not None else 0,
+            'hits': hits,
+            'conversions': conversions,
+            'misses': misses,
+            'loads': self.loads,
+            'hit_rate': round((hits + conversions) / lookups, 4) if lookups else 0,
+            # Доля активностей, посчитанных по значению категории по умолчанию
+            'fallback_rate': round(misses / lookups, 4) if lookups else 0,
+        }
+
+
+factor_index = FactorIndex()
+
+
+# Регион сбрасывается сигналом при сохранении профиля; срок ограничивает
+# устаревание, если сброс сделан в другом процессе с кэшем процесса
+REGION_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _region_key(user_id):
+    return f'carbon:user-region:{user_id}'
+
+
+def user_region(user_id):
+    """Регион пользователя из профиля (global, если профиля нет); кэшируется"""
+    region = cache.get(_region_key(user_id))
+    if region is None:
+        region = UserProfile.objects.filter(user_id=user_id).values_list('region', flat=True).first()
+        region = normalize_region(region)
+        cache.set(_region_key(user_id), region, cache_timeout(REGION_CACHE_TIMEOUT))
+    return region
+
+
+def forget_user_region(user_id):
+    cache.delete(_region_key(user_id))
@@ -0,0 +1,256 @@
+import codecs
+import csv
+import io
+import json
+import math
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollups
+from .cache import bump_dashboard_version
+from .factors import factor_index, user_region
+from .models import ActivityCategory, UserActivity
+from .units import normalize_unit
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y')
+# Сколько байт из начала файла проверяется на UTF-8
+SNIFF_SIZE = 64 * 1024
+# Кодировка файлов, которые не читаются как UTF-8 (Excel в русской локали)
+FALLBACK_ENCODING = 'cp1251'
+
+
+class ImportRowError(ValueError):
+    """Ошибка в отдельной строке файла импорта"""
+
+
+class LineDecodeError(ImportRowError):
+    """Строку файла не удалось декодировать — дальше файл не читается"""
+
+    def __init__(self, line_no, encoding):
+        self.line_no = line_no
+        super().__init__(
+            f'Строка не читается в кодировке {encoding}, импорт остановлен. '
+            f'Сохраните файл в UTF-8'
+        )
+
+
+@dataclass
+class ImportReport:
+    """Итог импорта: сколько строк прочитано, создано и с какими ошибками"""
+    rows: int = 0
+    created: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return round(self.rows / self.elapsed, 1) if self.elapsed else 0.0
+
+    def add_error(self, line, message):
+        self.failed += 1
+        # Храним только первые ошибки, чтобы память не росла с размером файла
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def detect_format(filename):
+    """Формат файла по расширению: csv или jsonl"""
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return 'csv'
+
+
+def iter_records(stream, fmt):
+    """Построчно читает текстовый поток, возвращая (номер строки, dict)"""
+    try:
+        yield from _iter_records(stream, fmt)
+    except LineDecodeError as e:
+        yield e.line_no, e
+
+
+def _iter_records(stream, fmt):
+    if fmt == 'jsonl':
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, ImportRowError(f'Некорректный JSON: {e.msg}')
+                continue
+            if not isinstance(record, dict):
+                yield line_no, ImportRowError('Ожидается JSON-объект')
+                continue
+            yield line_no, record
+    else:
+        reader = csv.DictReader(stream)
+        for record in reader:
+            # Строка 1 — заголовок
+            yield reader.line_num, record
+
+
+def detect_encoding(fileobj):
+    """utf-8-sig, если начало файла — корректный UTF-8, иначе FALLBACK_ENCODING"""
+    if not fileobj.seekable():
+        return 'utf-8-sig'
+    position = fileobj.tell()
+    sample = fileobj.read(SNIFF_SIZE)
+    fileobj.seek(position)
+    try:
+        # final=False: символ, разрезанный границей образца, не считается ошибкой
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return FALLBACK_ENCODING
+    return 'utf-8-sig'
+
+
+def decode_lines(fileobj, encoding):
+    """Декодирует бинарный файл по строкам; LineDecodeError с номером строки при ошибке"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    line_no = 0
+    for line_no, raw in enumerate(fileobj, start=1):
+        try:
+            yield decoder.decode(raw)
+        except UnicodeDecodeError:
+            raise LineDecodeError(line_no, encoding) from None
+    try:
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        raise LineDecodeError(line_no, encoding) from None
+
+
+def open_text(fileobj, encoding=None):
+    """Строки текста из бинарного файла (в т.ч. загруженного) без чтения в память.
+
+    Без encoding кодировка определяется по началу файла (detect_encoding).
+    Строки сохраняют свои переводы строк, как при newline=''.
+    """
+    if isinstance(fileobj, io.TextIOBase):
+        return fileobj
+    return decode_lines(fileobj, encoding or detect_encoding(fileobj))
+
+
+def parse_date(value):
+    if not value:
+        return timezone.localdate()
+    if isinstance(value, date):
+        return value
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), fmt).date()
+        except ValueError:
+            continue
+    raise ImportRowError(f'Некорректная дата: {value}')
+
+
+class ActivityImporter:
+    """Потоковый импорт активностей пользователя.
+
+    Строки читаются по одной и собираются в чанки фиксированного размера.
+    Для каждого чанка коэффициенты берутся из реестра factor_index,
+    calculated_co2 считается одной векторной операцией NumPy, а запись
+    выполняется bulk_create в отдельной транзакции.
+    """
+
+    def __init__(self, user, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.categories = {}
+        for category_id, name in ActivityCategory.objects.values_list('id', 'name'):
+            self.categories[str(category_id)] = category_id
+            self.categories[name.strip().lower()] = category_id
+        self.registry = factor_index.registry
+        self.region = user_region(user.id)
+
+    def parse(self, record):
+        """Проверяет запись и возвращает несохраненный UserActivity"""
+        category = str(record.get('category') or '').strip().lower()
+        category_id = self.categories.get(category)
+        if category_id is None:
+            raise ImportRowError(f'Неизвестная категория: {record.get("category")}')
+
+        activity_type = str(record.get('activity_type') or '').strip()
+        if not activity_type:
+            raise ImportRowError('Не указан тип активности')
+
+        unit = normalize_unit(str(record.get('unit') or ''))
+        if not unit:
+            raise ImportRowError('Не указана единица измерения')
+
+        try:
+            quantity = float(record.get('quantity'))
+        except (TypeError, ValueError):
+            raise ImportRowError(f'Некорректное количество: {record.get("quantity")}')
+        # float() принимает и 'nan', 'inf' — такие значения не сохраняем
+        if not (math.isfinite(quantity) and quantity > 0):
+            raise ImportRowError('Количество должно быть больше 0')
+
+        return UserActivity(
+            user=self.user,
+            category_id=category_id,
+            activity_type=activity_type[:100],
+            quantity=quantity,
+            unit=unit[:20],
+            date=parse_date(record.get('date')),
+            notes=str(record.get('notes') or ''),
+        )
+
+    def calculate(self, activities):
+        """Векторный расчет calculated_co2 для чанка"""
+        quantities = np.fromiter((a.quantity for a in activities), dtype=float, count=len(activities))
+        factors = np.asarray(factor_index.resolve_many(
+            ((a.activity_type, a.category_id, a.unit, self.region) for a in activities),
+            registry=self.registry,
+        ), dtype=float)
+        co2 = quantities * factors
+        for activity, value in zip(activities, co2.tolist()):
+            activity.calculated_co2 = value
+
+    def flush(self, activities, report):
+        if not activities:
+            return
+        self.calculate(activities)
+        with transaction.atomic():
+            UserActivity.objects.bulk_create(activities, batch_size=self.chunk_size)
+            rollups.add_activities(activities)
+        report.created += len(activities)
+
+    def run(self, records):
+        """Импортирует записи из итератора (номер строки, dict)"""
+        report = ImportReport()
+        started = time.perf_counter()
+        chunk = []
+
+        for line_no, record in records:
+            report.rows += 1
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                chunk.append(self.parse(record))
+            except ImportRowError as e:
+                report.add_error(line_no, str(e))
+                continue
+
+            if len(chunk) >= self.chunk_size:
+                self.flush(chunk, report)
+                chunk = []
+
+        self.flush(chunk, report)
+        if report.created:
+            # bulk_create не отправляет сигналы post_save
+            bump_dashboard_version(self.user.id)
+        report.elapsed = time.perf_counter() - started
+        return report
+
+    def run_file(self, fileobj, fmt):
+        return self.run(iter_records(open_text(fileobj), fmt))
@@ -0,0 +1,134 @@
+import json
+import subprocess
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from carbon_app.demo_data import create_users, generate_activities
+from carbon_app.tasks import recommendation_queue
+
+# Отдельный кэш процесса: id пользователей тестовой базы совпадают с
+# рабочими, а сброс кэша между запросами не должен трогать общий кэш
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark-views',
+    }
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время и число запросов основных представлений на разных объемах данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,10000', help='Активностей у пользователя, через запятую')
+        parser.add_argument('--years', type=float, default=3, help='Глубина истории в годах')
+        parser.add_argument('--runs', type=int, default=20, help='Повторов на представление')
+        parser.add_argument('--warm-cache', action='store_true', help='Не сбрасывать кэш между запросами')
+        parser.add_argument('--output', default='bench_report.json', help='Файл JSON-отчета')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def scenarios(self):
+        """(имя представления, метод, URL, данные POST)"""
+        return [
+            ('dashboard', 'get', reverse('dashboard'), None),
+            ('activities_list', 'get', reverse('activities_list'), None),
+            ('recommendations_page', 'get', reverse('recommendations'), None),
+            ('add_activity', 'post', reverse('add_activity'), {
+                'category': str(self.category_id),
+                'activity_type': 'автобус',
+                'quantity': '12',
+                'unit': 'км',
+            }),
+            ('calculator', 'post', reverse('calculator'), {
+                'category': 'transport',
+                'activity_type': 'автобус',
+                'quantity': '12',
+            }),
+        ]
+
+    def measure(self, client, method, url, data, runs, warm_cache):
+        timings = []
+        queries = []
+        for _ in range(runs):
+            if not warm_cache:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data) if data else getattr(client, method)(url)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+            if response.status_code >= 400:
+                raise RuntimeError(f'{url}: HTTP {response.status_code}')
+        timings = np.array(timings)
+        return {
+            'runs': runs,
+            'queries': int(np.median(queries)),
+            'p50_ms': round(float(np.percentile(timings, 50)), 2),
+            'p95_ms': round(float(np.percentile(timings, 95)), 2),
+            'mean_ms': round(float(timings.mean()), 2),
+        }
+
+    def handle(self, *args, **options):
+        with override_settings(CACHES=BENCHMARK_CACHES):
+            self.run(options)
+
+    def run(self, options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+
+        # Замеры идут на отдельной тестовой базе, рабочие данные не затрагиваются
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        results = []
+        try:
+            for size in sizes:
+                user = create_users(1, prefix=f'bench{size}_')[0]
+                generate_activities([user], size, years=options['years'], seed=options['seed'])
+                self.category_id = user.useractivity_set.values_list('category_id', flat=True).first()
+
+                client = Client()
+                client.force_login(user)
+                for view, method, url, data in self.scenarios():
+                    stats = self.measure(client, method, url, data, options['runs'], options['warm_cache'])
+                    stats.update({'size': size, 'view': view})
+                    results.append(stats)
+                    self.stdout.write(
+                        f'{size:>8} {view:<22} запросов: {stats["queries"]:>3}  '
+                        f'p50: {stats["p50_ms"]:>8} мс  p95: {stats["p95_ms"]:>8} мс'
+                    )
+        finally:
+            # Обновления рекомендаций, поставленные add_activity, выполняются
+            # сейчас, на тестовой базе: после ее удаления поток очереди
+            # обратился бы к рабочей
+            recommendation_queue.run_pending()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'revision': git_revision(),
+            'database': connection.vendor,
+            'warm_cache': options['warm_cache'],
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'✅ Отчет сохранен в {options["output"]}'))
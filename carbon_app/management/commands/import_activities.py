@@ -0,0 +1,40 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from carbon_app.importers import DEFAULT_CHUNK_SIZE, ActivityImporter, detect_format
+from carbon_app.views import update_user_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Импортирует историю активностей пользователя из CSV/JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу .csv или .jsonl')
+        parser.add_argument('--user', required=True, help='Имя пользователя')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Формат файла (по умолчанию — по расширению)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'Пользователь {options["user"]} не найден')
+
+        fmt = options['format'] or detect_format(options['path'])
+        importer = ActivityImporter(user, chunk_size=options['chunk_size'])
+
+        with open(options['path'], 'rb') as f:
+            report = importer.run_file(f, fmt)
+
+        for line, message in report.errors:
+            self.stderr.write(f'Строка {line}: {message}')
+        if report.failed > len(report.errors):
+            self.stderr.write(f'... и еще {report.failed - len(report.errors)} ошибок')
+
+        if report.created:
+            update_user_recommendations(user)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Импортировано {report.created} из {report.rows} строк '
+            f'за {report.elapsed:.2f} с ({report.rows_per_sec} строк/с), ошибок: {report.failed}'
+        ))
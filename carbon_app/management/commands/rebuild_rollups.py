@@ -0,0 +1,38 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from carbon_app import rollups
+from carbon_app.cache import bump_dashboard_version
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает сводные таблицы выбросов (день/неделя/месяц) и сверяет их с сырыми данными'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', help='Имя пользователя (можно несколько раз)')
+        parser.add_argument('--verify-only', action='store_true', help='Только сверить, ничего не меняя')
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['user']:
+            user_ids = list(User.objects.filter(username__in=options['user']).values_list('id', flat=True))
+            if len(user_ids) != len(set(options['user'])):
+                raise CommandError('Некоторые пользователи не найдены')
+
+        if not options['verify_only']:
+            started = time.perf_counter()
+            counts = rollups.rebuild(user_ids)
+            elapsed = time.perf_counter() - started
+            summary = ', '.join(f'{name}: {count}' for name, count in counts.items())
+            self.stdout.write(f'Пересобрано за {elapsed:.2f} с — {summary}')
+            for user_id in user_ids or User.objects.values_list('id', flat=True).iterator():
+                bump_dashboard_version(user_id)
+
+        mismatches = rollups.verify(user_ids)
+        for model, key, expected, actual in mismatches[:20]:
+            self.stderr.write(f'{model} {key}: ожидалось {expected}, в таблице {actual}')
+        if mismatches:
+            raise CommandError(f'Расхождений: {len(mismatches)}')
+        self.stdout.write(self.style.SUCCESS('✅ Сводные таблицы совпадают с данными активностей'))
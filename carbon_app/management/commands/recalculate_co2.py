@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from carbon_app.models import EmissionFactor
+from carbon_app.recalculation import (
+    DEFAULT_CHECKPOINT, DEFAULT_CHUNK_SIZE, factor_keys, read_checkpoint, recalculate,
+)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает calculated_co2 активностей по текущим коэффициентам '
+            '(пачками, с возобновлением после прерывания)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factor', type=int, action='append',
+                            help='id EmissionFactor, чьи активности пересчитать (можно несколько раз)')
+        parser.add_argument('--all', action='store_true', help='Пересчитать все активности')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Активностей в одной пачке')
+        parser.add_argument('--checkpoint', default=str(DEFAULT_CHECKPOINT), help='Файл с прогрессом')
+        parser.add_argument('--restart', action='store_true', help='Игнорировать сохраненный прогресс')
+        parser.add_argument('--status', action='store_true', help='Показать прогресс последнего запуска и выйти')
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        saved = read_checkpoint(checkpoint)
+
+        if options['status']:
+            if saved is None:
+                self.stdout.write('Пересчет не запускался')
+            else:
+                self.stdout.write(self.describe(saved))
+            return
+
+        pending = saved if saved is not None and not saved.finished else None
+        if options['factor']:
+            factors = list(EmissionFactor.objects.filter(id__in=options['factor']))
+            if len(factors) != len(set(options['factor'])):
+                raise CommandError('Некоторые коэффициенты не найдены')
+            keys = factor_keys(factors)
+        elif options['all']:
+            keys = None
+        elif pending is not None and not options['restart']:
+            keys = pending.keys
+        else:
+            raise CommandError('Укажите --factor или --all')
+
+        # Прерванный запуск продолжается, только если он пересчитывал те же ключи
+        stored_keys = [list(key) for key in keys] if keys is not None else None
+        restart = options['restart'] or pending is None or pending.keys != stored_keys
+        if not restart:
+            self.stdout.write(f'Продолжаем прерванный пересчет с активности id > {pending.last_id}')
+
+        report = recalculate(
+            keys,
+            chunk_size=options['chunk_size'],
+            checkpoint=checkpoint,
+            restart=restart,
+            progress=lambda report: self.stdout.write(self.describe(report)),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Пересчитано {report.processed} активностей, изменено {report.updated}, '
+            f'пользователей: {len(report.users)}, время: {report.elapsed:.2f} с'
+        ))
+
+    def describe(self, report):
+        state = 'завершен' if report.finished else f'id <= {report.last_id}'
+        return (f'{report.processed}/{report.total} ({report.percent}%), изменено {report.updated}, '
+                f'{report.elapsed:.1f} с — {state}')
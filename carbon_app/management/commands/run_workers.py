@@ -0,0 +1,55 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from carbon_app.reports import POLL_INTERVAL, work, worker_name
+
+
+def init_worker():
+    """Инициализация Django в дочернем процессе пула"""
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'carbon_project.settings')
+    django.setup()
+
+
+def run_worker(index, once, poll):
+    return work(f'{worker_name()}#{index}', once=once, poll=poll)
+
+
+class Command(BaseCommand):
+    help = 'Выполняет задания на отчеты и выгрузки (ReportJob) и отложенные обновления рекомендаций в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Число процессов-обработчиков')
+        parser.add_argument('--once', action='store_true', help='Завершиться, когда очередь опустеет')
+        parser.add_argument('--poll', type=float, default=POLL_INTERVAL, help='Пауза при пустой очереди, секунд')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        once = options['once']
+        poll = options['poll']
+        started = time.perf_counter()
+        self.stdout.write(f'Обработчиков: {workers}' + ('' if once else ' (Ctrl+C — остановить)'))
+
+        try:
+            if workers == 1:
+                results = [run_worker(0, once, poll)]
+            else:
+                # Соединения родителя не должны наследоваться дочерними процессами
+                connections.close_all()
+                with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+                    results = list(pool.map(run_worker, range(workers), [once] * workers, [poll] * workers))
+        except KeyboardInterrupt:
+            # Прерванные задания вернутся в очередь по истечении STALE_AFTER
+            self.stdout.write(self.style.WARNING('Остановлено'))
+            return
+
+        done = sum(result[0] for result in results)
+        failed = sum(result[1] for result in results)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Готово заданий: {done}, с ошибкой: {failed}, время: {time.perf_counter() - started:.2f} с'
+        ))
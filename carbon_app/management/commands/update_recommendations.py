@@ -0,0 +1,167 @@
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from carbon_app.models import UserRecommendation
+from carbon_app.scoring import load_catalog, pick_recommendations
+
+INITIAL_RECOMMENDATIONS = 5
+REFRESH_AFTER_DAYS = 14
+DEFAULT_CHECKPOINT = Path(settings.BASE_DIR) / '.update_recommendations.json'
+
+
+def init_worker():
+    """Инициализация Django в дочернем процессе пула"""
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'carbon_project.settings')
+    django.setup()
+    # Если родитель все же успел открыть соединение до fork, дескриптор
+    # отбрасывается без close(): закрытие в дочернем процессе оборвало бы
+    # соединение родителя (PostgreSQL) — процесс откроет свое
+    for conn in connections.all(initialized_only=True):
+        conn.connection = None
+
+
+def process_chunk(user_ids, catalog, now):
+    """Обновляет рекомендации для пачки пользователей.
+
+    Вместо нескольких запросов на пользователя — несколько запросов на пачку
+    (дата последней рекомендации, доли категорий, уже назначенные пары) и
+    один bulk_create. Новая рекомендация выбирается по оценке scoring.py для
+    всей матрицы пользователи × рекомендации; пользователю без выбросов за
+    окно достается случайная из еще не назначенных.
+    Возвращает (число начальных назначений, число новых рекомендаций).
+    """
+    catalog_ids = catalog.ids_list
+    rng = random.Random()
+    threshold = now - timedelta(days=REFRESH_AFTER_DAYS)
+
+    last_created = dict(
+        UserRecommendation.objects.filter(user_id__in=user_ids)
+        .values('user_id')
+        .annotate(last=Max('created_at'))
+        .values_list('user_id', 'last')
+    )
+    new_users = [user_id for user_id in user_ids if user_id not in last_created]
+    due_users = [user_id for user_id, last in last_created.items() if last < threshold]
+
+    picks = pick_recommendations(due_users, limit=1, catalog=catalog, today=timezone.localdate(now))
+    unscored = [user_id for user_id in due_users if not picks[user_id]]
+    assigned = {user_id: set() for user_id in unscored}
+    for user_id, rec_id in UserRecommendation.objects.filter(user_id__in=unscored).values_list(
+        'user_id', 'recommendation_id'
+    ):
+        assigned[user_id].add(rec_id)
+
+    to_create = []
+    for user_id in new_users:
+        sample = rng.sample(catalog_ids, min(INITIAL_RECOMMENDATIONS, len(catalog_ids)))
+        to_create.extend(
+            UserRecommendation(user_id=user_id, recommendation_id=rec_id, is_viewed=False)
+            for rec_id in sample
+        )
+
+    added = 0
+    for user_id in due_users:
+        if picks[user_id]:
+            to_create.append(
+                UserRecommendation(user_id=user_id, recommendation_id=picks[user_id][0], is_viewed=False)
+            )
+            added += 1
+            continue
+        available = [rec_id for rec_id in catalog_ids if rec_id not in assigned[user_id]]
+        if available:
+            to_create.append(
+                UserRecommendation(user_id=user_id, recommendation_id=rng.choice(available), is_viewed=False)
+            )
+            added += 1
+
+    with transaction.atomic():
+        # Ту же пару (user, recommendation) мог только что создать веб-процесс
+        # (update_user_recommendations) — дубликат пропускается, а не роняет пачку
+        UserRecommendation.objects.bulk_create(to_create, ignore_conflicts=True)
+
+    return len(new_users), added
+
+
+class Command(BaseCommand):
+    help = 'Обновляет рекомендации для всех пользователей (пачками, с возобновлением после прерывания)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Пользователей в одной пачке')
+        parser.add_argument('--workers', type=int, default=1, help='Число процессов (для PostgreSQL)')
+        parser.add_argument('--checkpoint', default=str(DEFAULT_CHECKPOINT), help='Файл с прогрессом')
+        parser.add_argument('--restart', action='store_true', help='Игнорировать сохраненный прогресс')
+
+    def handle(self, *args, **options):
+        checkpoint = Path(options['checkpoint'])
+        chunk_size = options['chunk_size']
+        workers = max(1, options['workers'])
+
+        last_id = 0
+        if checkpoint.exists() and not options['restart']:
+            last_id = json.loads(checkpoint.read_text())['last_user_id']
+            self.stdout.write(f'Продолжаем с пользователя id > {last_id}')
+
+        catalog = load_catalog()
+        now = timezone.now()
+        started = time.perf_counter()
+        users = initial = added = 0
+
+        pool = None
+        if workers > 1:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+
+        try:
+            while True:
+                # Одна «волна» — по пачке на каждый процесс
+                chunks = []
+                for _ in range(workers):
+                    ids = list(
+                        User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+                    )
+                    if not ids:
+                        break
+                    chunks.append(ids)
+                    last_id = ids[-1]
+                if not chunks:
+                    break
+
+                if pool:
+                    # Процессы пула создаются (fork) при постановке задач, а выборка
+                    # id выше снова открыла соединение: дочерние процессы не должны
+                    # его унаследовать
+                    connections.close_all()
+                    results = list(pool.map(process_chunk, chunks, [catalog] * len(chunks), [now] * len(chunks)))
+                else:
+                    results = [process_chunk(ids, catalog, now) for ids in chunks]
+
+                users += sum(len(ids) for ids in chunks)
+                initial += sum(r[0] for r in results)
+                added += sum(r[1] for r in results)
+                checkpoint.write_text(json.dumps({'last_user_id': last_id}))
+                self.stdout.write(f'Обработано {users} пользователей (id <= {last_id})')
+        finally:
+            if pool:
+                pool.shutdown()
+
+        checkpoint.unlink(missing_ok=True)
+        elapsed = time.perf_counter() - started
+        rate = users / elapsed if elapsed else 0
+        self.stdout.write(
+            f'Пользователей: {users}, начальные назначения: {initial}, новых рекомендаций: {added}, '
+            f'время: {elapsed:.2f} с ({rate:.0f} пользователей/с)'
+        )
+        self.stdout.write(self.style.SUCCESS('✅ Рекомендации обновлены'))
@@ -0,0 +1,220 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connections
+
+# Границы корзин гистограммы задержки, в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class ViewStats:
+    __slots__ = ('requests', 'errors', 'latency_sum', 'buckets', 'sql_queries', 'sql_seconds')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.latency_sum = 0.0
+        # Последняя корзина — +Inf
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+
+
+class MetricsRegistry:
+    """Счетчики по представлениям в памяти процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view, latency, sql_queries, sql_seconds, error=False):
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                stats = self._views[view] = ViewStats()
+            stats.requests += 1
+            stats.errors += error
+            stats.latency_sum += latency
+            stats.buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+            stats.sql_queries += sql_queries
+            stats.sql_seconds += sql_seconds
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+    def snapshot(self):
+        with self._lock:
+            return {view: (stats.requests, stats.errors, stats.latency_sum, list(stats.buckets),
+                           stats.sql_queries, stats.sql_seconds)
+                    for view, stats in self._views.items()}
+
+    def render(self):
+        """Текстовый формат экспозиции Prometheus"""
+        views = sorted(self.snapshot().items())
+        lines = [
+            '# HELP carbon_view_requests_total Число запросов к представлению.',
+            '# TYPE carbon_view_requests_total counter',
+        ]
+        lines += [f'carbon_view_requests_total{{view="{view}"}} {s[0]}' for view, s in views]
+
+        lines += [
+            '# HELP carbon_view_errors_total Число ответов с кодом 5xx.',
+            '# TYPE carbon_view_errors_total counter',
+        ]
+        lines += [f'carbon_view_errors_total{{view="{view}"}} {s[1]}' for view, s in views]
+
+        lines += [
+            '# HELP carbon_view_latency_seconds Время обработки запроса.',
+            '# TYPE carbon_view_latency_seconds histogram',
+        ]
+        for view, (requests, _, latency_sum, buckets, _, _) in views:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, buckets):
+                cumulative += count
+                lines.append(f'carbon_view_latency_seconds_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+            lines.append(f'carbon_view_latency_seconds_bucket{{view="{view}",le="+Inf"}} {requests}')
+            lines.append(f'carbon_view_latency_seconds_sum{{view="{view}"}} {latency_sum:.6f}')
+            lines.append(f'carbon_view_latency_seconds_count{{view="{view}"}} {requests}')
+
+        lines += [
+            '# HELP carbon_view_sql_queries_total Число SQL-запросов, выполненных представлением.',
+            '# TYPE carbon_view_sql_queries_total counter',
+        ]
+        lines += [f'carbon_view_sql_queries_total{{view="{view}"}} {s[4]}' for view, s in views]
+
+        lines += [
+            '# HELP carbon_view_sql_seconds_total Суммарное время SQL-запросов представления.',
+            '# TYPE carbon_view_sql_seconds_total counter',
+        ]
+        lines += [f'carbon_view_sql_seconds_total{{view="{view}"}} {s[5]:.6f}' for view, s in views]
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+
+
+def render_factor_stats(stats):
+    """Счетчики поиска коэффициентов (FactorIndex.stats) в формате Prometheus"""
+    lines = [
+        '# HELP carbon_factor_lookups_total Поиск коэффициента по исходу.',
+        '# TYPE carbon_factor_lookups_total counter',
+        f'carbon_factor_lookups_total{{result="exact"}} {stats["hits"]}',
+        f'carbon_factor_lookups_total{{result="converted"}} {stats["conversions"]}',
+        f'carbon_factor_lookups_total{{result="fallback"}} {stats["misses"]}',
+        '# HELP carbon_factor_index_loads_total Число сборок реестра коэффициентов.',
+        '# TYPE carbon_factor_index_loads_total counter',
+        f'carbon_factor_index_loads_total {stats["loads"]}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def render_queue_stats(name, stats):
+    """Счетчики фоновой очереди (CoalescingQueue.stats) в формате Prometheus"""
+    lines = [
+        '# HELP carbon_task_queue_pending Задачи, ожидающие выполнения.',
+        '# TYPE carbon_task_queue_pending gauge',
+        f'carbon_task_queue_pending{{queue="{name}"}} {stats["pending"]}',
+        '# HELP carbon_task_queue_total Задачи очереди по исходу.',
+        '# TYPE carbon_task_queue_total counter',
+    ]
+    for result in ('enqueued', 'coalesced', 'processed', 'failed'):
+        lines.append(f'carbon_task_queue_total{{queue="{name}",result="{result}"}} {stats[result]}')
+    return '\n'.join(lines) + '\n'
+
+
+class QueryCounter:
+    """Обертка connection.execute_wrapper: считает запросы и их время"""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+
+def install_counter(stack, counter):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(counter))
+
+
+class MetricsMiddleware:
+    """Замеряет задержку и SQL для каждого именованного маршрута.
+
+    Поддерживает оба режима: под ASGI цепочка не переключается в поток
+    ради синхронного middleware, и async-представления остаются в цикле событий.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        started = time.perf_counter()
+        response = None
+        stack = ExitStack()
+        try:
+            install_counter(stack, counter)
+            response = self.get_response(request)
+            return response
+        finally:
+            if not self.defer(request, stack, counter, started, response):
+                stack.close()
+                self.record(request, counter, started, response)
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        response = None
+        stack = ExitStack()
+        # Асинхронный ORM выполняет запросы в отдельном потоке со своими
+        # соединениями — обертка ставится и снимается в том же потоке
+        await sync_to_async(install_counter)(stack, counter)
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            if not self.defer(request, stack, counter, started, response):
+                await sync_to_async(stack.close)()
+                self.record(request, counter, started, response)
+
+    def defer(self, request, stack, counter, started, response):
+        """Откладывает замер потокового ответа до его закрытия.
+
+        Тело StreamingHttpResponse/FileResponse читается сервером уже после
+        выхода из middleware, и запросы генератора выполняются тогда же.
+        Сервер закрывает ответ в том потоке, где читал тело (под ASGI —
+        через sync_to_async, как и install_counter), поэтому обертка
+        снимается там же.
+        """
+        if response is None or not response.streaming:
+            return False
+
+        def finish():
+            stack.close()
+            self.record(request, counter, started, response)
+
+        response._resource_closers.append(finish)
+        return True
+
+    def record(self, request, counter, started, response):
+        latency = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unresolved'
+        error = response is None or response.status_code >= 500
+        metrics_registry.record(view, latency, counter.queries, counter.seconds, error=error)
@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-18 19:41
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carbon_app', '0005_alter_recommendation_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='useractivity',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.localdate, verbose_name='Дата'),
+        ),
+    ]
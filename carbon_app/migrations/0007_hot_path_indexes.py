@@ -0,0 +1,69 @@
+# Generated by Django 4.2 on 2026-10-18 19:46
+
+from django.db import migrations, models
+
+
+def remove_duplicates(apps, schema_editor):
+    """Удаляет дубли перед добавлением уникальных ограничений"""
+    EmissionFactor = apps.get_model('carbon_app', 'EmissionFactor')
+    UserRecommendation = apps.get_model('carbon_app', 'UserRecommendation')
+
+    seen = set()
+    duplicates = []
+    for factor in EmissionFactor.objects.order_by('id').values('id', 'activity_type', 'category_id', 'unit', 'region'):
+        key = (factor['activity_type'], factor['category_id'], factor['unit'], factor['region'])
+        if key in seen:
+            duplicates.append(factor['id'])
+        seen.add(key)
+    EmissionFactor.objects.filter(id__in=duplicates).delete()
+
+    # Для рекомендаций оставляем самую раннюю запись, перенося на нее отметки
+    kept = {}
+    duplicates = []
+    for rec in UserRecommendation.objects.order_by('id'):
+        key = (rec.user_id, rec.recommendation_id)
+        if key not in kept:
+            kept[key] = rec
+            continue
+        first = kept[key]
+        if (rec.is_viewed and not first.is_viewed) or (rec.is_applied and not first.is_applied):
+            first.is_viewed = first.is_viewed or rec.is_viewed
+            first.is_applied = first.is_applied or rec.is_applied
+            first.save(update_fields=['is_viewed', 'is_applied'])
+        duplicates.append(rec.id)
+    UserRecommendation.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carbon_app', '0006_useractivity_date_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['user', 'date'], name='activity_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['user', 'category', 'date'], name='activity_user_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userrecommendation',
+            index=models.Index(fields=['user', 'created_at'], name='userrec_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userrecommendation',
+            index=models.Index(fields=['user', 'is_viewed'], name='userrec_user_viewed_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='emissionfactor',
+            constraint=models.UniqueConstraint(fields=('activity_type', 'category', 'unit', 'region'), name='unique_emission_factor'),
+        ),
+        migrations.AddConstraint(
+            model_name='userrecommendation',
+            constraint=models.UniqueConstraint(fields=('user', 'recommendation'), name='unique_user_recommendation'),
+        ),
+    ]
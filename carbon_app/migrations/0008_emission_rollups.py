@@ -0,0 +1,91 @@
+# Generated by Django 4.2 on 2026-10-18 19:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('carbon_app', '0007_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeeklyEmission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField(verbose_name='Начало периода')),
+                ('co2_total', models.FloatField(default=0, verbose_name='CO₂ (кг)')),
+                ('activity_count', models.IntegerField(default=0, verbose_name='Активностей')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='carbon_app.activitycategory', verbose_name='Категория')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Выбросы за неделю',
+                'verbose_name_plural': 'Выбросы по неделям',
+                'ordering': ['-period_start'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyEmission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField(verbose_name='Начало периода')),
+                ('co2_total', models.FloatField(default=0, verbose_name='CO₂ (кг)')),
+                ('activity_count', models.IntegerField(default=0, verbose_name='Активностей')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='carbon_app.activitycategory', verbose_name='Категория')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Выбросы за месяц',
+                'verbose_name_plural': 'Выбросы по месяцам',
+                'ordering': ['-period_start'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyEmission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField(verbose_name='Начало периода')),
+                ('co2_total', models.FloatField(default=0, verbose_name='CO₂ (кг)')),
+                ('activity_count', models.IntegerField(default=0, verbose_name='Активностей')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='carbon_app.activitycategory', verbose_name='Категория')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Выбросы за день',
+                'verbose_name_plural': 'Выбросы по дням',
+                'ordering': ['-period_start'],
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='weeklyemission',
+            index=models.Index(fields=['user', 'period_start'], name='weeklyemission_period_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='weeklyemission',
+            constraint=models.UniqueConstraint(fields=('user', 'category', 'period_start'), name='unique_weeklyemission'),
+        ),
+        migrations.AddIndex(
+            model_name='monthlyemission',
+            index=models.Index(fields=['user', 'period_start'], name='monthlyemission_period_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='monthlyemission',
+            constraint=models.UniqueConstraint(fields=('user', 'category', 'period_start'), name='unique_monthlyemission'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyemission',
+            index=models.Index(fields=['user', 'period_start'], name='dailyemission_period_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyemission',
+            constraint=models.UniqueConstraint(fields=('user', 'category', 'period_start'), name='unique_dailyemission'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+BATCH_SIZE = 2000
+# Логика зафиксирована здесь, а не импортирована из carbon_app.rollups:
+# последующие изменения сводных таблиц не должны менять эту миграцию
+GRANULARITIES = (
+    ('DailyEmission', TruncDay),
+    ('WeeklyEmission', TruncWeek),
+    ('MonthlyEmission', TruncMonth),
+)
+
+
+def populate(apps, schema_editor):
+    UserActivity = apps.get_model('carbon_app', 'UserActivity')
+    for model_name, trunc in GRANULARITIES:
+        model = apps.get_model('carbon_app', model_name)
+        model.objects.all().delete()
+        rows = (
+            UserActivity.objects.annotate(period=trunc('date'))
+            .values('user_id', 'category_id', 'period')
+            .annotate(co2_total=Sum('calculated_co2'), activity_count=Count('id'))
+            .order_by()
+        )
+        batch = []
+        for row in rows.iterator(chunk_size=BATCH_SIZE):
+            period = row['period']
+            batch.append(model(
+                user_id=row['user_id'],
+                category_id=row['category_id'],
+                period_start=period.date() if hasattr(period, 'date') else period,
+                co2_total=row['co2_total'] or 0,
+                activity_count=row['activity_count'],
+            ))
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_create(batch)
+                batch = []
+        model.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carbon_app', '0008_emission_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
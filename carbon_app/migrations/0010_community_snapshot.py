@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-18 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carbon_app', '0009_populate_emission_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommunitySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('users_count', models.IntegerField(default=0, verbose_name='Активных пользователей')),
+                ('data', models.JSONField(default=dict, verbose_name='Данные')),
+            ],
+            options={
+                'verbose_name': 'Статистика сообщества',
+                'verbose_name_plural': 'Статистика сообщества',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+import re
+
+from django.db import migrations
+
+# Таблица единиц на момент миграции. Она скопирована, а не импортирована из
+# carbon_app.units: новые синонимы не должны менять уже примененную миграцию
+ALIASES = {
+    'км': ('km', 'километр', 'километра', 'километров', 'kilometer', 'kilometers', 'kilometre', 'kilometres'),
+    'м': ('m', 'метр', 'метра', 'метров', 'meter', 'meters', 'metre', 'metres'),
+    'миля': ('mi', 'mile', 'miles', 'мили', 'миль'),
+    'морская миля': ('nmi', 'морские мили', 'морских миль', 'nautical mile', 'nautical miles'),
+    'фут': ('ft', 'foot', 'feet', 'фута', 'футов'),
+    'кг': ('kg', 'kgs', 'килограмм', 'килограмма', 'килограммов', 'kilogram', 'kilograms'),
+    'г': ('g', 'гр', 'грамм', 'грамма', 'граммов', 'gram', 'grams'),
+    'т': ('t', 'тонна', 'тонны', 'тонн', 'tonne', 'tonnes'),
+    'ц': ('центнер', 'центнера', 'центнеров'),
+    'фунт': ('lb', 'lbs', 'pound', 'pounds', 'фунта', 'фунтов'),
+    'унция': ('oz', 'ounce', 'ounces', 'унции', 'унций'),
+    'л': ('l', 'ltr', 'литр', 'литра', 'литров', 'liter', 'liters', 'litre', 'litres'),
+    'мл': ('ml', 'миллилитр', 'миллилитра', 'миллилитров'),
+    'м³': ('м3', 'm3', 'm³', 'куб.м', 'куб м', 'кубометр', 'кубометра', 'кубометров', 'cbm'),
+    'галлон': ('gal', 'gallon', 'gallons', 'галлона', 'галлонов'),
+    'баррель': ('bbl', 'barrel', 'barrels', 'барреля', 'баррелей'),
+    'кВт·ч': ('kwh', 'kw·h', 'kw*h', 'квт*ч', 'квт.ч', 'квт ч', 'квтч'),
+    'Вт·ч': ('wh', 'w·h', 'вт*ч', 'вт ч'),
+    'МВт·ч': ('mwh', 'mw·h', 'мвт*ч', 'мвт ч'),
+    'ГВт·ч': ('gwh', 'gw·h', 'гвт*ч', 'гвт ч'),
+    'Гкал': ('gcal',),
+    'ккал': ('kcal',),
+    'МДж': ('mj',),
+    'ГДж': ('gj',),
+}
+
+_SEPARATORS = re.compile(r'[\s.·⋅*^\-]+')
+
+
+def clean_unit(text):
+    return _SEPARATORS.sub('', text.strip().lower())
+
+
+def normalize_units(apps, schema_editor):
+    table = {
+        clean_unit(alias): canonical
+        for canonical, aliases in ALIASES.items()
+        for alias in (canonical, *aliases)
+    }
+    UserActivity = apps.get_model('carbon_app', 'UserActivity')
+    for unit in UserActivity.objects.values_list('unit', flat=True).distinct().order_by():
+        stripped = (unit or '').strip()
+        canonical = table.get(clean_unit(stripped), stripped)
+        if canonical != unit:
+            UserActivity.objects.filter(unit=unit).update(unit=canonical)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carbon_app', '0011_user_profile'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_units, migrations.RunPython.noop),
+    ]
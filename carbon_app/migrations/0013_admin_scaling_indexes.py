@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-18 20:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carbon_app', '0012_normalize_activity_units'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['date', 'id'], name='activity_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userrecommendation',
+            index=models.Index(fields=['created_at', 'id'], name='userrec_created_idx'),
+        ),
+    ]
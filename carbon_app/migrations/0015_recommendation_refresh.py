@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-18 20:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('carbon_app', '0014_report_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationRefresh',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('requested_at', models.DateTimeField(auto_now_add=True, verbose_name='Запрошено')),
+            ],
+            options={
+                'verbose_name': 'Обновление рекомендаций',
+                'verbose_name_plural': 'Обновления рекомендаций',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recommendationrefresh',
+            index=models.Index(fields=['requested_at'], name='recrefresh_requested_idx'),
+        ),
+    ]
@@ -1,6 +1,7 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 
 class ActivityCategory(models.Model):
     """Категория активности (транспорт, питание, энергия)"""
@@ -30,10 +31,41 @@ class EmissionFactor(models.Model):
         verbose_name = "Коэффициент выбросов"
         verbose_name_plural = "Коэффициенты выбросов"
         ordering = ['category', 'activity_type']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['activity_type', 'category', 'unit', 'region'],
+                name='unique_emission_factor',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.activity_type} ({self.co2_per_unit} кг/{self.unit})"
 
+class UserProfile(models.Model):
+    """Профиль пользователя: регион для выбора коэффициентов выбросов"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile', verbose_name="Пользователь")
+    region = models.CharField(
+        max_length=50, default="global", verbose_name="Регион",
+        help_text="Код ISO 3166: страна (RU) или субъект (RU-MOW)",
+    )
+    
+    class Meta:
+        verbose_name = "Профиль пользователя"
+        verbose_name_plural = "Профили пользователей"
+    
+    def save(self, *args, **kwargs):
+        from .factors import normalize_region
+
+        self.region = normalize_region(self.region)
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"{self.user.username} ({self.region})"
+
+# Поля активности, определяющие ее вклад в сводные таблицы выбросов
+ROLLUP_FIELDS = ('user_id', 'category_id', 'date', 'calculated_co2')
+
+
 class UserActivity(models.Model):
     """Активность пользователя с расчетом CO₂"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
@@ -41,7 +73,7 @@ class UserActivity(models.Model):
     activity_type = models.CharField(max_length=100, verbose_name="Тип активности")
     quantity = models.FloatField(verbose_name="Количество", validators=[MinValueValidator(0.1)])
     unit = models.CharField(max_length=20, verbose_name="Единица измерения")
-    date = models.DateField(auto_now_add=True, verbose_name="Дата")
+    date = models.DateField(default=timezone.localdate, verbose_name="Дата")
     calculated_co2 = models.FloatField(verbose_name="Рассчитанный CO₂ (кг)", editable=False, default=0)
     notes = models.TextField(verbose_name="Заметки", blank=True)
     
@@ -49,21 +81,43 @@ class UserActivity(models.Model):
         verbose_name = "Активность пользователя"
         verbose_name_plural = "Активности пользователей"
         ordering = ['-date']
+        indexes = [
+            # Дашборд, список с пагинацией по (date, id), экспорт
+            models.Index(fields=['user', 'date'], name='activity_user_date_idx'),
+            # Фильтр списка по категории
+            models.Index(fields=['user', 'category', 'date'], name='activity_user_category_idx'),
+            # Админка: сортировка по дате без фильтра по пользователю, MIN/MAX для date_hierarchy
+            models.Index(fields=['date', 'id'], name='activity_date_idx'),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Значения из БД нужны сводным таблицам, чтобы вычесть старый вклад.
+        # Если часть полей отложена (only/defer), их дочитает сигнал pre_save.
+        key = tuple(instance.__dict__.get(name) for name in ROLLUP_FIELDS)
+        instance._rollup_loaded = None if None in key else key
+        return instance
+    
+    def rollup_key(self):
+        """(user_id, category_id, date, calculated_co2) — вклад строки в сводные таблицы"""
+        return tuple(getattr(self, name) for name in ROLLUP_FIELDS)
     
     def save(self, *args, **kwargs):
         """Автоматический расчет CO₂ при сохранении"""
-        try:
-            # Пытаемся найти коэффициент для данного типа активности
-            factor = EmissionFactor.objects.get(
-                activity_type=self.activity_type,
-                category=self.category,
-                unit=self.unit
-            )
-            self.calculated_co2 = self.quantity * factor.co2_per_unit
-        except EmissionFactor.DoesNotExist:
-            # Значение по умолчанию для демонстрации
-            self.calculated_co2 = self.quantity * 2.5
-        super().save(*args, **kwargs)
+        from .factors import factor_index, user_region
+        from .units import normalize_unit
+
+        # «km», «KM», «километров» → «км», иначе коэффициент не найдется
+        self.unit = normalize_unit(self.unit)
+        # Коэффициент берется из процессного реестра, регион — из кэша профиля
+        co2_per_unit = factor_index.resolve(
+            self.activity_type, self.category_id, self.unit, region=user_region(self.user_id),
+        )
+        self.calculated_co2 = self.quantity * co2_per_unit
+        # Сводные таблицы обновляются сигналом post_save в той же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.user.username}: {self.activity_type} ({self.date}) - {self.calculated_co2} кг CO₂"
@@ -123,6 +177,146 @@ class UserRecommendation(models.Model):
         verbose_name = "Рекомендация пользователя"
         verbose_name_plural = "Рекомендации пользователей"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='userrec_user_created_idx'),
+            models.Index(fields=['user', 'is_viewed'], name='userrec_user_viewed_idx'),
+            models.Index(fields=['created_at', 'id'], name='userrec_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recommendation'], name='unique_user_recommendation'),
+        ]
     
     def __str__(self):
         return f"{self.user.username}: {self.recommendation.title}"
+
+
+
+class EmissionRollup(models.Model):
+    """Сумма и число активностей пользователя по категории за период"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
+    category = models.ForeignKey(ActivityCategory, on_delete=models.CASCADE, verbose_name="Категория")
+    period_start = models.DateField(verbose_name="Начало периода")
+    co2_total = models.FloatField(default=0, verbose_name="CO₂ (кг)")
+    activity_count = models.IntegerField(default=0, verbose_name="Активностей")
+    
+    class Meta:
+        abstract = True
+        ordering = ['-period_start']
+        indexes = [
+            models.Index(fields=['user', 'period_start'], name='%(class)s_period_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category', 'period_start'], name='unique_%(class)s'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id}/{self.category_id} {self.period_start}: {self.co2_total} кг CO₂"
+
+
+class DailyEmission(EmissionRollup):
+    """Выбросы за день"""
+    
+    class Meta(EmissionRollup.Meta):
+        verbose_name = "Выбросы за день"
+        verbose_name_plural = "Выбросы по дням"
+
+
+class WeeklyEmission(EmissionRollup):
+    """Выбросы за ISO-неделю (period_start — понедельник)"""
+    
+    class Meta(EmissionRollup.Meta):
+        verbose_name = "Выбросы за неделю"
+        verbose_name_plural = "Выбросы по неделям"
+
+
+class MonthlyEmission(EmissionRollup):
+    """Выбросы за месяц (period_start — первое число)"""
+    
+    class Meta(EmissionRollup.Meta):
+        verbose_name = "Выбросы за месяц"
+        verbose_name_plural = "Выбросы по месяцам"
+
+
+class CommunitySnapshot(models.Model):
+    """Снимок статистики сообщества: средние и гистограммы выбросов пользователей.
+
+    Формат data описан в community.py.
+    """
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+    users_count = models.IntegerField(default=0, verbose_name="Активных пользователей")
+    data = models.JSONField(default=dict, verbose_name="Данные")
+    
+    class Meta:
+        verbose_name = "Статистика сообщества"
+        verbose_name_plural = "Статистика сообщества"
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Снимок {self.created_at:%d.%m.%Y %H:%M} ({self.users_count} польз.)"
+
+
+class RecommendationRefresh(models.Model):
+    """Отложенное обновление рекомендаций пользователя (см. tasks.py).
+
+    Строка живет, пока обновление не выполнено: ее удаляет тот, кто
+    выполняет обновление, — фоновый поток веб-процесса или run_workers.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, verbose_name="Пользователь")
+    requested_at = models.DateTimeField(auto_now_add=True, verbose_name="Запрошено")
+    
+    class Meta:
+        verbose_name = "Обновление рекомендаций"
+        verbose_name_plural = "Обновления рекомендаций"
+        indexes = [
+            models.Index(fields=['requested_at'], name='recrefresh_requested_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Обновить рекомендации {self.user_id}"
+
+
+class ReportJob(models.Model):
+    """Задание на фоновую выгрузку или отчет; выполняется командой run_workers (см. reports.py)"""
+    KIND_CHOICES = [
+        ('export_csv', 'Выгрузка активностей (CSV)'),
+        ('export_ndjson', 'Выгрузка активностей (NDJSON)'),
+        ('yearly_html', 'Годовой отчет (HTML)'),
+    ]
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Готов'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Тип")
+    params = models.JSONField(default=dict, blank=True, verbose_name="Параметры")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Статус")
+    progress = models.PositiveSmallIntegerField(default=0, verbose_name="Прогресс, %")
+    rows = models.PositiveIntegerField(default=0, verbose_name="Строк")
+    file_name = models.CharField(max_length=255, blank=True, verbose_name="Файл")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    worker = models.CharField(max_length=100, blank=True, verbose_name="Обработчик")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начато")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="Последний отклик")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершено")
+    
+    class Meta:
+        verbose_name = "Задание на отчет"
+        verbose_name_plural = "Задания на отчеты"
+        ordering = ['-created_at']
+        indexes = [
+            # Выбор следующего задания обработчиком
+            models.Index(fields=['status', 'created_at'], name='reportjob_status_idx'),
+            models.Index(fields=['user', 'created_at'], name='reportjob_user_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} для {self.user_id} ({self.get_status_display()})"
@@ -0,0 +1,110 @@
+import base64
+from datetime import date
+from functools import cached_property
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Больше стольких строк точно не считаем: COUNT(*) ограничивается LIMIT
+COUNT_LIMIT = getattr(settings, 'ADMIN_COUNT_LIMIT', 10000)
+
+
+class InvalidCursor(ValueError):
+    """Курсор пагинации поврежден или подделан"""
+
+
+def encode_cursor(activity_date, activity_id):
+    raw = f'{activity_date.isoformat()}|{activity_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw_date, raw_id = base64.urlsafe_b64decode(padded).decode().split('|')
+        return date.fromisoformat(raw_date), int(raw_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+
+
+class KeysetPage:
+    """Страница активностей с пагинацией по ключу (date, id).
+
+    Вместо OFFSET используется условие «строго после последней строки
+    предыдущей страницы», поэтому N-я страница стоит столько же, сколько
+    первая: индекс (user, date) сразу находит начало выборки.
+    """
+
+    def __init__(self, queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+        self.page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        queryset = queryset.order_by('-date', '-id')
+        if cursor:
+            cursor_date, cursor_id = decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(date__lt=cursor_date) | Q(date=cursor_date, id__lt=cursor_id)
+            )
+        # Лишняя строка нужна только чтобы понять, есть ли следующая страница
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.object_list = rows[:self.page_size]
+
+    @property
+    def next_cursor(self):
+        if not self.has_next:
+            return None
+        last = self.object_list[-1]
+        return encode_cursor(last.date, last.id)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def table_row_estimate(model, using='default'):
+    """Число строк таблицы по статистике СУБД без сканирования или None.
+
+    PostgreSQL хранит оценку в pg_class.reltuples, MySQL — в
+    information_schema; для SQLite оценки нет.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)'
+    elif connection.vendor == 'mysql':
+        sql = 'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s'
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+    # reltuples = -1, пока таблицу ни разу не анализировали
+    return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator без полного COUNT(*) для больших таблиц.
+
+    Без фильтров берется оценка из статистики СУБД, если она больше
+    COUNT_LIMIT. Иначе строки считаются подзапросом с LIMIT COUNT_LIMIT,
+    поэтому стоимость подсчета ограничена при любом размере таблицы.
+    Число в пагинации тогда приблизительное: страницы дальше COUNT_LIMIT
+    строк отфильтрованного списка недоступны, по оценке последняя страница
+    может оказаться пустой.
+    """
+
+    count_limit = COUNT_LIMIT
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.has_filters():
+            estimate = table_row_estimate(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.count_limit:
+                return estimate
+        return queryset.values('pk')[:self.count_limit].count()
@@ -0,0 +1,242 @@
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import rollups
+from .cache import bump_dashboard_version
+from .factors import GLOBAL_REGION, factor_index, normalize_region
+from .models import UserActivity, UserProfile
+
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_CHECKPOINT = Path(settings.BASE_DIR) / '.recalculate_co2.json'
+TOLERANCE = 1e-9
+
+ACTIVITY_FIELDS = ('id', 'user_id', 'category_id', 'date', 'activity_type', 'unit', 'quantity', 'calculated_co2')
+
+_background_lock = threading.Lock()
+
+
+@dataclass
+class RecalculationReport:
+    """Прогресс пересчета; сохраняется в файл контрольной точки после каждой пачки"""
+    keys: list = None
+    last_id: int = 0
+    total: int = 0
+    processed: int = 0
+    updated: int = 0
+    users: set = field(default_factory=set)
+    elapsed: float = 0.0
+    finished: bool = False
+
+    def as_checkpoint(self):
+        return {
+            'keys': self.keys,
+            'last_id': self.last_id,
+            'total': self.total,
+            'processed': self.processed,
+            'updated': self.updated,
+            'elapsed': round(self.elapsed, 3),
+            'finished': self.finished,
+            'saved_at': timezone.now().isoformat(),
+        }
+
+    @classmethod
+    def from_checkpoint(cls, data):
+        return cls(
+            keys=data['keys'],
+            last_id=data['last_id'],
+            total=data['total'],
+            processed=data['processed'],
+            updated=data['updated'],
+            elapsed=data['elapsed'],
+            finished=data['finished'],
+        )
+
+    @property
+    def percent(self):
+        return round(self.processed / self.total * 100, 1) if self.total else 100.0
+
+
+def read_checkpoint(path=DEFAULT_CHECKPOINT):
+    path = Path(path)
+    if not path.exists():
+        return None
+    return RecalculationReport.from_checkpoint(json.loads(path.read_text()))
+
+
+def write_checkpoint(report, path=DEFAULT_CHECKPOINT):
+    path = Path(path)
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(report.as_checkpoint(), ensure_ascii=False))
+    # Замена атомарна: прерванный процесс не оставит полузаписанный файл
+    tmp.replace(path)
+
+
+def factor_keys(factors):
+    """Ключи (activity_type, category_id, unit), на которые влияют коэффициенты.
+
+    Коэффициент из БД попадает в каталог раздела units.json и действует для
+    всех категорий этого раздела (см. build_registry), поэтому кроме самой
+    категории берутся и ее «соседи» по разделу.
+    """
+    registry = factor_index.registry
+    by_slug = {}
+    for category_id, slug in registry.category_slugs.items():
+        by_slug.setdefault(slug, []).append(category_id)
+
+    keys = set()
+    for factor in factors:
+        slug = registry.category_slugs.get(factor.category_id)
+        for category_id in by_slug.get(slug, [factor.category_id]):
+            keys.add((factor.activity_type, category_id, factor.unit))
+    return sorted(keys)
+
+
+def affected_activities(keys):
+    """Активности с указанными ключами (все активности, если keys is None).
+
+    Единица не сравнивается: активность в милях считается по коэффициенту
+    для км (см. FactorRegistry.resolve_outcome).
+    """
+    activities = UserActivity.objects.all()
+    if keys is not None:
+        condition = Q(pk__in=[])
+        for activity_type, category_id in sorted({(key[0], key[1]) for key in keys}):
+            condition |= Q(activity_type=activity_type, category_id=category_id)
+        activities = activities.filter(condition)
+    return activities
+
+
+def user_regions(user_ids):
+    """Регионы пользователей пачки одним запросом (без профиля — global)"""
+    return {
+        user_id: normalize_region(region)
+        for user_id, region in UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', 'region')
+    }
+
+
+def recalculate_chunk(rows, registry):
+    """Пересчитывает пачку строк ACTIVITY_FIELDS.
+
+    Коэффициенты ищутся по уникальным ключам пачки с учетом региона
+    владельца активности, произведение — одна операция NumPy. Возвращает (активности для bulk_update, дельты сводных таблиц).
+    """
+    columns = dict(zip(ACTIVITY_FIELDS, zip(*rows)))
+    regions = user_regions(set(columns['user_id']))
+    keys = [
+        (activity_type, category_id, unit, regions.get(user_id, GLOBAL_REGION))
+        for activity_type, category_id, unit, user_id in zip(
+            columns['activity_type'], columns['category_id'], columns['unit'], columns['user_id'],
+        )
+    ]
+    unique = list(set(keys))
+    factor_for = dict(zip(unique, factor_index.resolve_many(unique, registry=registry)))
+
+    quantities = np.asarray(columns['quantity'], dtype=float)
+    old = np.asarray(columns['calculated_co2'], dtype=float)
+    new = quantities * np.fromiter((factor_for[key] for key in keys), dtype=float, count=len(keys))
+    changed = np.flatnonzero(~np.isclose(new, old, rtol=TOLERANCE, atol=TOLERANCE))
+
+    activities = []
+    deltas = []
+    for index in changed.tolist():
+        value = float(new[index])
+        activities.append(UserActivity(id=columns['id'][index], calculated_co2=value))
+        deltas.append((
+            columns['user_id'][index], columns['category_id'][index], columns['date'][index],
+            value - float(old[index]), 0,
+        ))
+    return activities, deltas
+
+
+def recalculate(keys=None, chunk_size=DEFAULT_CHUNK_SIZE, checkpoint=DEFAULT_CHECKPOINT, restart=False,
+                progress=None):
+    """Пересчитывает calculated_co2 по текущим коэффициентам.
+
+    Активности обходятся по возрастанию id пачками по chunk_size; каждая
+    пачка записывается bulk_update вместе с поправками сводных таблиц в
+    отдельной транзакции, после чего прогресс сохраняется в checkpoint.
+    Если файл остался от прерванного запуска и restart не задан, работа
+    продолжается с сохраненного id и с сохраненными ключами. Повторный
+    пересчет уже обновленной пачки ничего не меняет, поэтому прерывание
+    между коммитом и записью файла безопасно.
+
+    progress(report) вызывается после каждой пачки.
+    """
+    report = None if restart or checkpoint is None else read_checkpoint(checkpoint)
+    if report is None or report.finished:
+        report = RecalculationReport(keys=[list(key) for key in keys] if keys is not None else None)
+        report.total = affected_activities(keys).count()
+    keys = [tuple(key) for key in report.keys] if report.keys is not None else None
+
+    registry = factor_index.registry
+    activities = affected_activities(keys).order_by('id')
+    started = time.perf_counter() - report.elapsed
+
+    while True:
+        rows = list(activities.filter(id__gt=report.last_id).values_list(*ACTIVITY_FIELDS)[:chunk_size])
+        if not rows:
+            break
+
+        changed, deltas = recalculate_chunk(rows, registry)
+        with transaction.atomic():
+            UserActivity.objects.bulk_update(changed, ['calculated_co2'], batch_size=chunk_size)
+            rollups.apply_many(deltas)
+        users = {delta[0] for delta in deltas}
+        for user_id in users:
+            bump_dashboard_version(user_id)
+
+        report.last_id = rows[-1][0]
+        report.processed += len(rows)
+        report.updated += len(changed)
+        report.users |= users
+        report.elapsed = time.perf_counter() - started
+        if checkpoint is not None:
+            write_checkpoint(report, checkpoint)
+        if progress:
+            progress(report)
+
+    report.finished = True
+    report.elapsed = time.perf_counter() - started
+    if checkpoint is not None:
+        write_checkpoint(report, checkpoint)
+    return report
+
+
+def _run_in_background(keys, checkpoint):
+    try:
+        recalculate(keys, checkpoint=checkpoint, restart=True)
+    finally:
+        # Соединения этого потока не закрываются обработчиком запросов
+        connections.close_all()
+        _background_lock.release()
+
+
+def start_background_recalculation(keys, checkpoint=DEFAULT_CHECKPOINT):
+    """Запускает пересчет в фоновом потоке процесса.
+
+    Ключи незавершенного запуска добавляются к новым, и обход начинается
+    заново. Возвращает False, если пересчет в этом процессе уже идет.
+    """
+    if not _background_lock.acquire(blocking=False):
+        return False
+    try:
+        previous = read_checkpoint(checkpoint)
+        if previous is not None and not previous.finished:
+            keys = None if previous.keys is None else sorted({*map(tuple, previous.keys), *keys})
+        thread = threading.Thread(
+            target=_run_in_background, args=(keys, checkpoint), name='recalculate-co2', daemon=True,
+        )
+        thread.start()
+    except BaseException:
+        _background_lock.release()
+        raise
+    return True
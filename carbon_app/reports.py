@@ -0,0 +1,254 @@
+import os
+import socket
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+from .exports import export_filename, export_rows, filter_activities, iter_encoded, iter_export
+from .models import MonthlyEmission, ReportJob, UserActivity
+from .tasks import drain_refreshes
+
+REPORTS_ROOT = Path(getattr(settings, 'REPORTS_ROOT', Path(settings.BASE_DIR) / 'reports'))
+# Пауза обработчика при пустой очереди, секунд
+POLL_INTERVAL = 2.0
+# Задание «выполняется», но обработчик молчит дольше — он считается упавшим
+STALE_AFTER = timedelta(minutes=10)
+MAX_ATTEMPTS = 3
+# Прогресс и отклик обработчика записываются раз в столько строк
+PROGRESS_EVERY = 5000
+# Сколько заданий из начала очереди пробовать захватить без SELECT ... FOR UPDATE
+CLAIM_CANDIDATES = 10
+
+EXPORT_KINDS = {'export_csv': 'csv', 'export_ndjson': 'ndjson'}
+ACTIVE_STATUSES = (ReportJob.STATUS_PENDING, ReportJob.STATUS_RUNNING)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def report_path(file_name):
+    return REPORTS_ROOT / file_name
+
+
+def job_status(job):
+    """Состояние задания для JSON-ответа страницы отчетов"""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'progress': job.progress,
+        'rows': job.rows,
+        'error': job.error,
+        'download_url': reverse('download_report', args=[job.id]) if job.status == ReportJob.STATUS_DONE else None,
+    }
+
+
+def create_job(user, kind, params):
+    """Ставит задание в очередь; такое же незавершенное задание не дублируется.
+
+    Возвращает (задание, создано ли новое).
+    """
+    existing = ReportJob.objects.filter(user=user, kind=kind, params=params, status__in=ACTIVE_STATUSES).first()
+    if existing:
+        return existing, False
+    return ReportJob.objects.create(user=user, kind=kind, params=params), True
+
+
+def claim_job(worker):
+    """Захватывает самое старое задание из очереди или возвращает None.
+
+    В PostgreSQL строка блокируется SELECT ... FOR UPDATE SKIP LOCKED:
+    параллельные обработчики не ждут друг друга и не берут одно задание.
+    В SQLite блокировок строк нет, поэтому захват — условный UPDATE
+    «status = pending → running»: запись в SQLite последовательна, и
+    строку обновит только один из обработчиков.
+    """
+    pending = ReportJob.objects.filter(status=ReportJob.STATUS_PENDING).order_by('created_at', 'id')
+    now = timezone.now()
+    claim = {
+        'status': ReportJob.STATUS_RUNNING,
+        'worker': worker,
+        'started_at': now,
+        'heartbeat_at': now,
+        'attempts': F('attempts') + 1,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job_id = pending.select_for_update(skip_locked=True).values_list('id', flat=True).first()
+            if job_id is None:
+                return None
+            ReportJob.objects.filter(id=job_id).update(**claim)
+        return ReportJob.objects.get(id=job_id)
+
+    for job_id in pending.values_list('id', flat=True)[:CLAIM_CANDIDATES]:
+        if ReportJob.objects.filter(id=job_id, status=ReportJob.STATUS_PENDING).update(**claim):
+            return ReportJob.objects.get(id=job_id)
+    return None
+
+
+def requeue_stale(now=None):
+    """Возвращает в очередь задания упавших обработчиков (после MAX_ATTEMPTS — ошибка)"""
+    now = now or timezone.now()
+    stale = ReportJob.objects.filter(status=ReportJob.STATUS_RUNNING, heartbeat_at__lt=now - STALE_AFTER)
+    failed = stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=ReportJob.STATUS_FAILED, error='Обработчик не отвечает', finished_at=now,
+    )
+    requeued = stale.update(status=ReportJob.STATUS_PENDING, worker='', progress=0)
+    return requeued, failed
+
+
+def set_progress(job, rows, total):
+    job.rows = rows
+    job.progress = min(99, rows * 100 // total) if total else 0
+    ReportJob.objects.filter(id=job.id).update(rows=job.rows, progress=job.progress, heartbeat_at=timezone.now())
+
+
+def write_file(file_name, chunks):
+    """Записывает куски bytes во временный файл и атомарно переименовывает"""
+    path = report_path(file_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    tmp.replace(path)
+
+
+def build_export(job):
+    """Выгрузка активностей в CSV/NDJSON потоково, как и /activities/export/"""
+    fmt = EXPORT_KINDS[job.kind]
+    filters = job.params.get('filters', {})
+    compress = bool(job.params.get('gzip'))
+    activities = filter_activities(UserActivity.objects.filter(user_id=job.user_id), filters)
+    total = activities.count()
+
+    def tracked(rows):
+        for count, row in enumerate(rows, start=1):
+            yield row
+            if count % PROGRESS_EVERY == 0:
+                set_progress(job, count, total)
+        set_progress(job, total, total)
+
+    file_name = f'{job.id}/{export_filename(fmt, filters, compress)}'
+    write_file(file_name, iter_encoded(iter_export(tracked(export_rows(activities)), fmt), compress=compress))
+    return file_name
+
+
+def yearly_context(user, year):
+    """Данные годового отчета: помесячно и по категориям из сводной таблицы, топ типов активности"""
+    start, end = date(year, 1, 1), date(year, 12, 31)
+    rollups = list(
+        MonthlyEmission.objects.filter(user=user, period_start__gte=start, period_start__lte=end)
+        .values_list('period_start', 'category__name', 'co2_total', 'activity_count')
+    )
+    months = [{'month': date(year, month, 1), 'co2': 0.0, 'count': 0} for month in range(1, 13)]
+    categories = {}
+    for period_start, category, co2, count in rollups:
+        months[period_start.month - 1]['co2'] += co2
+        months[period_start.month - 1]['count'] += count
+        categories[category] = categories.get(category, 0.0) + co2
+
+    total = sum(item['co2'] for item in months)
+    peak = max((item['co2'] for item in months), default=0) or 1
+    for item in months:
+        item['co2'] = round(item['co2'], 2)
+        item['width'] = round(item['co2'] / peak * 100, 1)
+
+    previous = MonthlyEmission.objects.filter(
+        user=user, period_start__gte=date(year - 1, 1, 1), period_start__lte=date(year - 1, 12, 31),
+    ).aggregate(co2=Sum('co2_total'))['co2']
+    top_types = (
+        UserActivity.objects.filter(user=user, date__gte=start, date__lte=end)
+        .values('activity_type')
+        .annotate(co2=Sum('calculated_co2'), count=Count('id'))
+        .order_by('-co2')[:10]
+    )
+    return {
+        'user': user,
+        'year': year,
+        'total_co2': round(total, 2),
+        'activity_count': sum(item['count'] for item in months),
+        'previous_co2': round(previous, 2) if previous else None,
+        'change_percent': round((total - previous) / previous * 100, 1) if previous else None,
+        'months': months,
+        'categories': sorted(
+            ({'name': name, 'co2': round(co2, 2), 'percent': round(co2 / total * 100, 1) if total else 0}
+             for name, co2 in categories.items()),
+            key=lambda item: -item['co2'],
+        ),
+        'top_types': [
+            {'activity_type': row['activity_type'], 'co2': round(row['co2'], 2), 'count': row['count']}
+            for row in top_types
+        ],
+        'generated_at': timezone.now(),
+    }
+
+
+def build_yearly_report(job):
+    """Годовой отчет — самодостаточный HTML (печатается в PDF из браузера)"""
+    year = int(job.params['year'])
+    html = render_to_string('carbon_app/reports/yearly.html', yearly_context(job.user, year))
+    file_name = f'{job.id}/footprint_{year}.html'
+    write_file(file_name, [html.encode()])
+    set_progress(job, 1, 1)
+    return file_name
+
+
+BUILDERS = {
+    'export_csv': build_export,
+    'export_ndjson': build_export,
+    'yearly_html': build_yearly_report,
+}
+
+
+def run_job(job):
+    """Строит файл задания и отмечает его готовым или с ошибкой"""
+    try:
+        file_name = BUILDERS[job.kind](job)
+    except Exception as e:
+        ReportJob.objects.filter(id=job.id).update(
+            status=ReportJob.STATUS_FAILED, error=f'{type(e).__name__}: {e}', finished_at=timezone.now(),
+        )
+        return False
+    ReportJob.objects.filter(id=job.id).update(
+        status=ReportJob.STATUS_DONE, progress=100, file_name=file_name, finished_at=timezone.now(),
+    )
+    return True
+
+
+def work(worker=None, once=False, poll=POLL_INTERVAL, max_jobs=None):
+    """Цикл обработчика: захват задания, построение файла, снова.
+
+    Между заданиями выполняются и сохраненные обновления рекомендаций,
+    которые не успел выполнить веб-процесс (tasks.drain_refreshes).
+    once — выйти, когда очереди пусты; max_jobs — после стольких заданий.
+    Возвращает (выполнено, с ошибкой).
+    """
+    worker = worker or worker_name()
+    done = failed = 0
+    while max_jobs is None or done + failed < max_jobs:
+        requeue_stale()
+        refreshed = drain_refreshes()
+        job = claim_job(worker)
+        if job is None:
+            if refreshed:
+                continue
+            if once:
+                break
+            time.sleep(poll)
+            continue
+        if run_job(job):
+            done += 1
+        else:
+            failed += 1
+    return done, failed
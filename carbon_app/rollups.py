@@ -0,0 +1,201 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from .models import DailyEmission, MonthlyEmission, UserActivity, WeeklyEmission
+
+BATCH_SIZE = 2000
+TOLERANCE = 1e-6
+
+
+def day_start(day):
+    return day
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+# Модель сводной таблицы → (начало периода для даты, функция усечения в SQL)
+GRANULARITIES = (
+    (DailyEmission, day_start, TruncDay),
+    (WeeklyEmission, week_start, TruncWeek),
+    (MonthlyEmission, month_start, TruncMonth),
+)
+
+
+def apply_delta(user_id, category_id, day, co2, count):
+    """Добавляет вклад одной активности во все сводные таблицы через F()-выражения.
+
+    Вызывается внутри транзакции сохранения/удаления активности.
+    """
+    for model, period_start, _ in GRANULARITIES:
+        lookup = {'user_id': user_id, 'category_id': category_id, 'period_start': period_start(day)}
+        updated = model.objects.filter(**lookup).update(
+            co2_total=F('co2_total') + co2,
+            activity_count=F('activity_count') + count,
+        )
+        if updated or count <= 0 or co2 < 0:
+            # Строку создает только добавление: вычитать из отсутствующей
+            # нечего, а отрицательная сумма ссылалась бы на удаляемые строки
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(co2_total=co2, activity_count=count, **lookup)
+        except IntegrityError:
+            # Строку успел создать параллельный запрос
+            model.objects.filter(**lookup).update(
+                co2_total=F('co2_total') + co2,
+                activity_count=F('activity_count') + count,
+            )
+
+
+def activity_changed(old_key, new_key):
+    """Переносит вклад активности: old_key/new_key — UserActivity.rollup_key() или None"""
+    if old_key == new_key:
+        return
+    if old_key is not None:
+        user_id, category_id, day, co2 = old_key
+        apply_delta(user_id, category_id, day, -co2, -1)
+    if new_key is not None:
+        user_id, category_id, day, co2 = new_key
+        apply_delta(user_id, category_id, day, co2, 1)
+
+
+def apply_many(deltas):
+    """Добавляет вклад пачки изменений во все сводные таблицы.
+
+    deltas — итерируемое (user_id, category_id, date, co2, count). Изменения
+    сначала суммируются по периодам в памяти, затем для каждой таблицы
+    существующие строки читаются одним запросом и обновляются bulk_update,
+    а недостающие создаются bulk_create. Вызывается внутри транзакции.
+    """
+    by_day = defaultdict(lambda: [0.0, 0])
+    for user_id, category_id, day, co2, count in deltas:
+        item = by_day[(user_id, category_id, day)]
+        item[0] += co2
+        item[1] += count
+    if not by_day:
+        return
+
+    for model, period_start, _ in GRANULARITIES:
+        totals = defaultdict(lambda: [0.0, 0])
+        for (user_id, category_id, day), (co2, count) in by_day.items():
+            item = totals[(user_id, category_id, period_start(day))]
+            item[0] += co2
+            item[1] += count
+
+        existing = model.objects.select_for_update().filter(
+            user_id__in={key[0] for key in totals},
+            category_id__in={key[1] for key in totals},
+            period_start__in={key[2] for key in totals},
+        )
+        to_update = []
+        for row in existing:
+            item = totals.pop((row.user_id, row.category_id, row.period_start), None)
+            if item is None:
+                continue
+            row.co2_total += item[0]
+            row.activity_count += item[1]
+            to_update.append(row)
+
+        model.objects.bulk_update(to_update, ['co2_total', 'activity_count'], batch_size=BATCH_SIZE)
+        model.objects.bulk_create(
+            [
+                model(user_id=user_id, category_id=category_id, period_start=start,
+                      co2_total=co2, activity_count=count)
+                for (user_id, category_id, start), (co2, count) in totals.items()
+                if count > 0
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+
+def add_activities(activities):
+    """Вклад новых активностей, созданных через bulk_create"""
+    apply_many(
+        (activity.user_id, activity.category_id, activity.date, activity.calculated_co2, 1)
+        for activity in activities
+    )
+
+
+def aggregate_activities(activity_model, trunc, user_ids=None):
+    """Агрегат сырых активностей по (user, category, период)"""
+    activities = activity_model.objects.all()
+    if user_ids is not None:
+        activities = activities.filter(user_id__in=user_ids)
+    return (
+        activities.annotate(period=trunc('date'))
+        .values('user_id', 'category_id', 'period')
+        .annotate(co2_total=Sum('calculated_co2'), activity_count=Count('id'))
+        .order_by()
+    )
+
+
+def as_date(value):
+    return value.date() if hasattr(value, 'date') else value
+
+
+def rebuild(user_ids=None):
+    """Пересобирает сводные таблицы с нуля (для всех или для указанных пользователей).
+
+    Возвращает {имя модели: число строк}.
+    """
+    result = {}
+    with transaction.atomic():
+        for model, _, trunc in GRANULARITIES:
+            rollups = model.objects.all()
+            if user_ids is not None:
+                rollups = rollups.filter(user_id__in=user_ids)
+            rollups.delete()
+
+            batch = []
+            created = 0
+            for row in aggregate_activities(UserActivity, trunc, user_ids).iterator(chunk_size=BATCH_SIZE):
+                batch.append(model(
+                    user_id=row['user_id'],
+                    category_id=row['category_id'],
+                    period_start=as_date(row['period']),
+                    co2_total=row['co2_total'] or 0,
+                    activity_count=row['activity_count'],
+                ))
+                if len(batch) >= BATCH_SIZE:
+                    model.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            model.objects.bulk_create(batch)
+            result[model.__name__] = created + len(batch)
+    return result
+
+
+def verify(user_ids=None):
+    """Сравнивает сводные таблицы с агрегатом сырых данных.
+
+    Возвращает список расхождений (модель, ключ, ожидаемое, фактическое).
+    """
+    mismatches = []
+    for model, _, trunc in GRANULARITIES:
+        expected = {
+            (row['user_id'], row['category_id'], as_date(row['period'])): (row['co2_total'] or 0, row['activity_count'])
+            for row in aggregate_activities(UserActivity, trunc, user_ids).iterator(chunk_size=BATCH_SIZE)
+        }
+        rollups = model.objects.all()
+        if user_ids is not None:
+            rollups = rollups.filter(user_id__in=user_ids)
+        for user_id, category_id, start, co2, count in rollups.values_list(
+            'user_id', 'category_id', 'period_start', 'co2_total', 'activity_count'
+        ).iterator(chunk_size=BATCH_SIZE):
+            key = (user_id, category_id, start)
+            want = expected.pop(key, (0.0, 0))
+            if abs(want[0] - co2) > TOLERANCE * max(1.0, abs(want[0])) or want[1] != count:
+                mismatches.append((model.__name__, key, want, (co2, count)))
+        for key, want in expected.items():
+            mismatches.append((model.__name__, key, want, (0.0, 0)))
+    return mismatches
@@ -0,0 +1,183 @@
+from dataclasses import dataclass
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .factors import category_slug
+from .models import ActivityCategory, DailyEmission, Recommendation, UserRecommendation
+
+# Окно, по которому считаются доли категорий, дней
+WINDOW_DAYS = 30
+# Доля релевантности общих советов (категория без соответствующих активностей)
+GENERAL_RELEVANCE = 0.25
+# Чем проще совет, тем вероятнее, что его применят
+DIFFICULTY_WEIGHTS = {
+    'easy': 1.0,
+    'low': 1.0,
+    'medium': 0.7,
+    'hard': 0.4,
+    'high': 0.4,
+}
+DEFAULT_DIFFICULTY_WEIGHT = 0.7
+# Названия категорий активностей, которых нет в units.json → категории рекомендаций
+EXTRA_SECTIONS = {
+    'lifestyle': ('shopping', 'lifestyle'),
+    'образ жизни': ('shopping', 'lifestyle'),
+    'покупки': ('shopping',),
+}
+
+
+def recommendation_sections(category_name):
+    """Категории Recommendation, к которым относятся выбросы категории активности"""
+    slug = category_slug(category_name)
+    if slug:
+        return (slug,)
+    return EXTRA_SECTIONS.get(category_name.strip().lower(), ())
+
+
+@dataclass(frozen=True)
+class ScoringCatalog:
+    """Активные рекомендации в виде векторов для расчета.
+
+    ids — id рекомендаций (столбцы матриц); category_ids — id категорий
+    активностей (строки relevance); relevance[c, r] — насколько выбросы
+    категории c относятся к рекомендации r; value[r] — ожидаемая экономия,
+    умноженная на вес сложности.
+    """
+    ids: np.ndarray
+    category_ids: np.ndarray
+    relevance: np.ndarray
+    value: np.ndarray
+
+    @property
+    def ids_list(self):
+        return self.ids.tolist()
+
+
+def load_catalog():
+    """Каталог для расчета: два запроса (рекомендации и категории)"""
+    recommendations = list(
+        Recommendation.objects.filter(is_active=True).order_by('id').values_list('id', 'category', 'co2_saving', 'difficulty')
+    )
+    categories = list(ActivityCategory.objects.order_by('id').values_list('id', 'name'))
+
+    sections = [recommendation_sections(name) for _, name in categories]
+    covered = {section for names in sections for section in names}
+    relevance = np.zeros((len(categories), len(recommendations)))
+    for column, (_, rec_category, _, _) in enumerate(recommendations):
+        if rec_category in covered:
+            relevance[:, column] = [rec_category in names for names in sections]
+        else:
+            # Общий совет одинаково подходит при любых выбросах
+            relevance[:, column] = GENERAL_RELEVANCE
+
+    value = np.array([
+        (co2_saving or 0) * DIFFICULTY_WEIGHTS.get(difficulty, DEFAULT_DIFFICULTY_WEIGHT)
+        for _, _, co2_saving, difficulty in recommendations
+    ], dtype=float)
+    return ScoringCatalog(
+        ids=np.array([row[0] for row in recommendations], dtype=np.int64),
+        category_ids=np.array([row[0] for row in categories], dtype=np.int64),
+        relevance=relevance,
+        value=value,
+    )
+
+
+def category_shares(user_ids, catalog, today=None):
+    """Матрица долей выбросов пользователей (строки) по категориям за WINDOW_DAYS.
+
+    Один агрегирующий запрос к сводной таблице DailyEmission. Строка
+    пользователя без выбросов за окно — нулевая.
+    """
+    today = today or timezone.localdate()
+    rows = (
+        DailyEmission.objects.filter(
+            user_id__in=user_ids,
+            period_start__gte=today - timedelta(days=WINDOW_DAYS - 1),
+            period_start__lte=today,
+        )
+        .values('user_id', 'category_id')
+        .annotate(co2=Sum('co2_total'))
+        .order_by()
+        .values_list('user_id', 'category_id', 'co2')
+    )
+    user_index = {user_id: row for row, user_id in enumerate(user_ids)}
+    category_index = {category_id: column for column, category_id in enumerate(catalog.category_ids.tolist())}
+    totals = np.zeros((len(user_ids), len(category_index)))
+    for user_id, category_id, co2 in rows:
+        column = category_index.get(category_id)
+        if column is not None and co2:
+            totals[user_index[user_id], column] = max(co2, 0.0)
+    sums = totals.sum(axis=1, keepdims=True)
+    return np.divide(totals, sums, out=np.zeros_like(totals), where=sums > 0)
+
+
+def assigned_mask(user_ids, catalog):
+    """Булева матрица пользователь × рекомендация: True, если уже назначена"""
+    mask = np.zeros((len(user_ids), len(catalog.ids)), dtype=bool)
+    user_index = {user_id: row for row, user_id in enumerate(user_ids)}
+    rec_index = {rec_id: column for column, rec_id in enumerate(catalog.ids_list)}
+    pairs = UserRecommendation.objects.filter(user_id__in=user_ids).values_list('user_id', 'recommendation_id')
+    for user_id, rec_id in pairs:
+        column = rec_index.get(rec_id)
+        if column is not None:
+            mask[user_index[user_id], column] = True
+    return mask
+
+
+def score(shares, catalog, assigned=None):
+    """Оценки пользователь × рекомендация: (shares @ relevance) × экономия × вес сложности.
+
+    Уже назначенным рекомендациям ставится 0.
+    """
+    scores = (shares @ catalog.relevance) * catalog.value
+    if assigned is not None:
+        scores[assigned] = 0.0
+    return scores
+
+
+def top_recommendations(scores, catalog, limit):
+    """До limit id рекомендаций с положительной оценкой на строку, по убыванию"""
+    if not scores.size or limit <= 0:
+        return [[] for _ in range(len(scores))]
+    limit = min(limit, scores.shape[1])
+    # argpartition отбирает limit лучших за O(R), сортируются только они
+    top = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    return [
+        catalog.ids[columns[values > 0]].tolist()
+        for columns, values in zip(top, top_scores)
+    ]
+
+
+def pick_recommendations(user_ids, limit, catalog=None, today=None):
+    """user_id → новые рекомендации (до limit) для пачки пользователей.
+
+    Для одного пользователя и для всей базы расчет одинаковый: три
+    запроса на пачку и матричные операции NumPy.
+    """
+    user_ids = list(user_ids)
+    catalog = catalog if catalog is not None else load_catalog()
+    if not user_ids or not len(catalog.ids):
+        return {user_id: [] for user_id in user_ids}
+    scores = score(category_shares(user_ids, catalog, today), catalog, assigned_mask(user_ids, catalog))
+    return dict(zip(user_ids, top_recommendations(scores, catalog, limit)))
+
+
+def assign_recommendations(user_ids, limit, catalog=None, today=None):
+    """Создает UserRecommendation по pick_recommendations; возвращает число новых"""
+    picks = pick_recommendations(user_ids, limit, catalog, today)
+    to_create = [
+        UserRecommendation(user_id=user_id, recommendation_id=rec_id, is_viewed=False)
+        for user_id, rec_ids in picks.items()
+        for rec_id in rec_ids
+    ]
+    with transaction.atomic():
+        UserRecommendation.objects.bulk_create(to_create, ignore_conflicts=True)
+    return len(to_create)
@@ -0,0 +1,97 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import rollups
+from .cache import bump_catalog_version, bump_dashboard_version
+from .factors import factor_index, forget_user_region
+from .models import (
+    ROLLUP_FIELDS, ActivityCategory, EmissionFactor, Recommendation, ReportJob, UserActivity, UserProfile,
+)
+
+
+@receiver(post_save, sender=EmissionFactor)
+@receiver(post_delete, sender=EmissionFactor)
+@receiver(post_save, sender=ActivityCategory)
+@receiver(post_delete, sender=ActivityCategory)
+def invalidate_factor_index(sender, **kwargs):
+    """Сбрасывает индекс коэффициентов при изменении справочника"""
+    factor_index.invalidate()
+
+
+@receiver(post_save, sender=Recommendation)
+@receiver(post_delete, sender=Recommendation)
+def invalidate_recommendation_catalog(sender, **kwargs):
+    """Каталог на главной и его фрагмент в шаблоне строятся заново"""
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_user_region(sender, instance, **kwargs):
+    forget_user_region(instance.user_id)
+
+
+@receiver(post_save, sender=UserActivity)
+@receiver(post_delete, sender=UserActivity)
+def invalidate_dashboard_cache(sender, instance, **kwargs):
+    """Новая версия данных пользователя — закэшированный дашборд устарел"""
+    user_id = instance.__dict__.get('user_id')
+    if user_id is None:
+        # user_id отложен (only/defer), а строка уже удалена — берем запомненный
+        user_id = instance._rollup_loaded[0]
+    bump_dashboard_version(user_id)
+
+
+def remember_rollup_key(instance):
+    """Старый вклад активности, если он не был запомнен при загрузке из БД"""
+    if getattr(instance, '_rollup_loaded', None) is None and instance.pk and not instance._state.adding:
+        instance._rollup_loaded = UserActivity.objects.filter(pk=instance.pk).values_list(*ROLLUP_FIELDS).first()
+
+
+@receiver(pre_save, sender=UserActivity)
+@receiver(pre_delete, sender=UserActivity)
+def load_rollup_key(sender, instance, raw=False, **kwargs):
+    if not raw:
+        remember_rollup_key(instance)
+
+
+@receiver(post_save, sender=UserActivity)
+def update_rollups_on_save(sender, instance, created, raw=False, **kwargs):
+    """Переносит вклад активности в сводных таблицах (в транзакции save)"""
+    if raw:
+        return
+    old_key = None if created else getattr(instance, '_rollup_loaded', None)
+    new_key = instance.rollup_key()
+    rollups.activity_changed(old_key, new_key)
+    instance._rollup_loaded = new_key
+
+
+def deleted_directly(origin):
+    """Удаляют сами активности (экземпляр или QuerySet), а не каскадом от пользователя/категории"""
+    if origin is None:
+        return True
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, UserActivity)
+
+
+@receiver(post_delete, sender=UserActivity)
+def update_rollups_on_delete(sender, instance, origin=None, **kwargs):
+    # При каскадном удалении строки сводных таблиц удаляются тем же каскадом,
+    # причем раньше активностей: вычитать уже не из чего
+    if deleted_directly(origin):
+        rollups.activity_changed(getattr(instance, '_rollup_loaded', None), None)
+
+
+@receiver(post_delete, sender=ReportJob)
+def delete_report_file(sender, instance, **kwargs):
+    """Файл отчета удаляется вместе с заданием"""
+    from .reports import report_path
+
+    if instance.file_name:
+        path = report_path(instance.file_name)
+        path.unlink(missing_ok=True)
+        try:
+            path.parent.rmdir()
+        except OSError:
+            pass
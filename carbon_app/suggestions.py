@@ -0,0 +1,153 @@
+import re
+from dataclasses import dataclass
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Минимальное сходство по триграммам (коэффициент Дайса) для нечетких совпадений
+MIN_SIMILARITY = 0.3
+
+TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p',
+    'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch',
+    'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+_TRANSLIT_TABLE = str.maketrans(TRANSLIT)
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_term(text):
+    """Нижний регистр, ё → е, одиночные пробелы"""
+    return _SPACES.sub(' ', text.casefold().replace('ё', 'е')).strip()
+
+
+def transliterate(text):
+    """Латинская запись кириллицы: «автобус» → «avtobus»"""
+    return text.translate(_TRANSLIT_TABLE)
+
+
+def trigrams(term):
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass(frozen=True)
+class Suggestion:
+    activity_type: str
+    category: str
+    unit: str
+    co2_per_unit: float
+
+    def as_dict(self):
+        return {
+            'activity_type': self.activity_type,
+            'category': self.category,
+            'unit': self.unit,
+            'co2_per_unit': self.co2_per_unit,
+        }
+
+
+class SuggestionIndex:
+    """Индекс подсказок для типов активности: префиксное дерево и триграммы.
+
+    Каждый тип индексируется по написанию и по транслитерации, целиком и
+    с начала каждого слова. Префиксное дерево находит продолжения набранного
+    текста, триграммы — написания с опечатками. Индекс строится один раз
+    для снимка коэффициентов и не обращается к БД.
+    """
+
+    def __init__(self, suggestions):
+        self.suggestions = list(suggestions)
+        self.trie = {}
+        self.grams = {}
+        self.term_grams = []
+
+        for index, suggestion in enumerate(self.suggestions):
+            name = normalize_term(suggestion.activity_type)
+            terms = {name, transliterate(name)}
+            self.term_grams.append([trigrams(term) for term in terms])
+            for term in terms:
+                words = term.split(' ')
+                for position in range(len(words)):
+                    # Начало названия ранжируется выше начала слова внутри него
+                    self._insert(' '.join(words[position:]), index, position == 0)
+                for gram in trigrams(term):
+                    self.grams.setdefault(gram, set()).add(index)
+
+        # Порядок внутри узла: сначала совпадение с начала названия, затем короткие
+        for node in self._nodes():
+            node['ids'] = sorted(node['ids'].items(), key=lambda item: (not item[1], self._length(item[0])))
+
+    def _insert(self, term, index, is_start):
+        node = self.trie
+        for char in term:
+            node = node.setdefault(char, {'ids': {}})
+            node['ids'][index] = node['ids'].get(index, False) or is_start
+
+    def _nodes(self):
+        stack = [self.trie]
+        while stack:
+            node = stack.pop()
+            for key, child in node.items():
+                if key != 'ids':
+                    stack.append(child)
+                    yield child
+
+    def _length(self, index):
+        return len(self.suggestions[index].activity_type)
+
+    def prefix_matches(self, term):
+        node = self.trie
+        for char in term:
+            node = node.get(char)
+            if node is None:
+                return []
+        return [index for index, _ in node['ids']]
+
+    def fuzzy_matches(self, term):
+        """Индексы по убыванию сходства триграмм (коэффициент Дайса)"""
+        query = trigrams(term)
+        candidates = set()
+        for gram in query:
+            candidates.update(self.grams.get(gram, ()))
+        scored = []
+        for index in candidates:
+            similarity = max(
+                2 * len(query & grams) / (len(query) + len(grams)) for grams in self.term_grams[index]
+            )
+            if similarity >= MIN_SIMILARITY:
+                scored.append((-similarity, self._length(index), index))
+        return [index for _, _, index in sorted(scored)]
+
+    def search(self, query, category=None, limit=DEFAULT_LIMIT):
+        """Подсказки для набранного текста; category — раздел units.json или None.
+
+        Сначала продолжения префикса; нечеткий поиск нужен, только если их
+        не хватило до limit.
+        """
+        term = normalize_term(query)
+        if not term:
+            return []
+        results = []
+        seen = set()
+        for matches in (self.prefix_matches, self.fuzzy_matches):
+            for index in matches(term):
+                if index in seen:
+                    continue
+                seen.add(index)
+                suggestion = self.suggestions[index]
+                if category is not None and suggestion.category != category:
+                    continue
+                results.append(suggestion)
+                if len(results) >= limit:
+                    return results
+        return results
+
+
+def build_suggestion_index(catalog):
+    """Индекс по каталогу реестра: раздел → {activity_type: {'unit', 'co2_per_unit'}}"""
+    return SuggestionIndex(
+        Suggestion(activity_type, slug, entry['unit'], entry['co2_per_unit'])
+        for slug, activities in catalog.items()
+        for activity_type, entry in activities.items()
+    )
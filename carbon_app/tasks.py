@@ -0,0 +1,198 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Через сколько секунд после первой постановки в очередь выполняется задача;
+# повторные постановки за это время объединяются в одну
+DEFAULT_DELAY = getattr(settings, 'RECOMMENDATION_REFRESH_DELAY', 5.0)
+# Сохраненные обновления старше этого выполняет run_workers: более свежие
+# еще выполнит поток процесса, поставившего их в очередь
+DRAIN_AFTER = timedelta(seconds=max(60, DEFAULT_DELAY * 2))
+DRAIN_BATCH = 100
+
+
+class CoalescingQueue:
+    """Очередь фоновых задач процесса с объединением по ключу.
+
+    Брокер не нужен: ключи ждут в словаре, их выполняет один поток-демон.
+    Ключ, уже стоящий в очереди, второй раз не добавляется, поэтому серия
+    постановок за delay секунд дает один вызов handler(key). Если ключ
+    добавлен, пока handler для него уже выполняется, он будет выполнен еще
+    раз — с учетом новых данных.
+
+    Очередь живет в памяти процесса: при остановке процесса невыполненные
+    задачи теряются, а под uWSGI без enable-threads поток не запускается
+    вовсе. Поэтому задачи, которые нельзя потерять, дополнительно
+    сохраняются в БД (см. schedule_recommendation_refresh).
+    """
+
+    def __init__(self, handler, delay=DEFAULT_DELAY, name='background-tasks'):
+        self.handler = handler
+        self.delay = delay
+        self.name = name
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.thread = None
+        self.enqueued = 0
+        self.coalesced = 0
+        self.processed = 0
+        self.failed = 0
+
+    def enqueue(self, key):
+        """Ставит ключ в очередь; False, если он уже ждет выполнения"""
+        with self.condition:
+            if key in self.pending:
+                self.coalesced += 1
+                return False
+            self.pending[key] = time.monotonic() + self.delay
+            self.enqueued += 1
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._work, name=self.name, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return True
+
+    def _next_due(self):
+        """Ключ, срок которого наступил, ожидая его (под блокировкой)"""
+        while True:
+            if not self.pending:
+                return None
+            key, due = min(self.pending.items(), key=lambda item: item[1])
+            remaining = due - time.monotonic()
+            if remaining <= 0:
+                del self.pending[key]
+                return key
+            self.condition.wait(remaining)
+
+    def _work(self):
+        while True:
+            with self.condition:
+                key = self._next_due()
+                if key is None:
+                    # Очередь пуста — поток завершается, enqueue запустит новый
+                    self.thread = None
+                    break
+            self._run(key)
+        # Соединения этого потока не закрываются обработчиком запросов
+        connections.close_all()
+
+    def _run(self, key):
+        try:
+            self.handler(key)
+        except Exception:
+            self.failed += 1
+            logger.exception('Фоновая задача %s(%r) завершилась ошибкой', self.name, key)
+        else:
+            self.processed += 1
+
+    def run_pending(self):
+        """Выполняет все ожидающие задачи сразу в текущем потоке (команды, тесты)"""
+        with self.condition:
+            keys = list(self.pending)
+            self.pending.clear()
+        for key in keys:
+            self._run(key)
+        return len(keys)
+
+    def stats(self):
+        with self.condition:
+            pending = len(self.pending)
+        return {
+            'pending': pending,
+            'enqueued': self.enqueued,
+            'coalesced': self.coalesced,
+            'processed': self.processed,
+            'failed': self.failed,
+        }
+
+
+def claim_refresh(user_id):
+    """Забирает сохраненное обновление; True — выполнять его должен вызвавший.
+
+    Строку удаляет только один из претендентов (поток веб-процесса или
+    run_workers), поэтому обновление выполняется один раз.
+    """
+    from .models import RecommendationRefresh
+
+    deleted, _ = RecommendationRefresh.objects.filter(user_id=user_id).delete()
+    return deleted > 0
+
+
+def _update_recommendations(user_id):
+    from django.contrib.auth.models import User
+
+    from .views import update_user_recommendations
+
+    user = User.objects.filter(id=user_id).first()
+    if user is not None:
+        update_user_recommendations(user)
+
+
+def refresh_recommendations(user_id):
+    # Строки нет — обновление уже выполнил обработчик run_workers
+    if claim_refresh(user_id):
+        _update_recommendations(user_id)
+
+
+recommendation_queue = CoalescingQueue(refresh_recommendations, name='refresh-recommendations')
+
+
+def schedule_recommendation_refresh(user_id):
+    """Обновить рекомендации пользователя в фоне (не в потоке запроса).
+
+    Запрос сохраняется в RecommendationRefresh (INSERT без ошибки, если
+    строка уже есть — повторные запросы объединяются и в БД) и ставится в
+    очередь процесса. Если процесс остановится раньше, обновление выполнит
+    run_workers (drain_refreshes).
+
+    Оба шага выполняются после фиксации текущей транзакции: ошибка записи
+    запроса не откатит активность пользователя, а поток очереди не начнет
+    обновление раньше, чем станут видны новые данные. Цена — запрос,
+    потерянный между фиксацией и записью (остановка процесса), не будет
+    выполнен до следующего изменения.
+    """
+    transaction.on_commit(partial(enqueue_refresh, user_id))
+
+
+def enqueue_refresh(user_id):
+    """Сохраняет запрос обновления и ставит его в очередь; False, если он уже в очереди"""
+    from .models import RecommendationRefresh
+
+    try:
+        RecommendationRefresh.objects.bulk_create([RecommendationRefresh(user_id=user_id)], ignore_conflicts=True)
+    except DatabaseError:
+        # Обновление все равно выполнит очередь процесса, если он не остановится
+        logger.exception('Не удалось сохранить запрос обновления рекомендаций пользователя %s', user_id)
+    return recommendation_queue.enqueue(user_id)
+
+
+def drain_refreshes(limit=DRAIN_BATCH, now=None):
+    """Выполняет сохраненные обновления старше DRAIN_AFTER; возвращает их число"""
+    from .models import RecommendationRefresh
+
+    cutoff = (now or timezone.now()) - DRAIN_AFTER
+    user_ids = list(
+        RecommendationRefresh.objects.filter(requested_at__lte=cutoff)
+        .order_by('requested_at')
+        .values_list('user_id', flat=True)[:limit]
+    )
+    done = 0
+    for user_id in user_ids:
+        # Строку мог забрать поток веб-процесса или другой обработчик
+        if not claim_refresh(user_id):
+            continue
+        try:
+            _update_recommendations(user_id)
+        except Exception:
+            logger.exception('Обновление рекомендаций пользователя %s завершилось ошибкой', user_id)
+        else:
+            done += 1
+    return done
@@ -0,0 +1,23 @@
+from django import template
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
+from django.contrib.admin.templatetags.base import InclusionAdminNode
+
+from ..admin_scaling import DateRangeChangeList
+
+register = template.Library()
+
+
+def range_date_hierarchy(cl):
+    """date_hierarchy, который перечисляет периоды между MIN и MAX без DISTINCT"""
+    return date_hierarchy(DateRangeChangeList(cl))
+
+
+@register.tag(name='range_date_hierarchy')
+def range_date_hierarchy_tag(parser, token):
+    return InclusionAdminNode(
+        parser,
+        token,
+        func=range_date_hierarchy,
+        template_name='date_hierarchy.html',
+        takes_context=False,
+    )
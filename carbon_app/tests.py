@@ -1,3 +1,1353 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import re
+import tempfile
+import warnings
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection
+from django.db.models import Max, Q
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .analytics import FootprintAnalytics, period_series
+from .cache import DASHBOARD_CACHE_TIMEOUT, LOCAL_CACHE_TIMEOUT, cache_timeout
+from .community import compute_snapshot, percentile_rank
+from .factors import (
+    CATEGORY_DEFAULTS, GLOBAL_REGION, LOOKUP_CONVERTED, LOOKUP_EXACT, FactorIndex, build_registry, factor_index,
+    load_units, normalize_region, parent_region, user_region,
+)
+from .importers import ActivityImporter
+from .metrics import metrics_registry
+from .models import (
+    ActivityCategory, EmissionFactor, MonthlyEmission, Recommendation, RecommendationRefresh, ReportJob,
+    UserActivity, UserProfile, UserRecommendation,
+)
+from .pagination import InvalidCursor, KeysetPage, decode_cursor, encode_cursor
+from .recalculation import factor_keys, read_checkpoint, recalculate
+from .reports import MAX_ATTEMPTS, STALE_AFTER, claim_job, create_job, requeue_stale, work
+from .rollups import rebuild, verify
+from .scoring import (
+    GENERAL_RELEVANCE, WINDOW_DAYS as SCORING_WINDOW_DAYS, ScoringCatalog, category_shares, load_catalog,
+    pick_recommendations, score, top_recommendations,
+)
+from .suggestions import Suggestion, SuggestionIndex
+from .tasks import (
+    DRAIN_AFTER, CoalescingQueue, drain_refreshes, recommendation_queue, refresh_recommendations,
+    schedule_recommendation_refresh,
+)
+from .units import ALIAS_TABLE, ALIASES, UNITS, clean_unit, conversion_factor, normalize_unit
+
+# SCAN — проход по всей таблице или всему индексу, SEARCH — поиск по индексу
+FULL_SCAN = re.compile(r'^SCAN ')
+# Тесты не должны видеть общий файловый кэш разработки и писать в него
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'}}
+# Фоновый поток очереди рекомендаций не должен сработать посреди другого теста
+queue_delay = mock.patch.object(recommendation_queue, 'delay', 3600)
+
+
+def setUpModule():
+    queue_delay.start()
+
+
+def tearDownModule():
+    queue_delay.stop()
+
+
+class QueryPlanTests(TestCase):
+    """Основные запросы представлений не должны делать полный проход по таблицам"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([User(username=f'user{i}') for i in range(20)])
+        cls.user = cls.users[0]
+        cls.categories = ActivityCategory.objects.bulk_create([
+            ActivityCategory(name=name) for name in ('transport', 'food', 'energy')
+        ])
+        cls.category = cls.categories[0]
+        EmissionFactor.objects.bulk_create([
+            EmissionFactor(activity_type=f'type{i}', category=category, co2_per_unit=0.1 * i, unit='км')
+            for i in range(10)
+            for category in cls.categories
+        ])
+        start = date(2024, 1, 1)
+        UserActivity.objects.bulk_create([
+            UserActivity(
+                user=user,
+                category=cls.categories[i % 3],
+                activity_type=f'type{i % 10}',
+                quantity=1 + i % 7,
+                unit='км',
+                date=start + timedelta(days=i % 365),
+                calculated_co2=0.5 * (i % 11),
+            )
+            for user in cls.users
+            for i in range(200)
+        ])
+        recommendations = Recommendation.objects.bulk_create([
+            Recommendation(title=f'rec{i}', description='', co2_saving=i) for i in range(12)
+        ])
+        UserRecommendation.objects.bulk_create([
+            UserRecommendation(user=user, recommendation=rec, is_viewed=bool(i % 2))
+            for user in cls.users
+            for i, rec in enumerate(recommendations[:6])
+        ])
+        rebuild()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertNoFullScan(self, queryset):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN поддерживается только SQLite')
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        scans = [detail for detail in plan if FULL_SCAN.match(detail)]
+        self.assertFalse(scans, f'Полный проход таблицы: {plan}\n{sql}')
+
+    def test_dashboard_aggregate(self):
+        analytics = FootprintAnalytics(self.user, today=date(2024, 6, 1))
+        self.assertNoFullScan(analytics.grouped_queryset())
+
+    def test_dashboard_daily_series(self):
+        analytics = FootprintAnalytics(self.user, today=date(2024, 6, 1))
+        self.assertNoFullScan(analytics.daily_queryset())
+
+    def test_period_series_rollup(self):
+        queryset = MonthlyEmission.objects.filter(
+            user=self.user, period_start__gte=date(2023, 1, 1), period_start__lte=date(2024, 12, 31)
+        ).values_list('period_start', 'category__name', 'co2_total')
+        self.assertNoFullScan(queryset)
+
+    def test_dashboard_recent_activities(self):
+        analytics = FootprintAnalytics(self.user, today=date(2024, 6, 1))
+        self.assertNoFullScan(analytics.recent_queryset())
+
+    def test_activities_page_with_cursor(self):
+        queryset = (
+            UserActivity.objects.filter(user=self.user)
+            .filter(Q(date__lt=date(2024, 3, 1)) | Q(date=date(2024, 3, 1), id__lt=1000))
+            .order_by('-date', '-id')[:51]
+        )
+        self.assertNoFullScan(queryset)
+
+    def test_activities_page_by_category_and_range(self):
+        queryset = (
+            UserActivity.objects.filter(user=self.user, category=self.category)
+            .filter(date__gte=date(2024, 2, 1), date__lte=date(2024, 5, 1))
+            .order_by('-date', '-id')[:51]
+        )
+        self.assertNoFullScan(queryset)
+
+    def test_emission_factor_lookup(self):
+        queryset = EmissionFactor.objects.filter(activity_type='type3', category=self.category, unit='км')
+        self.assertNoFullScan(queryset)
+
+    def test_last_user_recommendation(self):
+        queryset = UserRecommendation.objects.filter(user=self.user).order_by('-created_at')[:1]
+        self.assertNoFullScan(queryset)
+
+    def test_new_user_recommendations(self):
+        queryset = UserRecommendation.objects.filter(user=self.user, is_viewed=False)
+        self.assertNoFullScan(queryset)
+
+    def test_recommendations_batch_chunk(self):
+        user_ids = [user.id for user in self.users[:10]]
+        queryset = (
+            UserRecommendation.objects.filter(user_id__in=user_ids)
+            .values('user_id')
+            .annotate(last=Max('created_at'))
+        )
+        self.assertNoFullScan(queryset)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ActivityImportTests(TestCase):
+    """Импорт CSV/JSONL: кодировки и некорректные значения"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('importer', password='secret')
+        cls.category = ActivityCategory.objects.create(name='Транспорт')
+
+    def setUp(self):
+        cache.clear()
+
+    def run_import(self, content, fmt='csv'):
+        return ActivityImporter(self.user).run_file(io.BytesIO(content), fmt)
+
+    def test_utf8_with_bom(self):
+        content = 'category,activity_type,quantity,unit,date\nТранспорт,Автобус,10,км,2024-01-01\n'
+        report = self.run_import(content.encode('utf-8-sig'))
+        self.assertEqual((report.created, report.failed), (1, 0))
+        self.assertEqual(UserActivity.objects.get(user=self.user).activity_type, 'Автобус')
+
+    def test_cp1251_csv(self):
+        content = 'category,activity_type,quantity,unit,date,notes\r\nТранспорт,Автобус,10,км,2024-01-01,Поездка\r\n'
+        report = self.run_import(content.encode('cp1251'))
+        self.assertEqual((report.created, report.failed), (1, 0))
+        activity = UserActivity.objects.get(user=self.user)
+        self.assertEqual((activity.activity_type, activity.notes), ('Автобус', 'Поездка'))
+
+    def test_invalid_bytes_after_sample_report_line(self):
+        header = b'category,activity_type,quantity,unit,date\n'
+        good = 'Транспорт,Автобус,1,км,2024-01-01\n'.encode()
+        # Образец для определения кодировки — только заголовок: файл считается UTF-8
+        with mock.patch('carbon_app.importers.SNIFF_SIZE', len(header)):
+            report = self.run_import(header + good + b'\xff\xfe,bad,1,km,2024-01-01\n' + good)
+        self.assertEqual(report.created, 1)
+        self.assertEqual(report.failed, 1)
+        self.assertEqual(report.errors[0][0], 3)
+
+    def test_non_finite_quantities_rejected(self):
+        lines = ['category,activity_type,quantity,unit,date']
+        lines += [f'Транспорт,Автобус,{value},км,2024-01-01' for value in ('nan', 'inf', '-inf', '1e400', '5')]
+        report = self.run_import('\n'.join(lines).encode())
+        self.assertEqual((report.created, report.failed), (1, 4))
+        self.assertEqual([line for line, _ in report.errors], [2, 3, 4, 5])
+        self.assertEqual(UserActivity.objects.get(user=self.user).quantity, 5)
+
+    def test_non_finite_quantity_jsonl(self):
+        content = '{"category": "Транспорт", "activity_type": "Автобус", "quantity": "Infinity", "unit": "км"}\n'
+        report = self.run_import(content.encode(), fmt='jsonl')
+        self.assertEqual((report.created, report.failed), (0, 1))
+
+    def test_upload_in_cp1251(self):
+        self.client.force_login(self.user)
+        content = 'category,activity_type,quantity,unit,date\nТранспорт,Автобус,3,км,2024-01-01\n'
+        upload = SimpleUploadedFile('history.csv', content.encode('cp1251'), content_type='text/csv')
+        response = self.client.post(reverse('import_activities'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['report'].created, 1)
+
+
+class CacheTimeoutTests(SimpleTestCase):
+    """Сроки записей зависят от того, общий ли кэш у процессов"""
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/carbon-tests',
+    }})
+    def test_shared_backend_keeps_timeout(self):
+        self.assertEqual(cache_timeout(DASHBOARD_CACHE_TIMEOUT), DASHBOARD_CACHE_TIMEOUT)
+        self.assertIsNone(cache_timeout(None))
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_process_local_backend_is_capped(self):
+        self.assertEqual(cache_timeout(DASHBOARD_CACHE_TIMEOUT), LOCAL_CACHE_TIMEOUT)
+        self.assertEqual(cache_timeout(None), LOCAL_CACHE_TIMEOUT)
+        self.assertEqual(cache_timeout(10), 10)
+
+
+class CalculatorApiTests(TestCase):
+    """Пакетный калькулятор отвечает строго корректным JSON"""
+
+    def post(self, items):
+        response = self.client.post(
+            reverse('calculator_api'), json.dumps({'items': items}), content_type='application/json',
+        )
+
+        def reject(constant):
+            raise AssertionError(f'{constant} в ответе')
+
+        return response, json.loads(response.content, parse_constant=reject)
+
+    def test_non_finite_quantities_are_line_errors(self):
+        items = [
+            {'category': 'transport', 'activity_type': 'автобус', 'quantity': value, 'unit': 'км'}
+            for value in ('nan', 'inf', '-inf', '10')
+        ]
+        response, data = self.post(items)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([error['index'] for error in data['errors']], [0, 1, 2])
+        self.assertEqual([line['index'] for line in data['lines']], [3])
+
+    def test_nan_literal_in_body(self):
+        body = '{"items": [{"category": "transport", "activity_type": "автобус", "quantity": NaN}]}'
+        response = self.client.post(reverse('calculator_api'), body, content_type='application/json')
+        data = json.loads(response.content, parse_constant=lambda constant: self.fail(constant))
+        self.assertEqual((data['lines'], len(data['errors'])), ([], 1))
+
+
+class PeriodSeriesTests(TestCase):
+    """Период, пересекающийся с диапазоном, учитывается целиком"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('periods')
+        category = ActivityCategory.objects.create(name='transport')
+        UserActivity.objects.bulk_create([
+            UserActivity(
+                user=cls.user, category=category, activity_type='bus', quantity=1, unit='км',
+                date=day, calculated_co2=co2,
+            )
+            for day, co2 in ((date(2023, 12, 31), 1.0), (date(2024, 2, 10), 2.0), (date(2024, 10, 5), 3.0))
+        ])
+        rebuild()
+
+    def test_year_includes_months_before_start(self):
+        data = period_series(self.user, 'year', start=date(2024, 6, 15), end=date(2024, 12, 31))
+        self.assertEqual(data['labels'], ['2024-01-01'])
+        self.assertEqual(data['totals'], [5.0])
+
+    def test_month_includes_days_before_start(self):
+        data = period_series(self.user, 'month', start=date(2024, 2, 20), end=date(2024, 3, 31))
+        self.assertEqual(data['totals'], [2.0, 0.0])
+
+
+class KeysetPageTests(TestCase):
+    """Обход страниц по курсору (date, id) без пропусков и повторов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pages')
+        category = ActivityCategory.objects.create(name='transport')
+        # По несколько активностей на дату: порядок внутри даты задает id
+        UserActivity.objects.bulk_create([
+            UserActivity(
+                user=cls.user, category=category, activity_type='bus', quantity=1, unit='км',
+                date=date(2024, 1, 1) + timedelta(days=i // 4), calculated_co2=1,
+            )
+            for i in range(23)
+        ])
+
+    def test_cursor_round_trip(self):
+        cursor = encode_cursor(date(2024, 3, 9), 12345)
+        self.assertEqual(decode_cursor(cursor), (date(2024, 3, 9), 12345))
+
+    def test_invalid_cursor(self):
+        for cursor in ('garbage', encode_cursor(date(2024, 1, 1), 1)[:-3], 'MjAyNC0xMy0wMXwx'):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
+
+    def test_pages_cover_all_rows_once(self):
+        activities = UserActivity.objects.filter(user=self.user)
+        expected = list(activities.order_by('-date', '-id').values_list('id', flat=True))
+        seen = []
+        cursor = None
+        while True:
+            page = KeysetPage(activities, cursor=cursor, page_size=5)
+            seen.extend(activity.id for activity in page)
+            if not page.has_next:
+                self.assertIsNone(page.next_cursor)
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, expected)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ExportTests(TestCase):
+    """Потоковая выгрузка: формат, фильтры, gzip и обратный импорт"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('exporter')
+        cls.other = User.objects.create_user('other')
+        cls.category = ActivityCategory.objects.create(name='Транспорт')
+        UserActivity.objects.bulk_create([
+            UserActivity(
+                user=user, category=cls.category, activity_type='Автобус', quantity=i + 1, unit='км',
+                date=date(2024, 1, 1) + timedelta(days=i % 10), calculated_co2=0.1 * i, notes=f'поездка, {i}',
+            )
+            for user in (cls.user, cls.other)
+            for i in range(30)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def export(self, fmt, **params):
+        response = self.client.get(reverse('export_activities', args=[fmt]), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_csv_in_date_order(self):
+        # Маленький буфер — выгрузка уходит несколькими кусками
+        with mock.patch('carbon_app.exports.BUFFER_SIZE', 100):
+            rows = list(csv.DictReader(io.StringIO(self.export('csv').decode())))
+        self.assertEqual(len(rows), 30)
+        self.assertEqual([row['date'] for row in rows], sorted(row['date'] for row in rows))
+        self.assertEqual(rows[0]['category'], 'Транспорт')
+
+    def test_ndjson_with_filters(self):
+        lines = self.export('ndjson', date_from='2024-01-05', date_to='2024-01-06').decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual(len(records), 6)
+        self.assertEqual({record['date'] for record in records}, {'2024-01-05', '2024-01-06'})
+
+    def test_gzip_matches_plain(self):
+        with mock.patch('carbon_app.exports.BUFFER_SIZE', 100):
+            compressed = self.export('csv', gzip='1')
+        self.assertEqual(gzip.decompress(compressed), self.export('csv'))
+
+    def test_csv_imports_back(self):
+        content = self.export('csv')
+        report = ActivityImporter(self.other).run_file(io.BytesIO(content), 'csv')
+        self.assertEqual((report.created, report.failed), (30, 0))
+        self.assertEqual(UserActivity.objects.filter(user=self.other).count(), 60)
+
+    def test_unknown_format(self):
+        response = self.client.get(reverse('export_activities', args=['xml']))
+        self.assertEqual(response.status_code, 404)
+
+
+class RecommendationRefreshTests(TestCase):
+    """Очередь обновления рекомендаций: объединение и сохранение в БД"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('refresh')
+
+    def tearDown(self):
+        with recommendation_queue.condition:
+            recommendation_queue.pending.clear()
+
+    def test_queue_coalesces_by_key(self):
+        calls = []
+        queue = CoalescingQueue(calls.append, delay=3600)
+        self.assertEqual([queue.enqueue(1), queue.enqueue(1), queue.enqueue(2)], [True, False, True])
+        self.assertEqual(queue.run_pending(), 2)
+        self.assertEqual(sorted(calls), [1, 2])
+        stats = queue.stats()
+        self.assertEqual((stats['enqueued'], stats['coalesced'], stats['processed']), (2, 1, 2))
+        # После выполнения ключ снова принимается
+        self.assertTrue(queue.enqueue(1))
+
+    @mock.patch('carbon_app.tasks._update_recommendations')
+    def test_repeated_schedule_runs_once(self, update):
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule_recommendation_refresh(self.user.id)
+            schedule_recommendation_refresh(self.user.id)
+        self.assertEqual(list(recommendation_queue.pending), [self.user.id])
+        self.assertEqual(RecommendationRefresh.objects.filter(user=self.user).count(), 1)
+        recommendation_queue.run_pending()
+        update.assert_called_once_with(self.user.id)
+        self.assertFalse(RecommendationRefresh.objects.exists())
+
+    @mock.patch('carbon_app.tasks._update_recommendations')
+    def test_lost_refresh_is_drained(self, update):
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule_recommendation_refresh(self.user.id)
+        # Процесс остановился: очередь в памяти пропала, строка в БД осталась
+        with recommendation_queue.condition:
+            recommendation_queue.pending.clear()
+        self.assertEqual(drain_refreshes(), 0)
+        self.assertEqual(drain_refreshes(now=timezone.now() + DRAIN_AFTER), 1)
+        update.assert_called_once_with(self.user.id)
+        # Строку уже забрали — повторного обновления нет
+        refresh_recommendations(self.user.id)
+        update.assert_called_once()
+
+    def test_scheduled_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            schedule_recommendation_refresh(self.user.id)
+            # До фиксации транзакции запрос не записан и не в очереди
+            self.assertFalse(RecommendationRefresh.objects.exists())
+            self.assertFalse(recommendation_queue.pending)
+        self.assertEqual(len(callbacks), 1)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_failed_refresh_write_keeps_activity(self):
+        cache.clear()
+        category = ActivityCategory.objects.create(name='transport')
+        self.client.force_login(self.user)
+        with mock.patch('carbon_app.models.RecommendationRefresh.objects.bulk_create', side_effect=DatabaseError):
+            with self.assertLogs('carbon_app.tasks', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('add_activity'), {
+                    'category': category.id, 'activity_type': 'автобус', 'quantity': '10', 'unit': 'км',
+                })
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        self.assertEqual(UserActivity.objects.filter(user=self.user).count(), 1)
+        # Очередь процесса все равно выполнит обновление
+        self.assertEqual(list(recommendation_queue.pending), [self.user.id])
+
+
+class ReportJobTests(TestCase):
+    """Очередь заданий на отчеты: захват, возврат заданий упавших обработчиков"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reports')
+        category = ActivityCategory.objects.create(name='transport')
+        UserActivity.objects.bulk_create([
+            UserActivity(
+                user=cls.user, category=category, activity_type='bus', quantity=1, unit='км',
+                date=date(2024, 1, 1) + timedelta(days=i), calculated_co2=1,
+            )
+            for i in range(7)
+        ])
+
+    def create_jobs(self, count):
+        return [
+            ReportJob.objects.create(user=self.user, kind='yearly_html', params={'year': 2000 + i})
+            for i in range(count)
+        ]
+
+    def test_create_job_deduplicates_active(self):
+        first, created = create_job(self.user, 'export_csv', {'filters': {}})
+        again, created_again = create_job(self.user, 'export_csv', {'filters': {}})
+        self.assertTrue(created)
+        self.assertEqual((again.id, created_again), (first.id, False))
+
+    def test_each_job_claimed_once(self):
+        jobs = self.create_jobs(5)
+        # Задание, уже захваченное другим обработчиком, не выдается
+        ReportJob.objects.filter(id=jobs[2].id).update(status=ReportJob.STATUS_RUNNING, worker='other')
+        claimed = []
+        for worker in ('a', 'b', 'a', 'b', 'a'):
+            job = claim_job(worker)
+            if job is not None:
+                self.assertEqual((job.status, job.worker, job.attempts), (ReportJob.STATUS_RUNNING, worker, 1))
+                claimed.append(job.id)
+        self.assertEqual(claimed, [jobs[0].id, jobs[1].id, jobs[3].id, jobs[4].id])
+        self.assertIsNone(claim_job('c'))
+
+    def test_requeue_stale(self):
+        stale, exhausted, alive = self.create_jobs(3)
+        now = timezone.now()
+        ReportJob.objects.filter(id__in=[stale.id, exhausted.id]).update(
+            status=ReportJob.STATUS_RUNNING, worker='gone', attempts=1,
+            heartbeat_at=now - STALE_AFTER - timedelta(seconds=1),
+        )
+        ReportJob.objects.filter(id=exhausted.id).update(attempts=MAX_ATTEMPTS)
+        ReportJob.objects.filter(id=alive.id).update(status=ReportJob.STATUS_RUNNING, worker='busy', heartbeat_at=now)
+
+        self.assertEqual(requeue_stale(now), (1, 1))
+        for job in (stale, exhausted, alive):
+            job.refresh_from_db()
+        self.assertEqual((stale.status, stale.worker), (ReportJob.STATUS_PENDING, ''))
+        self.assertEqual(exhausted.status, ReportJob.STATUS_FAILED)
+        self.assertEqual((alive.status, alive.worker), (ReportJob.STATUS_RUNNING, 'busy'))
+        # Возвращенное задание захватывается снова, с новой попыткой
+        self.assertEqual(claim_job('next').attempts, 2)
+
+    def test_work_builds_files(self):
+        export, _ = create_job(self.user, 'export_csv', {'filters': {'date_from': '2024-01-03'}})
+        report, _ = create_job(self.user, 'yearly_html', {'year': 2024})
+        broken, _ = create_job(self.user, 'yearly_html', {'year': 'abc'})
+        with tempfile.TemporaryDirectory() as root, mock.patch('carbon_app.reports.REPORTS_ROOT', Path(root)):
+            self.assertEqual(work('test', once=True), (2, 1))
+            export.refresh_from_db()
+            content = (Path(root) / export.file_name).read_text()
+        self.assertEqual((export.status, export.progress, export.rows), (ReportJob.STATUS_DONE, 100, 5))
+        self.assertEqual(len(content.splitlines()), 6)
+        report.refresh_from_db()
+        broken.refresh_from_db()
+        self.assertEqual(report.status, ReportJob.STATUS_DONE)
+        self.assertEqual(broken.status, ReportJob.STATUS_FAILED)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QuantityValidationTests(TestCase):
+    """Формы добавления активности и калькулятора не сохраняют nan/inf"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('forms')
+        cls.category = ActivityCategory.objects.create(name='transport')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_add_activity(self):
+        for value in ('nan', 'inf', '-inf'):
+            self.client.post(reverse('add_activity'), {
+                'category': self.category.id, 'activity_type': 'автобус', 'quantity': value, 'unit': 'км',
+            })
+        self.assertFalse(UserActivity.objects.exists())
+
+    def test_calculator_page(self):
+        for value in ('nan', 'inf'):
+            response = self.client.post(reverse('calculator'), {
+                'category': 'transport', 'activity_type': 'автобус', 'quantity': value,
+            })
+            self.assertIsNone(response.context['result'])
+        self.assertFalse(UserActivity.objects.exists())
+
+
+class FactorIndexTests(TestCase):
+    """Статистика поиска коэффициентов и сброс индекса при изменении справочника"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = ActivityCategory.objects.create(name='transport')
+
+    def test_stats_count_outcomes(self):
+        index = FactorIndex()
+        index.resolve('автобус', self.category.id, 'км')
+        index.resolve('автобус', self.category.id, 'миля')
+        index.resolve_many([
+            ('автобус', self.category.id, 'km', 'global'),
+            ('неизвестно', self.category.id, 'км', 'global'),
+        ])
+        stats = index.stats()
+        self.assertEqual((stats['hits'], stats['conversions'], stats['misses'], stats['loads']), (2, 1, 1, 1))
+        self.assertEqual((stats['hit_rate'], stats['fallback_rate']), (0.75, 0.25))
+
+    def test_empty_stats(self):
+        stats = FactorIndex().stats()
+        self.assertEqual((stats['size'], stats['hit_rate'], stats['fallback_rate']), (0, 0, 0))
+
+    def test_invalidated_on_factor_save_and_delete(self):
+        factor_index.invalidate()
+        self.assertEqual(factor_index.resolve('автобус', self.category.id, 'км'), 0.07)
+
+        factor = EmissionFactor.objects.create(
+            activity_type='автобус', category=self.category, co2_per_unit=0.09, unit='км',
+        )
+        self.assertEqual(factor_index.resolve('автобус', self.category.id, 'км'), 0.09)
+
+        factor.co2_per_unit = 0.08
+        factor.save()
+        self.assertEqual(factor_index.resolve('автобус', self.category.id, 'км'), 0.08)
+
+        factor.delete()
+        self.assertEqual(factor_index.resolve('автобус', self.category.id, 'км'), 0.07)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, METRICS_TOKEN='', METRICS_ALLOWED_IPS=[])
+class MetricsTests(TestCase):
+    """Замеры MetricsMiddleware и доступ к /metrics"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('metrics')
+        cls.staff = User.objects.create_user('metrics-staff', is_staff=True)
+        category = ActivityCategory.objects.create(name='transport')
+        UserActivity.objects.bulk_create([
+            UserActivity(user=cls.user, category=category, activity_type='автобус', quantity=i + 1,
+                         unit='км', date=date(2024, 1, 1) + timedelta(days=i), calculated_co2=0.07 * (i + 1))
+            for i in range(5)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        metrics_registry.reset()
+
+    def test_records_view(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse('activities_list'))
+        requests, errors, _, buckets, queries, _ = metrics_registry.snapshot()['activities_list']
+        self.assertEqual((requests, errors, sum(buckets)), (1, 0, 1))
+        self.assertEqual(queries, len(captured))
+
+    async def test_records_async_view(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(metrics_registry.snapshot()['dashboard'][0], 1)
+
+    def test_streaming_recorded_on_close(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('export_activities', args=['csv']))
+            # Тело еще не прочитано — замер не закончен
+            self.assertNotIn('export_activities', metrics_registry.snapshot())
+            body = b''.join(response.streaming_content)
+        self.assertEqual(len(body.splitlines()), 6)
+        requests, _, _, _, queries, _ = metrics_registry.snapshot()['export_activities']
+        self.assertEqual(requests, 1)
+        # Учтены и запросы генератора выгрузки
+        self.assertEqual(queries, len(captured))
+
+    def test_forbidden_by_default(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    def test_staff_allowed(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('carbon_view_requests_total', response.content.decode())
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='s3cret').status_code, 403)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_allowed_ips(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.5').status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RollupSignalTests(TestCase):
+    """Сигналы UserActivity поддерживают сводные таблицы в согласии с сырыми данными"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('rollups')
+        cls.transport = ActivityCategory.objects.create(name='transport')
+        cls.food = ActivityCategory.objects.create(name='food')
+
+    def setUp(self):
+        cache.clear()
+
+    def add(self, quantity, day=date(2024, 1, 10), category=None, activity_type='автобус', unit='км'):
+        return UserActivity.objects.create(
+            user=self.user, category=category or self.transport, activity_type=activity_type,
+            quantity=quantity, unit=unit, date=day,
+        )
+
+    def month(self, category, start=date(2024, 1, 1)):
+        return MonthlyEmission.objects.values_list('co2_total', 'activity_count').get(
+            user=self.user, category=category, period_start=start,
+        )
+
+    def test_create_and_update(self):
+        activity = self.add(10)
+        self.add(20)
+        self.assertEqual(verify(), [])
+        self.assertAlmostEqual(self.month(self.transport)[0], 2.1)
+
+        activity.quantity = 30
+        activity.save()
+        self.assertEqual(verify(), [])
+        co2, count = self.month(self.transport)
+        self.assertAlmostEqual(co2, 3.5)
+        self.assertEqual(count, 2)
+
+    def test_move_date_and_category(self):
+        activity = self.add(10)
+        activity.date = date(2024, 2, 3)
+        activity.save()
+        self.assertEqual(verify(), [])
+        self.assertEqual(self.month(self.transport), (0.0, 0))
+
+        activity = UserActivity.objects.get(pk=activity.pk)
+        activity.category = self.food
+        activity.activity_type = 'говядина'
+        activity.unit = 'кг'
+        activity.save()
+        self.assertEqual(verify(), [])
+        co2, count = self.month(self.food, date(2024, 2, 1))
+        self.assertAlmostEqual(co2, 270.0)
+        self.assertEqual(count, 1)
+
+    def test_delete(self):
+        self.add(10).delete()
+        self.add(20)
+        self.add(30)
+        UserActivity.objects.filter(quantity=30).delete()
+        self.assertEqual(verify(), [])
+        co2, count = self.month(self.transport)
+        self.assertAlmostEqual(co2, 1.4)
+        self.assertEqual(count, 1)
+
+    def test_delete_user(self):
+        self.add(10)
+        self.add(5, category=self.food, activity_type='говядина', unit='кг')
+        self.user.delete()
+        # Внешние ключи SQLite проверяются при фиксации транзакции
+        connection.check_constraints()
+        self.assertFalse(MonthlyEmission.objects.exists())
+        self.assertEqual(verify(), [])
+
+    def test_delete_category(self):
+        self.add(10)
+        self.add(5, category=self.food, activity_type='говядина', unit='кг')
+        self.food.delete()
+        connection.check_constraints()
+        self.assertEqual(verify(), [])
+        self.assertEqual(MonthlyEmission.objects.filter(category_id=self.food.id).count(), 0)
+        self.assertAlmostEqual(self.month(self.transport)[0], 0.7)
+
+
+class PercentileRankTests(SimpleTestCase):
+    """Процентиль по гистограмме снимка: линейная интерполяция внутри корзины"""
+
+    edges = [0.0, 1.0, 2.0, 4.0]
+    sketch = {'count': 4, 'histogram': [1, 2, 1]}
+
+    def test_values(self):
+        cases = [
+            (0.0, 0.0),
+            (0.5, 12.5),
+            (1.0, 25.0),
+            (1.5, 50.0),
+            (3.0, 87.5),
+            (4.0, 100.0),
+            # За пределами шкалы — прижимается к краям
+            (-1.0, 0.0),
+            (100.0, 100.0),
+        ]
+        for value, expected in cases:
+            with self.subTest(value=value):
+                self.assertEqual(percentile_rank(self.sketch, value, self.edges), expected)
+
+    def test_empty_sketch(self):
+        self.assertIsNone(percentile_rank({'count': 0, 'histogram': [0, 0, 0]}, 1.0, self.edges))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CommunitySnapshotTests(TestCase):
+    """Снимок сообщества по сводным таблицам"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice')
+        cls.bob = User.objects.create_user('bob')
+        cls.transport = ActivityCategory.objects.create(name='transport')
+        cls.food = ActivityCategory.objects.create(name='food')
+        for user, category, activity_type, quantity, unit, day in [
+            (cls.alice, cls.transport, 'автобус', 100, 'км', date(2024, 3, 10)),
+            (cls.alice, cls.food, 'говядина', 1, 'кг', date(2024, 2, 20)),
+            # Вне окна и вне прошлого месяца
+            (cls.alice, cls.transport, 'автобус', 1000, 'км', date(2024, 1, 5)),
+            (cls.bob, cls.transport, 'автобус', 300, 'км', date(2024, 3, 1)),
+        ]:
+            UserActivity.objects.create(
+                user=user, category=category, activity_type=activity_type, quantity=quantity, unit=unit, date=day,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_snapshot(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            data = compute_snapshot(date(2024, 3, 15))
+
+        self.assertEqual((data['computed_on'], data['month'], data['users_count']), ('2024-03-15', '2024-02-01', 2))
+        self.assertEqual(data['categories'], {str(self.transport.id): 'transport', str(self.food.id): 'food'})
+
+        daily = data['daily']
+        # alice: (7 + 27) / 30, bob: 21 / 30
+        self.assertEqual(daily['all']['count'], 2)
+        self.assertEqual(daily['all']['mean'], round((34 / 30 + 21 / 30) / 2, 3))
+        self.assertEqual(daily[str(self.transport.id)]['mean'], round(14 / 30, 3))
+        self.assertEqual(daily[str(self.food.id)]['count'], 1)
+        self.assertEqual(sum(daily['all']['histogram']), 2)
+
+        monthly = data['monthly']
+        self.assertEqual(set(monthly), {'all', str(self.food.id)})
+        self.assertEqual((monthly['all']['count'], monthly['all']['mean']), (1, 27.0))
+
+        # У bob выбросы меньше, чем у alice
+        self.assertLess(percentile_rank(daily['all'], 21 / 30, data['edges']), 50)
+        self.assertGreater(percentile_rank(daily['all'], 34 / 30, data['edges']), 50)
+
+    def test_empty(self):
+        data = compute_snapshot(date(2020, 1, 1))
+        self.assertEqual((data['users_count'], data['daily'], data['monthly']), (0, {}, {}))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncViewTests(TestCase):
+    """Async-представления дашборда и рекомендаций через AsyncClient"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('async')
+        cls.other = User.objects.create_user('async-other')
+        category = ActivityCategory.objects.create(name='transport')
+        today = timezone.localdate()
+        for quantity in (100, 200):
+            UserActivity.objects.create(
+                user=cls.user, category=category, activity_type='автобус', quantity=quantity, unit='км', date=today,
+            )
+        recommendations = Recommendation.objects.bulk_create([
+            Recommendation(title='Велосипед', description='-', category='transport', co2_saving=10),
+            Recommendation(title='Меньше мяса', description='-', category='food', co2_saving=20),
+        ])
+        cls.own = UserRecommendation.objects.create(user=cls.user, recommendation=recommendations[0])
+        UserRecommendation.objects.create(user=cls.user, recommendation=recommendations[1], is_viewed=True)
+        cls.foreign = UserRecommendation.objects.create(user=cls.other, recommendation=recommendations[0])
+
+    def setUp(self):
+        cache.clear()
+
+    async def login(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+
+    async def test_anonymous_redirected(self):
+        for name, args in [('dashboard', []), ('recommendations', []), ('mark_recommendation_viewed', [self.own.id])]:
+            with self.subTest(view=name):
+                url = reverse(name, args=args)
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, 302)
+                self.assertEqual(response.url, f'{settings.LOGIN_URL}?next={url}')
+
+    async def test_dashboard(self):
+        await self.login()
+        response = await self.async_client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.context['total_co2'], response.context['activity_count']), (21.0, 2))
+
+        # Повторный запрос — контекст из кэша, пока данные не изменились
+        with mock.patch('carbon_app.views.abuild_dashboard_context') as build:
+            response = await self.async_client.get(reverse('dashboard'))
+        build.assert_not_called()
+        self.assertEqual(response.context['total_co2'], 21.0)
+
+    async def test_recommendations(self):
+        await self.login()
+        response = await self.async_client.get(reverse('recommendations'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['stats'], {'applied': 0, 'total': 2, 'new': 1})
+        self.assertEqual(set(response.context['recs_by_category']), {'transport', 'food'})
+
+    async def test_mark_viewed_and_applied(self):
+        await self.login()
+        for name in ('mark_recommendation_viewed', 'mark_recommendation_applied'):
+            response = await self.async_client.post(reverse(name, args=[self.own.id]))
+            self.assertEqual((response.status_code, response.json()), (200, {'success': True}))
+        own = await UserRecommendation.objects.aget(pk=self.own.pk)
+        self.assertTrue(own.is_viewed and own.is_applied)
+
+    async def test_foreign_recommendation_not_found(self):
+        await self.login()
+        for name in ('mark_recommendation_viewed', 'mark_recommendation_applied'):
+            response = await self.async_client.post(reverse(name, args=[self.foreign.id]))
+            self.assertEqual((response.status_code, response.json()), (404, {'success': False}))
+        foreign = await UserRecommendation.objects.aget(pk=self.foreign.pk)
+        self.assertFalse(foreign.is_viewed or foreign.is_applied)
+
+
+class Interrupted(Exception):
+    pass
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RecalculationTests(TestCase):
+    """Пересчет calculated_co2 пачками: возобновление, пропуск неизмененных, сводные таблицы"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('recalc')
+        cls.transport = ActivityCategory.objects.create(name='transport')
+        cls.food = ActivityCategory.objects.create(name='food')
+        for i in range(6):
+            UserActivity.objects.create(
+                user=cls.user, category=cls.transport, activity_type='автобус', quantity=10 * (i + 1), unit='км',
+                date=date(2024, 1, 1) + timedelta(days=10 * i),
+            )
+        cls.beef = UserActivity.objects.create(
+            user=cls.user, category=cls.food, activity_type='говядина', quantity=1, unit='кг', date=date(2024, 1, 3),
+        )
+
+    def setUp(self):
+        cache.clear()
+        factor_index.invalidate()
+        self.checkpoint = Path(self.enterContext(tempfile.TemporaryDirectory())) / 'recalculate.json'
+
+    def change_bus_factor(self):
+        factor = EmissionFactor.objects.create(
+            activity_type='автобус', category=self.transport, co2_per_unit=0.1, unit='км',
+        )
+        return factor_keys([factor])
+
+    def bus_co2(self):
+        return list(
+            UserActivity.objects.filter(activity_type='автобус').order_by('id').values_list('calculated_co2', flat=True)
+        )
+
+    def test_unchanged_rows_skipped(self):
+        report = recalculate(chunk_size=3, checkpoint=self.checkpoint)
+        self.assertEqual((report.processed, report.updated, report.users), (7, 0, set()))
+        self.assertTrue(read_checkpoint(self.checkpoint).finished)
+
+        self.change_bus_factor()
+        report = recalculate(chunk_size=3, checkpoint=self.checkpoint)
+        self.assertEqual((report.processed, report.updated, report.users), (7, 6, {self.user.id}))
+        self.assertEqual(UserActivity.objects.get(pk=self.beef.pk).calculated_co2, 27.0)
+        self.assertEqual(verify(), [])
+
+    def test_resume_after_interrupt(self):
+        keys = self.change_bus_factor()
+
+        def interrupt(report):
+            raise Interrupted
+
+        with self.assertRaises(Interrupted):
+            recalculate(keys, chunk_size=2, checkpoint=self.checkpoint, progress=interrupt)
+        saved = read_checkpoint(self.checkpoint)
+        self.assertEqual((saved.total, saved.processed, saved.updated, saved.finished), (6, 2, 2, False))
+        # Первая пачка уже зафиксирована вместе с поправками сводных таблиц
+        self.assertEqual([round(co2, 6) for co2 in self.bus_co2()], [1.0, 2.0, 2.1, 2.8, 3.5, 4.2])
+        self.assertEqual(verify(), [])
+
+        # Ключи берутся из контрольной точки, обход продолжается с last_id
+        report = recalculate(None, chunk_size=2, checkpoint=self.checkpoint)
+        self.assertEqual((report.total, report.processed, report.updated, report.finished), (6, 6, 6, True))
+        self.assertEqual([round(co2, 6) for co2 in self.bus_co2()], [1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+        self.assertEqual(verify(), [])
+        co2, count = MonthlyEmission.objects.values_list('co2_total', 'activity_count').get(
+            user=self.user, category=self.transport, period_start=date(2024, 1, 1),
+        )
+        # В январе поездки 1, 11, 21 и 31 числа: (10 + 20 + 30 + 40) × 0.1
+        self.assertAlmostEqual(co2, 10.0)
+        self.assertEqual(count, 4)
+
+
+class RegionalFactorTests(SimpleTestCase):
+    """Цепочка регионов в снимке коэффициентов: регион → родитель → global"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.registry = build_registry(load_units(), [(1, 'transport'), (2, 'food')], [
+            ('автобус', 1, 'км', 'RU', 0.05),
+            ('автобус', 1, 'km', ' ru-mow ', 0.03),
+            ('говядина', 2, 'кг', 'RU', 20.0),
+        ])
+
+    def test_chain(self):
+        cases = [
+            # (тип, категория, единица, регион) → (коэффициент, исход)
+            (('автобус', 1, 'км', 'RU-MOW'), (0.03, LOOKUP_EXACT)),
+            (('автобус', 1, 'км', 'RU-SPE'), (0.05, LOOKUP_EXACT)),
+            (('автобус', 1, 'км', 'RU'), (0.05, LOOKUP_EXACT)),
+            (('автобус', 1, 'км', 'DE-BE'), (0.07, LOOKUP_EXACT)),
+            (('автобус', 1, 'км', GLOBAL_REGION), (0.07, LOOKUP_EXACT)),
+            # Для RU-MOW нет своей строки по говядине — берется родительская RU
+            (('говядина', 2, 'кг', 'RU-MOW'), (20.0, LOOKUP_EXACT)),
+            (('автобус', 1, 'миля', 'RU-MOW'), (0.03 * 1.609344, LOOKUP_CONVERTED)),
+        ]
+        for key, (co2_per_unit, outcome) in cases:
+            with self.subTest(key=key):
+                result = self.registry.resolve_outcome(*key)
+                self.assertAlmostEqual(result[0], co2_per_unit)
+                self.assertEqual(result[1], outcome)
+
+    def test_effective_region(self):
+        self.assertEqual(self.registry.regions, {'RU', 'RU-MOW'})
+        cases = [('RU-MOW', 'RU-MOW'), ('RU-SPE', 'RU'), ('DE', GLOBAL_REGION), (GLOBAL_REGION, GLOBAL_REGION)]
+        for region, expected in cases:
+            with self.subTest(region=region):
+                self.assertEqual(self.registry.effective_region(region), expected)
+
+    def test_normalize_and_parent(self):
+        self.assertEqual([normalize_region(code) for code in (None, '', ' Global ', 'ru-mow')],
+                         [GLOBAL_REGION, GLOBAL_REGION, GLOBAL_REGION, 'RU-MOW'])
+        self.assertEqual([parent_region(code) for code in ('RU-MOW', 'RU', GLOBAL_REGION)], ['RU', GLOBAL_REGION, None])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class UserRegionTests(TestCase):
+    """Коэффициент активности зависит от региона профиля владельца"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = ActivityCategory.objects.create(name='transport')
+        EmissionFactor.objects.bulk_create([
+            EmissionFactor(activity_type='автобус', category=cls.category, unit='км', region='RU', co2_per_unit=0.05),
+            EmissionFactor(activity_type='автобус', category=cls.category, unit='км', region='RU-MOW', co2_per_unit=0.03),
+        ])
+
+    def setUp(self):
+        cache.clear()
+        factor_index.invalidate()
+
+    def co2(self, username, region=None):
+        user = User.objects.create_user(username)
+        if region is not None:
+            UserProfile.objects.create(user=user, region=region)
+        activity = UserActivity.objects.create(
+            user=user, category=self.category, activity_type='автобус', quantity=100, unit='км', date=date(2024, 1, 1),
+        )
+        return activity.calculated_co2
+
+    def test_profile_regions(self):
+        self.assertAlmostEqual(self.co2('moscow', 'ru-mow'), 3.0)
+        self.assertAlmostEqual(self.co2('kazan', 'RU-TA'), 5.0)
+        self.assertAlmostEqual(self.co2('berlin', 'DE-BE'), 7.0)
+        # Без профиля и с пустым регионом — global
+        self.assertAlmostEqual(self.co2('nobody'), 7.0)
+        self.assertAlmostEqual(self.co2('blank', ''), 7.0)
+
+    def test_region_change_forgets_cached_region(self):
+        self.assertAlmostEqual(self.co2('mover', 'RU'), 5.0)
+        profile = UserProfile.objects.get(user__username='mover')
+        profile.region = 'RU-MOW'
+        profile.save()
+        self.assertEqual(user_region(profile.user_id), 'RU-MOW')
+
+
+class UnitTests(SimpleTestCase):
+    """Нормализация написания единиц и пересчет между ними"""
+
+    def test_normalize_unit(self):
+        cases = [
+            ('kwh', 'кВт·ч'),
+            ('KWH', 'кВт·ч'),
+            ('кВт·ч', 'кВт·ч'),
+            ('квт ч', 'кВт·ч'),
+            ('кВт*ч', 'кВт·ч'),
+            ('mi', 'миля'),
+            ('miles', 'миля'),
+            ('миля', 'миля'),
+            ('KM', 'км'),
+            (' km ', 'км'),
+            ('Километров', 'км'),
+            ('m3', 'м³'),
+            ('куб. м', 'м³'),
+            # Незнакомая единица возвращается как есть
+            (' порция ', 'порция'),
+            ('', ''),
+            (None, ''),
+        ]
+        for text, expected in cases:
+            with self.subTest(text=text):
+                self.assertEqual(normalize_unit(text), expected)
+
+    def test_conversion_factor(self):
+        cases = [
+            ('км', 'км', 1.0),
+            ('миля', 'км', 1.609344),
+            ('км', 'миля', 1 / 1.609344),
+            ('г', 'кг', 0.001),
+            ('МВт·ч', 'кВт·ч', 1000.0),
+            ('Гкал', 'кВт·ч', 1163.0),
+            # Разные величины и незнакомые единицы
+            ('км', 'кг', None),
+            ('кВт·ч', 'л', None),
+            ('порция', 'кг', None),
+            ('km', 'км', None),
+        ]
+        for from_unit, to_unit, expected in cases:
+            with self.subTest(from_unit=from_unit, to_unit=to_unit):
+                factor = conversion_factor(from_unit, to_unit)
+                if expected is None:
+                    self.assertIsNone(factor)
+                else:
+                    self.assertAlmostEqual(factor, expected)
+
+    def test_aliases_are_unambiguous(self):
+        for canonical, aliases in ALIASES.items():
+            self.assertIn(canonical, UNITS)
+            for alias in aliases:
+                self.assertEqual(ALIAS_TABLE[clean_unit(alias)], canonical, alias)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ActivityUnitTests(TestCase):
+    """Активность хранит каноническую единицу и пересчитывает количество по коэффициенту"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('units')
+        cls.transport = ActivityCategory.objects.create(name='transport')
+        cls.energy = ActivityCategory.objects.create(name='energy')
+
+    def setUp(self):
+        cache.clear()
+
+    def add(self, category, activity_type, quantity, unit):
+        activity = UserActivity.objects.create(
+            user=self.user, category=category, activity_type=activity_type, quantity=quantity, unit=unit,
+            date=date(2024, 1, 1),
+        )
+        return UserActivity.objects.values_list('unit', 'calculated_co2').get(pk=activity.pk)
+
+    def test_stored_unit_is_canonical(self):
+        cases = [
+            (self.energy, 'электричество', 10, 'kwh', 'кВт·ч', 5.0),
+            (self.energy, 'электричество', 10, 'кВт·ч', 'кВт·ч', 5.0),
+            (self.energy, 'электричество', 1, 'MWh', 'МВт·ч', 500.0),
+            (self.transport, 'автобус', 100, 'KM', 'км', 7.0),
+            (self.transport, 'автобус', 10, 'miles', 'миля', 0.7 * 1.609344),
+            (self.transport, 'автобус', 10, 'mi', 'миля', 0.7 * 1.609344),
+        ]
+        for category, activity_type, quantity, unit, stored, co2 in cases:
+            with self.subTest(unit=unit):
+                stored_unit, calculated_co2 = self.add(category, activity_type, quantity, unit)
+                self.assertEqual(stored_unit, stored)
+                self.assertAlmostEqual(calculated_co2, co2)
+
+    def test_incompatible_unit_uses_category_default(self):
+        # кг не пересчитываются в км: коэффициент автобуса не подходит,
+        # берется среднее по категории без пересчета единиц
+        stored_unit, calculated_co2 = self.add(self.transport, 'автобус', 10, 'kg')
+        self.assertEqual(stored_unit, 'кг')
+        self.assertAlmostEqual(calculated_co2, 10 * CATEGORY_DEFAULTS['transport'][1])
+
+
+class SuggestionIndexTests(SimpleTestCase):
+    """Подсказки типов активности: префиксы, транслитерация, опечатки, ранжирование"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.index = SuggestionIndex(
+            Suggestion(activity_type, category, unit, 1.0)
+            for activity_type, category, unit in [
+                ('автомобиль', 'transport', 'км'),
+                ('автобус', 'transport', 'км'),
+                ('скоростной поезд', 'transport', 'км'),
+                ('поезд', 'transport', 'км'),
+                ('электричка', 'transport', 'км'),
+                ('электричество', 'energy', 'кВт·ч'),
+                ('Сёмга', 'food', 'кг'),
+            ]
+        )
+
+    def names(self, query, **kwargs):
+        return [suggestion.activity_type for suggestion in self.index.search(query, **kwargs)]
+
+    def test_prefix(self):
+        cases = [
+            # Короткие названия выше длинных
+            ('авто', ['автобус', 'автомобиль']),
+            ('АВТОМ', ['автомобиль']),
+            ('avto', ['автобус', 'автомобиль']),
+            # Начало названия выше начала слова внутри него
+            ('поез', ['поезд', 'скоростной поезд']),
+            ('семга', ['Сёмга']),
+            ('электрич', ['электричка', 'электричество']),
+        ]
+        for query, expected in cases:
+            with self.subTest(query=query):
+                # Нечеткие совпадения добавляются после продолжений префикса
+                self.assertEqual(self.names(query)[:len(expected)], expected)
+
+    def test_category_and_limit(self):
+        self.assertEqual(self.names('электрич', category='energy'), ['электричество'])
+        self.assertEqual(self.names('авто', limit=1), ['автобус'])
+
+    def test_fuzzy(self):
+        self.assertEqual(self.names('автобсу')[0], 'автобус')
+        self.assertEqual(self.names('poezd'), ['поезд', 'скоростной поезд'])
+        self.assertEqual(self.names('   '), [])
+        self.assertEqual(self.names('xyz'), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SuggestionRebuildTests(TestCase):
+    """Индекс подсказок пересобирается вместе со снимком коэффициентов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('suggest')
+        cls.transport = ActivityCategory.objects.create(name='transport')
+
+    def setUp(self):
+        cache.clear()
+        factor_index.invalidate()
+        self.client.force_login(self.user)
+
+    def suggest(self, query):
+        response = self.client.get(reverse('activity_type_suggestions'), {'q': query})
+        return [item['activity_type'] for item in response.json()['results']]
+
+    def test_new_activity_type(self):
+        self.assertNotIn('гироскутер', self.suggest('гиро'))
+        EmissionFactor.objects.create(activity_type='гироскутер', category=self.transport, co2_per_unit=0.01, unit='km')
+        self.assertEqual(self.suggest('гиро'), ['гироскутер'])
+        self.assertEqual(self.suggest('giro'), ['гироскутер'])
+        suggestion = factor_index.registry.suggestions.search('гиро')[0]
+        self.assertEqual((suggestion.category, suggestion.unit), ('transport', 'км'))
+
+
+class ScoringTests(SimpleTestCase):
+    """Векторный расчет оценок рекомендаций на значениях, посчитанных вручную"""
+
+    # Категории активностей 1 (транспорт) и 2 (питание); рекомендации 10
+    # (транспорт, easy, 10 кг), 20 (питание, medium, 20 кг), 30 (общая, hard, 8 кг)
+    catalog = ScoringCatalog(
+        ids=np.array([10, 20, 30]),
+        category_ids=np.array([1, 2]),
+        relevance=np.array([[1.0, 0.0, GENERAL_RELEVANCE], [0.0, 1.0, GENERAL_RELEVANCE]]),
+        value=np.array([10 * 1.0, 20 * 0.7, 8 * 0.4]),
+    )
+    shares = np.array([[0.5, 0.5], [1.0, 0.0], [0.0, 0.0]])
+
+    def test_score(self):
+        expected = [
+            [5.0, 7.0, 0.8],
+            [10.0, 0.0, 0.8],
+            [0.0, 0.0, 0.0],
+        ]
+        np.testing.assert_allclose(score(self.shares, self.catalog), expected)
+
+        assigned = np.zeros((3, 3), dtype=bool)
+        assigned[1, 0] = True
+        scores = score(self.shares, self.catalog, assigned)
+        np.testing.assert_allclose(scores[1], [0.0, 0.0, 0.8])
+
+    def test_top(self):
+        assigned = np.zeros((3, 3), dtype=bool)
+        assigned[1, 0] = True
+        scores = score(self.shares, self.catalog, assigned)
+        # Нулевые оценки не предлагаются
+        self.assertEqual(top_recommendations(scores, self.catalog, 2), [[20, 10], [30], []])
+        self.assertEqual(top_recommendations(scores, self.catalog, 10), [[20, 10, 30], [30], []])
+        self.assertEqual(top_recommendations(scores, self.catalog, 0), [[], [], []])
+
+    def test_empty(self):
+        scores = score(np.zeros((0, 2)), self.catalog)
+        self.assertEqual(scores.shape, (0, 3))
+        self.assertEqual(top_recommendations(scores, self.catalog, 3), [])
+
+        empty = ScoringCatalog(ids=np.array([], dtype=np.int64), category_ids=np.array([1, 2]),
+                               relevance=np.zeros((2, 0)), value=np.zeros(0))
+        self.assertEqual(top_recommendations(score(self.shares, empty), empty, 3), [[], [], []])
+        self.assertEqual(pick_recommendations([], 3, catalog=self.catalog), {})
+        self.assertEqual(pick_recommendations([1, 2], 3, catalog=empty), {1: [], 2: []})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PickRecommendationsTests(TestCase):
+    """Каталог и доли категорий из БД"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('scoring')
+        cls.idle = User.objects.create_user('idle')
+        cls.transport = ActivityCategory.objects.create(name='transport')
+        cls.food = ActivityCategory.objects.create(name='food')
+        cls.bus, cls.beef, cls.general, cls.inactive = Recommendation.objects.bulk_create([
+            Recommendation(title='Велосипед', description='-', category='transport', co2_saving=10, difficulty='low'),
+            Recommendation(title='Меньше мяса', description='-', category='food', co2_saving=20, difficulty='medium'),
+            Recommendation(title='Общий', description='-', category='general', co2_saving=8, difficulty='high'),
+            Recommendation(title='Архив', description='-', category='food', co2_saving=100, is_active=False),
+        ])
+        today = timezone.localdate()
+        # 21 кг транспорта и 27 кг питания за окно, еще 27 кг — до окна
+        for category, activity_type, quantity, unit, day in [
+            (cls.transport, 'автобус', 300, 'км', today),
+            (cls.food, 'говядина', 1, 'кг', today - timedelta(days=5)),
+            (cls.food, 'говядина', 1, 'кг', today - timedelta(days=SCORING_WINDOW_DAYS)),
+        ]:
+            UserActivity.objects.create(
+                user=cls.user, category=category, activity_type=activity_type, quantity=quantity, unit=unit, date=day,
+            )
+
+    def test_catalog(self):
+        catalog = load_catalog()
+        self.assertEqual(catalog.ids_list, [self.bus.id, self.beef.id, self.general.id])
+        np.testing.assert_allclose(catalog.value, [10.0, 14.0, 3.2])
+        np.testing.assert_allclose(catalog.relevance, [[1, 0, GENERAL_RELEVANCE], [0, 1, GENERAL_RELEVANCE]])
+
+    def test_pick(self):
+        catalog = load_catalog()
+        np.testing.assert_allclose(
+            category_shares([self.user.id, self.idle.id], catalog), [[21 / 48, 27 / 48], [0.0, 0.0]],
+        )
+        # 21/48 × 10 ≈ 4.4; 27/48 × 14 ≈ 7.9; 0.25 × 3.2 = 0.8
+        picks = pick_recommendations([self.user.id, self.idle.id], 2, catalog)
+        self.assertEqual(picks, {self.user.id: [self.beef.id, self.bus.id], self.idle.id: []})
+
+        UserRecommendation.objects.create(user=self.user, recommendation=self.beef)
+        picks = pick_recommendations([self.user.id], 2, catalog)
+        self.assertEqual(picks, {self.user.id: [self.bus.id, self.general.id]})
@@ -0,0 +1,110 @@
+import re
+from functools import lru_cache
+
+# Каноническая единица → (величина, сколько базовых единиц величины в ней).
+# Базовые единицы: км, кг, л, кВт·ч
+UNITS = {
+    # Расстояние
+    'км': ('distance', 1.0),
+    'м': ('distance', 0.001),
+    'миля': ('distance', 1.609344),
+    'морская миля': ('distance', 1.852),
+    'фут': ('distance', 0.0003048),
+    # Масса
+    'кг': ('mass', 1.0),
+    'г': ('mass', 0.001),
+    'т': ('mass', 1000.0),
+    'ц': ('mass', 100.0),
+    'фунт': ('mass', 0.45359237),
+    'унция': ('mass', 0.028349523125),
+    # Объем
+    'л': ('volume', 1.0),
+    'мл': ('volume', 0.001),
+    'м³': ('volume', 1000.0),
+    'галлон': ('volume', 3.785411784),
+    'баррель': ('volume', 158.987294928),
+    # Энергия
+    'кВт·ч': ('energy', 1.0),
+    'Вт·ч': ('energy', 0.001),
+    'МВт·ч': ('energy', 1000.0),
+    'ГВт·ч': ('energy', 1000000.0),
+    'Гкал': ('energy', 1163.0),
+    'ккал': ('energy', 0.001163),
+    'МДж': ('energy', 1 / 3.6),
+    'ГДж': ('energy', 1000 / 3.6),
+}
+
+# Варианты написания → каноническая единица (сравниваются после clean_unit)
+ALIASES = {
+    'км': ('km', 'километр', 'километра', 'километров', 'kilometer', 'kilometers', 'kilometre', 'kilometres'),
+    'м': ('m', 'метр', 'метра', 'метров', 'meter', 'meters', 'metre', 'metres'),
+    'миля': ('mi', 'mile', 'miles', 'мили', 'миль'),
+    'морская миля': ('nmi', 'морские мили', 'морских миль', 'nautical mile', 'nautical miles'),
+    'фут': ('ft', 'foot', 'feet', 'фута', 'футов'),
+    'кг': ('kg', 'kgs', 'килограмм', 'килограмма', 'килограммов', 'kilogram', 'kilograms'),
+    'г': ('g', 'гр', 'грамм', 'грамма', 'граммов', 'gram', 'grams'),
+    'т': ('t', 'тонна', 'тонны', 'тонн', 'tonne', 'tonnes'),
+    'ц': ('центнер', 'центнера', 'центнеров'),
+    'фунт': ('lb', 'lbs', 'pound', 'pounds', 'фунта', 'фунтов'),
+    'унция': ('oz', 'ounce', 'ounces', 'унции', 'унций'),
+    'л': ('l', 'ltr', 'литр', 'литра', 'литров', 'liter', 'liters', 'litre', 'litres'),
+    'мл': ('ml', 'миллилитр', 'миллилитра', 'миллилитров'),
+    'м³': ('м3', 'm3', 'm³', 'куб.м', 'куб м', 'кубометр', 'кубометра', 'кубометров', 'cbm'),
+    'галлон': ('gal', 'gallon', 'gallons', 'галлона', 'галлонов'),
+    'баррель': ('bbl', 'barrel', 'barrels', 'барреля', 'баррелей'),
+    'кВт·ч': ('kwh', 'kw·h', 'kw*h', 'квт*ч', 'квт.ч', 'квт ч', 'квтч'),
+    'Вт·ч': ('wh', 'w·h', 'вт*ч', 'вт ч'),
+    'МВт·ч': ('mwh', 'mw·h', 'мвт*ч', 'мвт ч'),
+    'ГВт·ч': ('gwh', 'gw·h', 'гвт*ч', 'гвт ч'),
+    'Гкал': ('gcal',),
+    'ккал': ('kcal',),
+    'МДж': ('mj',),
+    'ГДж': ('gj',),
+}
+
+_SEPARATORS = re.compile(r'[\s.·⋅*^\-]+')
+
+
+def clean_unit(text):
+    """Нижний регистр без пробелов, точек и знаков умножения: «кВт·ч» → «квтч»"""
+    return _SEPARATORS.sub('', text.strip().lower())
+
+
+def _compile_aliases():
+    table = {}
+    for canonical, aliases in ALIASES.items():
+        for alias in (canonical, *aliases):
+            table[clean_unit(alias)] = canonical
+    for canonical in UNITS:
+        table.setdefault(clean_unit(canonical), canonical)
+    return table
+
+
+ALIAS_TABLE = _compile_aliases()
+
+
+@lru_cache(maxsize=1024)
+def normalize_unit(text):
+    """Каноническое написание единицы; незнакомая единица возвращается как есть (без пробелов по краям)"""
+    text = (text or '').strip()
+    return ALIAS_TABLE.get(clean_unit(text), text)
+
+
+def unit_dimension(unit):
+    entry = UNITS.get(unit)
+    return entry[0] if entry else None
+
+
+def conversion_factor(from_unit, to_unit):
+    """Сколько to_unit в одной from_unit (для канонических единиц).
+
+    Количество q в from_unit равно q * conversion_factor(from_unit, to_unit)
+    в to_unit. None, если единицы неизвестны или измеряют разные величины.
+    """
+    if from_unit == to_unit:
+        return 1.0
+    source = UNITS.get(from_unit)
+    target = UNITS.get(to_unit)
+    if source is None or target is None or source[0] != target[0]:
+        return None
+    return source[1] / target[1]
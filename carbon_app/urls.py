@@ -5,9 +5,19 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('my-footprint/', views.dashboard, name='my_footprint'),
+    path('api/analytics/', views.analytics_api, name='analytics_api'),
     path('add-activity/', views.add_activity, name='add_activity'),
     path('activities/', views.activities_list, name='activities_list'),
+    path('activities/api/', views.activities_api, name='activities_api'),
+    path('activities/export/<str:fmt>/', views.export_activities, name='export_activities'),
+    path('activities/import/', views.import_activities, name='import_activities'),
+    path('reports/', views.reports_page, name='reports'),
+    path('reports/<int:job_id>/status/', views.report_status, name='report_status'),
+    path('reports/<int:job_id>/download/', views.download_report, name='download_report'),
     path('calculator/', views.calculator, name='calculator'),
+    path('api/calculator/', views.calculator_api, name='calculator_api'),
+    path('api/activity-types/', views.activity_type_suggestions, name='activity_type_suggestions'),
+    path('metrics', views.metrics, name='metrics'),
     path('activity/delete/<int:activity_id>/', views.delete_activity, name='delete_activity'),
     
     # Аутентификация
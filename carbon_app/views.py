@@ -1,85 +1,85 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Sum, Avg, Count
-from django.http import JsonResponse
+from django.db.models import Count, Q
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+import asyncio
 import json
-from collections import defaultdict
-from datetime import datetime, timedelta, date
+import math
+from datetime import date
 import random
-
-from .models import UserActivity, ActivityCategory, EmissionFactor, Recommendation
-from .forms import UserActivityForm
+from urllib.parse import urlencode
+
+from .models import UserActivity, ActivityCategory
+from .analytics import FootprintAnalytics, alist, period_series
+from .async_auth import aget_user, async_login_required
+from .cache import (
+    CATALOG_CACHE_TIMEOUT, aget_dashboard_context, cache_timeout, catalog_version, recommendation_catalog,
+)
+from .calculator import BatchError, calculate_batch
+from .community import (
+    alatest_snapshot, auser_daily_values, community_summary, compare_with_community, latest_snapshot,
+)
+from .exports import EXPORT_FORMATS, export_filename, export_rows, filter_activities, iter_encoded, iter_export
+from .factors import factor_index
+from .importers import ActivityImporter, detect_format
+from .metrics import metrics_registry, render_factor_stats, render_queue_stats
+from .pagination import DEFAULT_PAGE_SIZE, InvalidCursor, KeysetPage
+from .suggestions import DEFAULT_LIMIT as DEFAULT_SUGGESTIONS, MAX_LIMIT as MAX_SUGGESTIONS
+from .tasks import recommendation_queue, schedule_recommendation_refresh
 from django.contrib.auth import login, logout as auth_logout, authenticate
 from django.contrib.auth.forms import UserCreationForm
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 
 def home(request):
-    recommendations = Recommendation.objects.filter(is_active=True)
-    
-    rec_by_category = {}
-    for rec in recommendations:
-        if rec.category not in rec_by_category:
-            rec_by_category[rec.category] = []
-        rec_by_category[rec.category].append(rec)
-    
     context = {
-        'recommendations': recommendations,
-        'rec_by_category': rec_by_category,
+        # Функция, а не список: шаблон вызовет ее, только если фрагмент
+        # каталога не найден в кэше
+        'catalog': recommendation_catalog,
+        'catalog_version': catalog_version(),
+        'catalog_timeout': cache_timeout(CATALOG_CACHE_TIMEOUT),
+        'community': community_summary(latest_snapshot()),
     }
     return render(request, 'carbon_app/home.html', context)
 
-@login_required
-def dashboard(request):
+@async_login_required
+async def dashboard(request):
     """Личный кабинет пользователя с аналитикой"""
-    from datetime import date, timedelta
-    import json
-    
-    user_activities = UserActivity.objects.filter(user=request.user)
-    
+    user = await aget_user(request)
+    context, snapshot = await asyncio.gather(
+        aget_dashboard_context(user.id, lambda: abuild_dashboard_context(user)),
+        alatest_snapshot(),
+    )
+    # Снимок сообщества обновляется отдельно от данных пользователя,
+    # поэтому сравнение не кэшируется вместе с контекстом
+    context = {**context, 'community': compare_with_community(snapshot, context['community_values'])}
+    return render(request, 'carbon_app/dashboard.html', context)
+
+async def abuild_dashboard_context(user):
+    """Загружает данные дашборда; независимые запросы идут через asyncio.gather"""
+    analytics, community_values = await asyncio.gather(
+        FootprintAnalytics(user, load=False).aload(),
+        auser_daily_values(user),
+    )
+    return dashboard_context(analytics, community_values)
+
+def dashboard_context(analytics, community_values):
+    """Контекст дашборда из загруженной аналитики (результат кэшируется по версии данных)"""
     # 1. Базовая статистика
-    total_co2 = user_activities.aggregate(Sum('calculated_co2'))['calculated_co2__sum'] or 0
-    avg_daily = user_activities.aggregate(Avg('calculated_co2'))['calculated_co2__avg'] or 0
-    activity_count = user_activities.count()
+    total_co2 = analytics.total_co2
+    avg_daily = analytics.avg_co2
+    activity_count = analytics.activity_count
     
     # 2. Аналитика по категориям 
-    category_stats = []
-    chart_data = []
-    
-    if user_activities.exists():
-        categories = ActivityCategory.objects.all()
-        
-        for category in categories:
-            cat_activities = user_activities.filter(category=category)
-            cat_total = cat_activities.aggregate(Sum('calculated_co2'))['calculated_co2__sum'] or 0
-            cat_count = cat_activities.count()
-            
-            if cat_count > 0:
-                percentage = (cat_total / total_co2 * 100) if total_co2 > 0 else 0
-                category_stats.append({
-                    'category': category,
-                    'total_co2': round(cat_total, 2),
-                    'count': cat_count,
-                    'percentage': round(percentage, 1),
-                })
-                
-                chart_data.append({
-                    'category': category.name,
-                    'value': round(cat_total, 2),
-                    'color': '#28a745' if percentage < 30 else '#ffc107' if percentage < 60 else '#dc3545'
-                })
+    category_stats = analytics.category_stats
+    chart_data = analytics.chart_data
     
     # 3. Еженедельная статистика 
-    weekly_data = []
-    for i in range(6, -1, -1):
-        day = date.today() - timedelta(days=i)
-        day_activities = user_activities.filter(date=day)
-        day_total = day_activities.aggregate(Sum('calculated_co2'))['calculated_co2__sum'] or 0
-        weekly_data.append({
-            'day': day.strftime('%a'),
-            'date': day.strftime('%d.%m'),
-            'co2': round(day_total, 2),
-        })
+    weekly_data = analytics.weekly_data
     
     # 4. Рекомендации 
     recommendations = []
@@ -101,11 +101,6 @@ def dashboard(request):
                 'priority': 'medium'
             })
     
-    daily_average_global = 44  
-    user_daily_avg = avg_daily
-    comparison = "ниже" if user_daily_avg < daily_average_global else "выше"
-    comparison_percent = abs((user_daily_avg - daily_average_global) / daily_average_global * 100)
-
     context = {
         # Статистика
         'total_co2': round(total_co2, 2),
@@ -121,14 +116,29 @@ def dashboard(request):
         # Рекомендации
         'recommendations': recommendations,
         
-        'daily_average_global': daily_average_global,
-        'comparison': comparison,
-        'comparison_percent': round(comparison_percent, 1),
+        # Среднесуточные выбросы за окно снимка сообщества
+        'community_values': community_values,
         
-        'recent_activities': user_activities.order_by('-date')[:10],
+        'recent_activities': analytics.recent_activities,
     }
     
-    return render(request, 'carbon_app/dashboard.html', context)
+    return context
+
+@login_required
+def analytics_api(request):
+    """Выбросы по неделям/месяцам/годам и категориям в JSON"""
+    try:
+        start = request.GET.get('start')
+        end = request.GET.get('end')
+        data = period_series(
+            request.user,
+            period=request.GET.get('period', 'month'),
+            start=date.fromisoformat(start) if start else None,
+            end=date.fromisoformat(end) if end else None,
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(data)
 
 @login_required
 def add_activity(request):
@@ -153,7 +163,8 @@ def add_activity(request):
         
         try:
             quantity = float(quantity)
-            if quantity <= 0:
+            # float() принимает 'nan' и 'inf' — их не сохраняем
+            if not math.isfinite(quantity) or quantity <= 0:
                 errors.append('Количество должно быть больше 0')
         except ValueError:
             errors.append('Введите корректное число')
@@ -179,7 +190,8 @@ def add_activity(request):
                 activity.save()  # Автоматически рассчитается CO₂
                 
                 messages.success(request, '✅ Активность успешно добавлена!')
-                update_user_recommendations(request.user)
+                # Серия добавлений подряд даст одно обновление рекомендаций
+                schedule_recommendation_refresh(request.user.id)
                 return redirect('dashboard')
                 
             except ActivityCategory.DoesNotExist:
@@ -194,9 +206,9 @@ def add_activity(request):
     return render(request, 'carbon_app/add_activity.html', context)
 
 def update_user_recommendations(user):
-    """Генерирует рекомендации на основе активности за последние 30 дней"""
-    from .models import UserActivity, UserRecommendation, Recommendation
-    from datetime import datetime, timedelta
+    """Добавляет рекомендации по долям выбросов категорий за последние 30 дней"""
+    from .models import UserRecommendation
+    from .scoring import assign_recommendations
 
     # Проверяем, сколько уже рекомендаций
     existing_count = UserRecommendation.objects.filter(user=user).count()
@@ -211,111 +223,218 @@ def update_user_recommendations(user):
     if last_update and (timezone.now() - last_update.created_at).days < 7:
         return
 
-    # Анализируем активность за 30 дней
-    month_ago = timezone.now() - timedelta(days=30)
-    activities = UserActivity.objects.filter(user=user, date__gte=month_ago.date())
-    
-    if not activities.exists():
-        return
-
-    # Считаем CO₂ по категориям
-    from collections import defaultdict
-    co2_by_cat = defaultdict(float)
-    for act in activities:
-        cat_name = act.category.name.lower()
-        co2_by_cat[cat_name] += act.calculated_co2
+    # Берём 1–2 рекомендации с наибольшей оценкой (см. scoring.py)
+    assign_recommendations([user.id], limit=2)
 
-    if not co2_by_cat:
-        return
 
-    # Находим категорию с макс. выбросами
-    top_cat = max(co2_by_cat, key=co2_by_cat.get)
-
-    # Маппинг ActivityCategory.name → Recommendation.category
-    category_map = {
-        'transport': 'transport',
-        'транспорт': 'transport',
-        'food': 'food',
-        'питание': 'food',
-        'energy': 'energy',
-        'энергия': 'energy',
-        'lifestyle': 'shopping',
-        'образ жизни': 'shopping',
-        'покупки': 'shopping',
+def filter_user_activities(request):
+    """Активности пользователя с фильтрами category, date_from, date_to из GET"""
+    filters = {
+        'category': request.GET.get('category', ''),
+        'date_from': request.GET.get('date_from', ''),
+        'date_to': request.GET.get('date_to', ''),
     }
+    activities = filter_activities(UserActivity.objects.filter(user=request.user), filters)
+    return activities, filters
 
-    target_cat = category_map.get(top_cat, 'general')
-
-    # Берём 1–2 рекомендации из этой категории
-    new_recs = Recommendation.objects.filter(
-        category=target_cat,
-        is_active=True
-    ).exclude(
-        id__in=UserRecommendation.objects.filter(user=user).values_list('recommendation_id', flat=True)
-    ).order_by('-co2_saving')[:2]
 
-    for rec in new_recs:
-        UserRecommendation.objects.create(user=user, recommendation=rec, is_viewed=False)
+def paginate_user_activities(request):
+    """Страница активностей по курсору (date, id) только с нужными колонками"""
+    activities, filters = filter_user_activities(request)
+    activities = activities.select_related('category').only(
+        'id', 'date', 'activity_type', 'quantity', 'unit', 'calculated_co2', 'category__name'
+    )
+    try:
+        page_size = int(request.GET.get('page_size', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        page_size = DEFAULT_PAGE_SIZE
+    page = KeysetPage(activities, cursor=request.GET.get('cursor'), page_size=page_size)
+    return page, filters
 
 
-def add_new_recommendation(user):
-    """Добавляет новую рекомендацию пользователю"""
-    from .models import UserRecommendation, Recommendation
-    import random
+@login_required
+def activities_list(request):
+    """Список активностей пользователя с постраничной навигацией"""
+    try:
+        page, filters = paginate_user_activities(request)
+    except (ValueError, InvalidCursor):
+        messages.error(request, 'Некорректные параметры фильтра')
+        return redirect('activities_list')
     
-    # Получаем рекомендации, которые у пользователя еще нет
-    user_recs = UserRecommendation.objects.filter(user=user).values_list('recommendation_id', flat=True)
-    available_recs = Recommendation.objects.exclude(id__in=user_recs)
+    next_query = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        next_query = params.urlencode()
     
-    if available_recs.exists():
-        # Выбираем случайную рекомендацию
-        new_rec = random.choice(list(available_recs))
-        
-        # Создаем новую связь
-        UserRecommendation.objects.create(
-            user=user,
-            recommendation=new_rec,
-            is_viewed=False
-        )
+    context = {
+        'activities': page,
+        'filters': filters,
+        'categories': ActivityCategory.objects.only('id', 'name'),
+        'next_query': next_query,
+        'is_first_page': not request.GET.get('cursor'),
+        # Выгрузка с теми же фильтрами, но без курсора страницы
+        'export_query': urlencode({key: value for key, value in filters.items() if value}),
+    }
+    return render(request, 'carbon_app/activities_list.html', context)
+
+
+@login_required
+def activities_api(request):
+    """JSON-версия списка активностей с той же пагинацией и фильтрами"""
+    try:
+        page, filters = paginate_user_activities(request)
+    except (ValueError, InvalidCursor):
+        return JsonResponse({'error': 'Некорректные параметры фильтра'}, status=400)
+    
+    results = [
+        {
+            'id': activity.id,
+            'date': activity.date.isoformat(),
+            'category': activity.category.name,
+            'activity_type': activity.activity_type,
+            'quantity': activity.quantity,
+            'unit': activity.unit,
+            'calculated_co2': activity.calculated_co2,
+        }
+        for activity in page
+    ]
+    return JsonResponse({'results': results, 'next_cursor': page.next_cursor})
+
+
+@login_required
+def export_activities(request, fmt):
+    """Потоковая выгрузка активностей в CSV или NDJSON (?gzip=1 — сжатая).
+
+    Фильтры те же, что у списка. Строки читаются из курсора порциями и
+    сразу отправляются клиенту, поэтому память не зависит от объема истории.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise Http404
+    try:
+        activities, filters = filter_user_activities(request)
+    except ValueError:
+        return JsonResponse({'error': 'Некорректные параметры фильтра'}, status=400)
+
+    compress = request.GET.get('gzip') in ('1', 'true', 'yes')
+    chunks = iter_encoded(iter_export(export_rows(activities), fmt), compress=compress)
+    content_type = 'application/gzip' if compress else EXPORT_FORMATS[fmt][0]
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(fmt, filters, compress)}"'
+    return response
+
+@login_required
+def reports_page(request):
+    """Фоновые выгрузки и годовые отчеты: заказ и список заданий"""
+    from .models import ReportJob
+    from .reports import EXPORT_KINDS, create_job
+
+    if request.method == 'POST':
+        kind = request.POST.get('kind')
+        try:
+            if kind == 'yearly_html':
+                params = {'year': int(request.POST.get('year', ''))}
+            elif kind in EXPORT_KINDS:
+                filters = {key: request.POST.get(key, '') for key in ('category', 'date_from', 'date_to')}
+                # Проверяем фильтры сейчас, а не в обработчике
+                filter_activities(UserActivity.objects.none(), filters)
+                params = {
+                    'filters': {key: value for key, value in filters.items() if value},
+                    'gzip': request.POST.get('gzip') == '1',
+                }
+            else:
+                raise ValueError(kind)
+        except ValueError:
+            messages.error(request, 'Некорректные параметры отчета')
+            return redirect('reports')
         
-        return True
+        job, created = create_job(request.user, kind, params)
+        if created:
+            messages.success(request, f'✅ {job.get_kind_display()}: задание поставлено в очередь')
+        else:
+            messages.info(request, 'Такой отчет уже готовится')
+        return redirect('reports')
     
-    return False
+    current_year = timezone.localdate().year
+    context = {
+        'jobs': ReportJob.objects.filter(user=request.user)[:20],
+        'kinds': ReportJob.KIND_CHOICES,
+        'categories': ActivityCategory.objects.only('id', 'name'),
+        'years': range(current_year, current_year - 5, -1),
+    }
+    return render(request, 'carbon_app/reports.html', context)
+
 
 @login_required
-def activities_list(request):
-    """Список всех активностей пользователя"""
-    activities = UserActivity.objects.filter(user=request.user).order_by('-date')
-    return render(request, 'carbon_app/activities_list.html', {'activities': activities})
+def report_status(request, job_id):
+    """Прогресс задания для опроса со страницы отчетов"""
+    from .models import ReportJob
+    from .reports import job_status
+
+    job = get_object_or_404(ReportJob, id=job_id, user=request.user)
+    return JsonResponse(job_status(job))
+
+
+@login_required
+def download_report(request, job_id):
+    """Готовый файл отчета"""
+    from .models import ReportJob
+    from .reports import report_path
+
+    job = get_object_or_404(ReportJob, id=job_id, user=request.user, status=ReportJob.STATUS_DONE)
+    path = report_path(job.file_name)
+    if not path.is_file():
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
+
+
+@login_required
+def import_activities(request):
+    """Импорт истории активностей из CSV/JSONL файла"""
+    report = None
+    
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if not upload:
+            messages.error(request, 'Выберите файл для импорта')
+        else:
+            fmt = request.POST.get('format') or detect_format(upload.name)
+            importer = ActivityImporter(request.user)
+            report = importer.run_file(upload.file, fmt)
+            
+            if report.created:
+                # Рекомендации обновляем один раз после всего импорта, в фоне
+                schedule_recommendation_refresh(request.user.id)
+                messages.success(
+                    request,
+                    f'✅ Импортировано {report.created} из {report.rows} строк ({report.rows_per_sec} строк/с)'
+                )
+            if report.failed:
+                messages.error(request, f'❌ Строк с ошибками: {report.failed}')
+    
+    return render(request, 'carbon_app/import_activities.html', {'report': report})
 
 def calculator(request):
     """Калькулятор углеродного следа"""
     result = None
     error = None
+    registry = factor_index.registry
+    units_data = registry.as_units_data()
     
     if request.method == 'POST':
         try:
             category = request.POST.get('category')
             activity_type = request.POST.get('activity_type', '').strip()
             quantity = float(request.POST.get('quantity', 0))
+            if not math.isfinite(quantity) or quantity < 0:
+                raise ValueError(quantity)
             
             if not activity_type:
                 error = "Введите тип активности"
-                return render(request, 'carbon_app/calculator.html', {'error': error})
+                return render(request, 'carbon_app/calculator.html', {'error': error, 'units_data': units_data})
             
-            # Определяем единицу измерения по категории
-            if category == 'transport':
-                unit = 'км'
-                co2_per_unit = 0.1  # Среднее значение
-            elif category == 'food':
-                unit = 'кг'
-                co2_per_unit = 5.0  # Среднее значение
-            elif category == 'energy':
-                unit = 'кВт·ч'
-                co2_per_unit = 0.5  # Среднее значение
-            else:
-                unit = 'ед.'
-                co2_per_unit = 0.1
+            # Единица и коэффициент — из общего реестра (units.json + EmissionFactor)
+            unit, co2_per_unit = registry.calculator_factor(category, activity_type)
             
             # Рассчитываем CO2
             calculated_co2 = quantity * co2_per_unit
@@ -354,7 +473,63 @@ def calculator(request):
         except Exception as e:
             error = f"Ошибка расчета: {str(e)}"
     
-    return render(request, 'carbon_app/calculator.html', {'result': result, 'error': error})
+    return render(request, 'carbon_app/calculator.html', {
+        'result': result,
+        'error': error,
+        'units_data': units_data,
+    })
+
+@csrf_exempt
+@require_POST
+def calculator_api(request):
+    """Пакетный калькулятор: JSON-массив строк → CO₂ по строкам и итог.
+
+    Ничего не сохраняет, поэтому доступен гостям и не требует CSRF-токена.
+    """
+    try:
+        payload = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'error': 'Некорректный JSON'}, status=400)
+    
+    items = payload.get('items') if isinstance(payload, dict) else payload
+    try:
+        result = calculate_batch(factor_index.registry, items)
+    except BatchError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse(result)
+
+def activity_type_suggestions(request):
+    """Подсказки типов активности для автодополнения (без запросов к БД)"""
+    registry = factor_index.registry
+    category = request.GET.get('category', '').strip()
+    if category.isdigit():
+        category = registry.category_slugs.get(int(category))
+    try:
+        limit = min(max(int(request.GET.get('limit', DEFAULT_SUGGESTIONS)), 1), MAX_SUGGESTIONS)
+    except ValueError:
+        limit = DEFAULT_SUGGESTIONS
+    suggestions = registry.suggestions.search(request.GET.get('q', ''), category=category or None, limit=limit)
+    return JsonResponse({'results': [suggestion.as_dict() for suggestion in suggestions]})
+
+def metrics_token_valid(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        return False
+    scheme, _, value = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    return scheme.lower() == 'bearer' and constant_time_compare(value.strip(), token)
+
+def metrics(request):
+    """Метрики представлений в текстовом формате Prometheus"""
+    if not (request.user.is_staff or metrics_token_valid(request)
+            or request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', [])):
+        return HttpResponseForbidden()
+    body = (
+        metrics_registry.render()
+        + render_factor_stats(factor_index.stats())
+        + render_queue_stats(recommendation_queue.name, recommendation_queue.stats())
+    )
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @login_required
 def delete_activity(request, activity_id):
@@ -364,21 +539,26 @@ def delete_activity(request, activity_id):
     messages.success(request, 'Активность удалена')
     return redirect('activities_list')
 
-@login_required
-def recommendations_page(request):
+@async_login_required
+async def recommendations_page(request):
     from .models import UserRecommendation
     
-    user_recs = UserRecommendation.objects.filter(user=request.user).select_related('recommendation')
+    user = await aget_user(request)
+    user_recs = UserRecommendation.objects.filter(user=user)
     
-    stats = {
-        'applied': user_recs.filter(is_applied=True).count(),
-        'total': user_recs.count(),
-        'new': user_recs.filter(is_viewed=False).count(),
-    }
+    # Счетчики одним агрегатом, параллельно с выборкой списка
+    stats, rows = await asyncio.gather(
+        user_recs.aaggregate(
+            applied=Count('id', filter=Q(is_applied=True)),
+            total=Count('id'),
+            new=Count('id', filter=Q(is_viewed=False)),
+        ),
+        alist(user_recs.select_related('recommendation')),
+    )
     
     # Группировка по категории из модели Recommendation (строка: 'transport', 'food' и т.д.)
     recs_by_category = {}
-    for ur in user_recs:
+    for ur in rows:
         cat = ur.recommendation.category  # Это строка!
         if cat not in recs_by_category:
             recs_by_category[cat] = []
@@ -415,30 +595,28 @@ def assign_initial_recommendations(user):
             defaults={'is_viewed': False}
         )
 
-@login_required
-def mark_recommendation_viewed(request, rec_id):
+@async_login_required
+async def mark_recommendation_viewed(request, rec_id):
     """Отметить как просмотренное"""
-    try:
-        from .models import UserRecommendation
-        user_rec = UserRecommendation.objects.get(id=rec_id, user=request.user)
-        user_rec.is_viewed = True
-        user_rec.save()
-        return JsonResponse({'success': True})
-    except:
-        return JsonResponse({'success': False})
+    from .models import UserRecommendation
+    user = await aget_user(request)
+    updated = await UserRecommendation.objects.filter(id=rec_id, user=user).aupdate(is_viewed=True)
+    if not updated:
+        # Чужая или удаленная рекомендация
+        return JsonResponse({'success': False}, status=404)
+    return JsonResponse({'success': True})
 
 
-@login_required
-def mark_recommendation_applied(request, rec_id):
+@async_login_required
+async def mark_recommendation_applied(request, rec_id):
     """Отметить как примененное"""
-    try:
-        from .models import UserRecommendation
-        user_rec = UserRecommendation.objects.get(id=rec_id, user=request.user)
-        user_rec.is_applied = True
-        user_rec.save()
-        return JsonResponse({'success': True})
-    except:
-        return JsonResponse({'success': False})
+    from .models import UserRecommendation
+    user = await aget_user(request)
+    updated = await UserRecommendation.objects.filter(id=rec_id, user=user).aupdate(is_applied=True)
+    if not updated:
+        # Чужая или удаленная рекомендация
+        return JsonResponse({'success': False}, status=404)
+    return JsonResponse({'success': True})
 
 
 @login_required
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'carbon_app.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,6 +84,46 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Версии дашборда, каталога рекомендаций и регион пользователя сбрасываются
+# из веб-воркеров и из команд (recalculate_co2, update_recommendations,
+# run_workers...), поэтому кэш должен быть общим для всех процессов:
+# FileBasedCache на одном сервере, Redis/Memcached — на нескольких.
+# LocMemCache подходит только для разработки в одном процессе; с ним сроки
+# записей сокращаются до минуты (см. cache_timeout в carbon_app/cache.py).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+
+# Метрики представлений (/metrics) доступны персоналу и сборщику с токеном
+# в заголовке Authorization: Bearer <токен>; пустой токен отключает проверку.
+# METRICS_ALLOWED_IPS сверяется с REMOTE_ADDR — за прокси это адрес прокси,
+# поэтому список можно заполнять, только если сервер принимает запросы напрямую.
+METRICS_TOKEN = ''
+METRICS_ALLOWED_IPS = []
+
+# Админка: больше стольких строк списка не считаются точно (см. EstimatedCountPaginator)
+ADMIN_COUNT_LIMIT = 10000
+
+# Обновление рекомендаций после добавления активности выполняется в фоне
+# через столько секунд; добавления за это время объединяются в одно.
+# Запрос сохраняется и в БД: если веб-процесс остановился раньше (или это
+# uWSGI без enable-threads), обновление выполнит run_workers
+RECOMMENDATION_REFRESH_DELAY = 5.0
+
+# Файлы фоновых отчетов и выгрузок (команда run_workers)
+REPORTS_ROOT = BASE_DIR / 'reports'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 